@@ -0,0 +1,12 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class ChunkingConfig:
+    # Maximum tokens per chunk, including the document title prefix
+    chunk_tokens = int(os.getenv("CHUNK_TOKENS", 256))
+    # Tokens of trailing context repeated at the start of the next chunk
+    chunk_overlap_tokens = int(os.getenv("CHUNK_OVERLAP_TOKENS", 32))
+    # Model whose tokenizer is used for counting (falls back to an estimate if unavailable)
+    tokenizer_model = os.getenv("CHUNK_TOKENIZER_MODEL", os.getenv("VERTEX_CHAT_MODEL", "gemini-1.5-flash"))
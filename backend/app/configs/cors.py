@@ -0,0 +1,19 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class CorsConfig:
+    # Browser origins allowed to call the API (CORS) and to open chat WebSockets; "*" allows any
+    allowed_origins = [
+        origin.strip().rstrip("/")
+        for origin in os.getenv(
+            "CORS_ALLOWED_ORIGINS",
+            "http://localhost:3000,http://127.0.0.1:3000,http://localhost:5173,http://127.0.0.1:5173"
+        ).split(",")
+        if origin.strip()
+    ]
+
+    @classmethod
+    def is_allowed(cls, origin: str) -> bool:
+        return "*" in cls.allowed_origins or origin.rstrip("/") in cls.allowed_origins
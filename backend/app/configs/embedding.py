@@ -0,0 +1,16 @@
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+class EmbeddingConfig:
+    # Truncate embeddings to this many dimensions (0 = keep the model's full output).
+    # text-embedding-004 is trained so that leading dimensions carry most of the
+    # signal, which is what the API's output_dimensionality setting relies on.
+    output_dimensionality = int(os.getenv("EMBED_OUTPUT_DIMENSIONALITY", 0))
+
+    # First-pass scan representation used by vector search: "none", "binary" or "halfvec"
+    quantization = os.getenv("EMBED_QUANTIZATION", "none").strip().lower()
+
+    # Number of first-pass candidates rescored at full precision = match_count * multiplier
+    rescore_multiplier = int(os.getenv("EMBED_RESCORE_MULTIPLIER", 4))
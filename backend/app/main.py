@@ -1,33 +1,176 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+import os
+import asyncio
+from typing import Optional
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, Response, Header, WebSocket
+from fastapi.requests import HTTPConnection
+from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
-from app.models.request import ChatRequest, EmbeddingRequest, PromptActivationRequest
-from app.models.response import ChatResponse, EmbeddingResponse, PromptActivationResponse
+from app.configs.cors import CorsConfig
+from app.models.request import ChatRequest, PrefetchRequest, BatchChatRequest, EmbeddingRequest, PromptActivationRequest
+from app.models.response import ChatResponse, BatchChatResponse, BatchChatResult, EmbeddingResponse, PromptActivationResponse, DocumentIndexResponse, ChunkGCResponse
 from app.services.chat_service import chat_service
 from app.services.ingestion_pipeline import ingestion_pipeline
 from app.services.prompt_update_service import prompt_update_service
+from app.services.admission_service import admission_controller, AdmissionRejected
+from app.services.model_call_service import model_call_service
+from app.services.answer_cache_service import answer_cache_service
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.document_index_service import document_index_service
+from app.services.profiling_service import profiling_service
+from app.services.corpus_cache_service import corpus_cache_service
+from app.services.vector_snapshot import vector_snapshot
+from app.services.prefetch_service import prefetch_service
+from app.services.chat_socket_service import chat_socket_service
+from app.services.usage_service import usage_service
 
 app = FastAPI(title="Turing Labs Chatbot API")
 
+# Required (X-Admin-Token) for endpoints that trigger bulk model work
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
+    allow_origins=CorsConfig.allowed_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
+@app.on_event("startup")
+async def start_background_jobs():
+    if document_index_service.gc_interval > 0:
+        app.state.chunk_gc_task = asyncio.create_task(document_index_service.run_periodic_gc())
+    if vector_snapshot.enabled and not vector_snapshot.is_ready:
+        # First boot: export once (other workers find it present and skip)
+        app.state.snapshot_export_task = asyncio.create_task(
+            asyncio.to_thread(vector_snapshot.export, only_if_missing=True)
+        )
+
+def _client_key(http_request: HTTPConnection) -> Optional[str]:
+    """
+    Identify the caller for rate limiting.
+
+    X-Forwarded-For is only honoured behind TRUSTED_PROXY_COUNT proxies: the
+    hop appended by the outermost trusted proxy is the client, anything left
+    of it is client-supplied. Otherwise the peer address is used.
+    """
+    trusted_proxies = admission_controller.trusted_proxy_count
+    forwarded_for = http_request.headers.get("x-forwarded-for")
+    if trusted_proxies > 0 and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        if len(hops) >= trusted_proxies:
+            return hops[-trusted_proxies]
+    return http_request.client.host if http_request.client else None
+
+
+def _rejection_response(rejection: AdmissionRejected) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=rejection.reason,
+        headers={"Retry-After": str(rejection.retry_after)}
+    )
+
+
+def _require_profiling_access(token: Optional[str]):
+    if not profiling_service.is_authorized(token):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+
+def _require_admin(token: Optional[str]):
+    # Closed unless ADMIN_TOKEN is configured and sent
+    if not ADMIN_TOKEN or token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
 @app.post("/chat", response_model=ChatResponse)
-async def chat_endpoint(request: ChatRequest):
+async def chat_endpoint(
+    request: ChatRequest,
+    http_request: Request,
+    response: Response,
+    x_profile: Optional[str] = Header(None)
+):
     try:
-        result = await chat_service.process_chat(request.conversation_id, request.message)
-        return ChatResponse(message=result["message"])
+        filters = request.filters.model_dump(mode="json", exclude_none=True) if request.filters else None
+        async with admission_controller.admit(request.conversation_id, _client_key(http_request)):
+            async with profiling_service.profile("chat", profiling_service.should_profile(x_profile)) as profile:
+                with model_call_service.deadline(chat_service.request_deadline):
+                    result = await chat_service.process_chat(request.conversation_id, request.message, filters)
+        if profile.get("profile_id"):
+            response.headers["X-Profile-Id"] = profile["profile_id"]
+        return ChatResponse(
+            message=result["message"],
+            sources=result.get("sources", []) if request.include_sources else None
+        )
+    except AdmissionRejected as e:
+        raise _rejection_response(e)
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.websocket("/ws/chat/{conversation_id}")
+async def chat_socket_endpoint(websocket: WebSocket, conversation_id: str):
+    """
+    Chat over a WebSocket: per-connection session state, streamed tokens,
+    cancellation of the previous generation and server notifications.
+    See ChatSocketService for the frame protocol.
+    """
+    await chat_socket_service.serve(websocket, conversation_id, _client_key(websocket))
+
+
+@app.post("/chat/prefetch")
+async def chat_prefetch_endpoint(request: PrefetchRequest, http_request: Request):
+    """
+    Speculatively embed and retrieve for a partial query while the user types.
+
+    /chat reuses the result if the submitted message matches closely enough.
+    Always best effort: failures are reported, never raised.
+    """
+    try:
+        filters = request.filters.model_dump(mode="json", exclude_none=True) if request.filters else None
+        return await prefetch_service.prefetch(
+            request.conversation_id,
+            request.partial_message,
+            filters,
+            client_key=_client_key(http_request)
+        )
+    except Exception as e:
+        print(f"Error in prefetch endpoint: {e}")
+        return {"prefetched": False, "reason": "error"}
+
+
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def batch_chat_endpoint(request: BatchChatRequest, http_request: Request):
+    """
+    Answer many chat messages in one request (e.g. FAQ pre-generation, evaluation sets).
+
+    Args:
+        request: BatchChatRequest with items and optional concurrency
+
+    Returns:
+        BatchChatResponse with one result per item, in order, including per-item errors
+    """
+    try:
+        await admission_controller.check_client_rate(_client_key(http_request))
+        items = [
+            {
+                "conversation_id": item.conversation_id,
+                "message": item.message,
+                "filters": item.filters.model_dump(mode="json", exclude_none=True) if item.filters else None,
+            }
+            for item in request.items
+        ]
+        results = await chat_service.process_chat_batch(items, request.concurrency)
+        return BatchChatResponse(results=[BatchChatResult(**result) for result in results])
+    except AdmissionRejected as e:
+        raise _rejection_response(e)
+    except Exception as e:
+        print(f"Error in batch chat endpoint: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/embeddings", response_model=EmbeddingResponse)
-async def embeddings_endpoint(request: EmbeddingRequest):
+async def embeddings_endpoint(request: EmbeddingRequest, response: Response, x_profile: Optional[str] = Header(None)):
     """
     Generate embeddings for a document and store in vector database.
     
@@ -39,9 +182,19 @@ async def embeddings_endpoint(request: EmbeddingRequest):
     """
     try:
         print(f"Processing embedding request for document: {request.doc_id}")
-        result = ingestion_pipeline(request.doc_id)
+        async with profiling_service.profile("ingestion", profiling_service.should_profile(x_profile)) as profile:
+            result = ingestion_pipeline(request.doc_id)
+        if profile.get("profile_id"):
+            response.headers["X-Profile-Id"] = profile["profile_id"]
         
         if result["success"]:
+            # Knowledge base changed: retire answers built from this document and re-warm them
+            await knowledge_base_service.document_changed(request.doc_id)
+            if knowledge_base_service.full_invalidation_on_ingest:
+                await answer_cache_service.bump_epoch()
+            answer_cache_service.schedule_rebuild()
+            corpus_cache_service.schedule_rebuild()
+            await chat_socket_service.notify("knowledge_base_updated", document_id=request.doc_id)
             return EmbeddingResponse(
                 state=True, 
                 message=f"Embeddings generated successfully. Processed {result['chunks_processed']} chunks."
@@ -58,9 +211,165 @@ async def embeddings_endpoint(request: EmbeddingRequest):
             message=f"Internal error: {str(e)}"
         )
 
+@app.delete("/embeddings/{doc_id}", response_model=DocumentIndexResponse)
+async def delete_embeddings_endpoint(doc_id: str):
+    """
+    Remove every chunk of a document from the vector store.
+
+    Args:
+        doc_id: Document ID (UUID) whose chunks should be deleted
+
+    Returns:
+        DocumentIndexResponse with the number of chunk rows deleted
+    """
+    try:
+        print(f"Processing delete request for document: {doc_id}")
+        deleted = await document_index_service.delete_document(doc_id)
+        if deleted:
+            answer_cache_service.schedule_rebuild()
+            corpus_cache_service.schedule_rebuild()
+            await chat_socket_service.notify("knowledge_base_updated", document_id=doc_id)
+        return DocumentIndexResponse(
+            state=True,
+            message=f"Deleted {deleted} chunks.",
+            chunks_deleted=deleted
+        )
+    except Exception as e:
+        print(f"Error in delete embeddings endpoint: {e}")
+        return DocumentIndexResponse(state=False, message=f"Internal error: {str(e)}")
+
+@app.post("/embeddings/reindex", response_model=DocumentIndexResponse)
+async def reindex_embeddings_endpoint(request: EmbeddingRequest):
+    """
+    Re-ingest a document and replace its previous chunks.
+
+    The new chunks are written before the old ones are deleted, so the
+    document stays searchable throughout; if ingestion fails the old chunks
+    are kept.
+
+    Args:
+        request: EmbeddingRequest with doc_id
+
+    Returns:
+        DocumentIndexResponse with chunks written and old chunks deleted
+    """
+    try:
+        print(f"Processing re-index request for document: {request.doc_id}")
+        result = await document_index_service.reindex_document(request.doc_id)
+        if not result["success"]:
+            return DocumentIndexResponse(state=False, message=f"Re-index failed: {result['error']}")
+
+        answer_cache_service.schedule_rebuild()
+        corpus_cache_service.schedule_rebuild()
+        await chat_socket_service.notify("knowledge_base_updated", document_id=request.doc_id)
+        return DocumentIndexResponse(
+            state=True,
+            message=f"Re-indexed successfully. Processed {result['chunks_processed']} chunks.",
+            chunks_processed=result["chunks_processed"],
+            chunks_deleted=result["chunks_deleted"]
+        )
+    except Exception as e:
+        print(f"Error in re-index endpoint: {e}")
+        return DocumentIndexResponse(state=False, message=f"Internal error: {str(e)}")
+
+@app.post("/embeddings/gc", response_model=ChunkGCResponse)
+async def chunk_gc_endpoint():
+    """Delete chunks whose parent document row no longer exists and report how many were reclaimed."""
+    try:
+        result = await document_index_service.collect_garbage()
+        if result["documents"]:
+            answer_cache_service.schedule_rebuild()
+            corpus_cache_service.schedule_rebuild()
+        return ChunkGCResponse(**result)
+    except Exception as e:
+        print(f"Error in chunk GC endpoint: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return {"status": "healthy", "admission": admission_controller.stats(), "websockets": chat_socket_service.stats()}
+
+@app.post("/cache/prewarm")
+async def prewarm_cache_endpoint(limit: Optional[int] = None, x_admin_token: Optional[str] = Header(None)):
+    """
+    Pre-generate answers for the most frequent queries into the shared answer cache.
+    Each call runs up to PREWARM_TOP_QUERIES generations, so it requires X-Admin-Token.
+
+    Args:
+        limit: Number of top queries to warm (defaults to PREWARM_TOP_QUERIES)
+
+    Returns:
+        Counts of queries considered, generated, already cached and failed
+    """
+    _require_admin(x_admin_token)
+    try:
+        return await answer_cache_service.rebuild(limit)
+    except Exception as e:
+        print(f"Error in prewarm endpoint: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/cag/status")
+async def corpus_cache_status():
+    """Whether chat answers from the pinned knowledge base (cag) or retrieval (rag), and why."""
+    state = await corpus_cache_service.get_state()
+    return {"enabled": corpus_cache_service.enabled, **(state or {"mode": "rag", "reason": "no corpus cache built"})}
+
+@app.get("/index/snapshot")
+async def vector_snapshot_status():
+    """Current vector snapshot: base segment, delta count, dimensions and live rows."""
+    return await asyncio.to_thread(vector_snapshot.status)
+
+@app.post("/index/snapshot")
+async def vector_snapshot_export():
+    """Re-export the vector snapshot from chunk_documents."""
+    try:
+        return await asyncio.to_thread(vector_snapshot.export)
+    except Exception as e:
+        print(f"Error exporting vector snapshot: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/index/snapshot/compact")
+async def vector_snapshot_compact():
+    """Merge delta segments into a new base segment."""
+    try:
+        result = await asyncio.to_thread(vector_snapshot.compact)
+        return result or {"message": "Nothing to compact"}
+    except Exception as e:
+        print(f"Error compacting vector snapshot: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics/model-calls")
+async def model_call_metrics():
+    """Per-call latency percentiles, retry/hedge/timeout counters and circuit breaker state."""
+    return model_call_service.metrics()
+
+@app.get("/metrics/usage")
+async def token_usage_metrics(minutes: int = 60, conversation_id: Optional[str] = None):
+    """
+    Token usage by call, prompt, context cache and (optionally) conversation.
+
+    Each entry reports input, cached and output tokens, the cached share of
+    input tokens, and calls whose response carried no usage. The timeseries
+    covers the last `minutes` with tokens per second per bucket.
+    """
+    if minutes < 1 or minutes > 7 * 24 * 60:
+        raise HTTPException(status_code=400, detail="minutes must be between 1 and 10080")
+    return await usage_service.report(minutes, conversation_id)
+
+@app.get("/admin/profiles")
+async def list_profiles_endpoint(x_profiling_token: Optional[str] = Header(None)):
+    """Stored chat/ingestion profiles (id, name, trigger, wall and CPU time), newest first."""
+    _require_profiling_access(x_profiling_token)
+    return {"profiles": profiling_service.list_profiles()}
+
+@app.get("/admin/profiles/{profile_id}")
+async def get_profile_endpoint(profile_id: str, x_profiling_token: Optional[str] = Header(None)):
+    """Download a profile as speedscope JSON (open at https://www.speedscope.app)."""
+    _require_profiling_access(x_profiling_token)
+    path = profiling_service.get_profile_path(profile_id)
+    if not path:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/json", filename=path.name)
 
 @app.post("/prompt", response_model=PromptActivationResponse)
 async def prompt_activation_endpoint(request: PromptActivationRequest):
@@ -76,6 +385,12 @@ async def prompt_activation_endpoint(request: PromptActivationRequest):
     try:
         print(f"Processing prompt activation request for: {request.prompt_id}")
         result = await prompt_update_service.activate_prompt(request.prompt_id)
+        if result["success"]:
+            # Prompt changed: retire shared answers and re-warm them in the background
+            await answer_cache_service.bump_epoch()
+            answer_cache_service.schedule_rebuild()
+            # Open chat sockets drop their cached prompt context
+            await chat_socket_service.notify("prompt_updated", prompt_id=request.prompt_id)
         
         return PromptActivationResponse(
             success=result["success"],
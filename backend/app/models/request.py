@@ -1,8 +1,32 @@
+from datetime import datetime
+from typing import List, Optional
 from pydantic import BaseModel, Field
 
+class RetrievalFilters(BaseModel):
+    document_ids: Optional[List[str]] = Field(None, description="Restrict retrieval to these document IDs (UUIDs)")
+    source_types: Optional[List[str]] = Field(None, description="Restrict retrieval to these document source types")
+    created_after: Optional[datetime] = Field(None, description="Only retrieve chunks ingested after this time")
+
 class ChatRequest(BaseModel):
     conversation_id: str = Field(..., description="Unique identifier for the conversation")
     message: str = Field(..., description="User's query message")
+    filters: Optional[RetrievalFilters] = Field(None, description="Scope retrieval to a document collection")
+    include_sources: bool = Field(False, description="Return the chunks the answer was generated from")
+
+class ChatSocketMessage(BaseModel):
+    message: str = Field(..., description="User's query message")
+    message_id: Optional[str] = Field(None, max_length=64, description="Client id echoed on every frame about this message")
+    filters: Optional[RetrievalFilters] = Field(None, description="Scope retrieval to a document collection")
+    include_sources: bool = Field(False, description="Return the chunks the answer was generated from")
+
+class PrefetchRequest(BaseModel):
+    conversation_id: str = Field(..., description="Conversation the user is typing in")
+    partial_message: str = Field(..., max_length=2000, description="Debounced partial query")
+    filters: Optional[RetrievalFilters] = Field(None, description="Scope retrieval to a document collection")
+
+class BatchChatRequest(BaseModel):
+    items: List[ChatRequest] = Field(..., min_length=1, max_length=1000, description="Chat messages to answer")
+    concurrency: Optional[int] = Field(None, ge=1, le=64, description="Maximum concurrent generations")
 
 class EmbeddingRequest(BaseModel):
     doc_id: str = Field(..., description="Document ID (UUID) to process for embeddings")
@@ -1,13 +1,40 @@
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel, Field
 
+class SourceReference(BaseModel):
+    chunk_id: Optional[int] = Field(None, description="chunk_documents row id")
+    document_id: Optional[str] = Field(None, description="Document the chunk belongs to")
+    title: Optional[str] = Field(None, description="Document title")
+    chunk_index: Optional[int] = Field(None, description="Position of the chunk within its document")
+    similarity: Optional[float] = Field(None, description="Similarity score from vector search")
+
 class ChatResponse(BaseModel):
     message: str = Field(..., description="AI generated response")
+    sources: Optional[List[SourceReference]] = Field(None, description="Chunks the answer was generated from (if include_sources)")
+
+class BatchChatResult(BaseModel):
+    conversation_id: str = Field(..., description="Conversation the message belongs to")
+    success: bool = Field(..., description="Whether this item was answered")
+    message: Optional[str] = Field(None, description="AI generated response")
+    error: Optional[str] = Field(None, description="Error message if this item failed")
+
+class BatchChatResponse(BaseModel):
+    results: List[BatchChatResult] = Field(..., description="Results in the same order as the request items")
 
 class EmbeddingResponse(BaseModel):
     state: bool = Field(..., description="Success status of embedding generation")
     message: str = Field(..., description="Status message")
 
+class DocumentIndexResponse(BaseModel):
+    state: bool = Field(..., description="Whether the operation succeeded")
+    message: str = Field(..., description="Status message")
+    chunks_processed: Optional[int] = Field(None, description="Chunks written by a re-index")
+    chunks_deleted: int = Field(0, description="Chunk rows removed from chunk_documents")
+
+class ChunkGCResponse(BaseModel):
+    chunks_deleted: int = Field(..., description="Orphaned chunk rows reclaimed")
+    documents: int = Field(..., description="Deleted documents whose chunks were reclaimed")
+
 class PromptActivationResponse(BaseModel):
     success: bool = Field(..., description="Whether activation succeeded")
     message: str = Field(..., description="Status message")
@@ -0,0 +1,192 @@
+import os
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from app.configs.redis import redis_client
+from app.services.redis_service import redis_service
+
+load_dotenv()
+
+
+class AdmissionRejected(Exception):
+    """Raised when a chat request is shed instead of queued."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """
+    Admission control in front of ChatService.process_chat.
+
+    - Token-bucket rate limits in Redis, per client, per conversation and globally
+    - Per-conversation serialization (in-process lock plus a Redis lock across workers)
+      so two messages from one tab never interleave their history updates
+    - A global concurrency semaphore bounding in-flight generations
+    - Fast rejection when the estimated queue wait exceeds CHAT_QUEUE_LATENCY_BUDGET
+    """
+
+    def __init__(self):
+        self.max_concurrency = int(os.getenv("CHAT_MAX_CONCURRENCY", 16))
+        self.latency_budget = float(os.getenv("CHAT_QUEUE_LATENCY_BUDGET", 5.0))
+        self.client_rate_per_minute = int(os.getenv("CHAT_CLIENT_RATE_PER_MINUTE", 30))
+        self.conversation_rate_per_minute = int(os.getenv("CHAT_CONVERSATION_RATE_PER_MINUTE", 12))
+        self.global_rate_per_minute = int(os.getenv("CHAT_GLOBAL_RATE_PER_MINUTE", 0))  # 0 disables
+        self.conversation_lock_timeout = int(os.getenv("CHAT_CONVERSATION_LOCK_TIMEOUT", 120))
+        # Reverse proxies in front of the API; 0 ignores X-Forwarded-For entirely
+        self.trusted_proxy_count = int(os.getenv("TRUSTED_PROXY_COUNT", 0))
+
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._active = 0
+        self._waiting = 0
+        # Exponentially weighted average of how long an admitted request holds a slot
+        self._avg_service_time = float(os.getenv("CHAT_EXPECTED_SERVICE_TIME", 3.0))
+        self._conversation_locks: Dict[str, asyncio.Lock] = {}
+        self._conversation_lock_users: Dict[str, int] = {}
+
+    @asynccontextmanager
+    async def admit(self, conversation_id: str, client_key: Optional[str] = None):
+        """
+        Admit one chat request or raise AdmissionRejected.
+
+        Usage:
+            async with admission_controller.admit(conversation_id, client_ip):
+                await chat_service.process_chat(...)
+        """
+        # Shed on load first so rejected requests don't drain the caller's tokens
+        self._check_queue_budget()
+        await self._check_rate_limits(conversation_id, client_key)
+
+        deadline = time.monotonic() + self.latency_budget
+        async with self._conversation_lock(conversation_id, deadline):
+            async with self.slot(deadline):
+                yield
+
+    @asynccontextmanager
+    async def slot(self, deadline: Optional[float] = None):
+        """
+        Hold one global concurrency slot.
+
+        With a deadline, raises AdmissionRejected if no slot frees up in time;
+        without one (offline batch work), waits as long as needed.
+        """
+        self._waiting += 1
+        try:
+            if deadline is None:
+                await self._semaphore.acquire()
+            else:
+                try:
+                    await asyncio.wait_for(self._semaphore.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    raise AdmissionRejected("Server is busy", self._estimated_wait())
+        finally:
+            self._waiting -= 1
+
+        self._active += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._active -= 1
+            self._semaphore.release()
+            elapsed = time.monotonic() - started
+            self._avg_service_time = 0.8 * self._avg_service_time + 0.2 * elapsed
+
+    async def check_client_rate(self, client_key: Optional[str]):
+        """Apply only the per-client rate limit (used by batch requests)."""
+        if client_key and self.client_rate_per_minute:
+            await self._consume(f"ratelimit:client:{client_key}", self.client_rate_per_minute, "Client rate limit exceeded")
+
+    def stats(self) -> Dict:
+        return {
+            "active": self._active,
+            "waiting": self._waiting,
+            "max_concurrency": self.max_concurrency,
+            "avg_service_time": round(self._avg_service_time, 3),
+            "estimated_wait": round(self._estimated_wait(), 3),
+        }
+
+    async def _check_rate_limits(self, conversation_id: str, client_key: Optional[str]):
+        await self.check_client_rate(client_key)
+        if self.conversation_rate_per_minute:
+            await self._consume(
+                f"ratelimit:conversation:{conversation_id}",
+                self.conversation_rate_per_minute,
+                "Conversation rate limit exceeded"
+            )
+        if self.global_rate_per_minute:
+            await self._consume("ratelimit:global", self.global_rate_per_minute, "Global rate limit exceeded")
+
+    async def _consume(self, key: str, per_minute: int, reason: str):
+        allowed, retry_after = await redis_service.consume_token(key, per_minute, per_minute / 60.0)
+        if not allowed:
+            print(f"Admission rejected ({reason}): {key}")
+            raise AdmissionRejected(reason, retry_after)
+
+    def _estimated_wait(self) -> float:
+        """Expected seconds before a new arrival gets a slot, given current load."""
+        queued_ahead = self._waiting + self._active + 1 - self.max_concurrency
+        if queued_ahead <= 0:
+            return 0.0
+        return queued_ahead / self.max_concurrency * self._avg_service_time
+
+    def _check_queue_budget(self):
+        estimated_wait = self._estimated_wait()
+        if estimated_wait > self.latency_budget:
+            print(f"Admission rejected: estimated wait {estimated_wait:.2f}s exceeds budget {self.latency_budget}s")
+            raise AdmissionRejected("Server is busy", estimated_wait)
+
+    @asynccontextmanager
+    async def _conversation_lock(self, conversation_id: str, deadline: float):
+        """Serialize requests for one conversation within and across workers."""
+        local_lock = self._conversation_locks.setdefault(conversation_id, asyncio.Lock())
+        self._conversation_lock_users[conversation_id] = self._conversation_lock_users.get(conversation_id, 0) + 1
+        try:
+            try:
+                await asyncio.wait_for(local_lock.acquire(), timeout=max(0.0, deadline - time.monotonic()))
+            except asyncio.TimeoutError:
+                raise AdmissionRejected("Previous message in this conversation is still processing", self._avg_service_time)
+
+            try:
+                async with self._redis_conversation_lock(conversation_id, deadline):
+                    yield
+            finally:
+                local_lock.release()
+        finally:
+            self._conversation_lock_users[conversation_id] -= 1
+            if self._conversation_lock_users[conversation_id] == 0:
+                del self._conversation_lock_users[conversation_id]
+                self._conversation_locks.pop(conversation_id, None)
+
+    @asynccontextmanager
+    async def _redis_conversation_lock(self, conversation_id: str, deadline: float):
+        lock = redis_client.lock(
+            f"lock:conversation:{conversation_id}",
+            timeout=self.conversation_lock_timeout,
+            blocking_timeout=max(0.01, deadline - time.monotonic())
+        )
+        try:
+            acquired = await lock.acquire()
+        except Exception as e:
+            # Redis unavailable: the in-process lock still serializes this worker
+            print(f"Redis conversation lock error: {e}")
+            yield
+            return
+
+        if not acquired:
+            raise AdmissionRejected("Previous message in this conversation is still processing", self._avg_service_time)
+        try:
+            yield
+        finally:
+            try:
+                await lock.release()
+            except Exception as e:
+                print(f"Error releasing conversation lock: {e}")
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,194 @@
+import os
+import re
+import asyncio
+import hashlib
+from typing import Dict, List, Optional
+from dotenv import load_dotenv
+from app.configs.redis import redis_client
+from app.services.knowledge_base_service import knowledge_base_service
+
+load_dotenv()
+
+QUERY_LOG_KEY = "querylog:counts"
+ANSWER_EPOCH_KEY = "answers:epoch"
+# Trim the query log every N recorded queries (per worker)
+QUERY_LOG_TRIM_EVERY = 100
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation so repeats share a key."""
+    normalized = " ".join(query.lower().split())
+    return re.sub(r"[\s?!.,;:]+$", "", normalized)
+
+
+def query_hash(text: str) -> str:
+    """Stable hash for cache keys (Python's hash() differs per process)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class AnswerCacheService:
+    """
+    Shared answer cache for context-free questions, pre-warmed from the query log.
+
+    Unscoped first-turn questions are answered the same way for every visitor,
+    so their answers are cached under the normalized query instead of per
+    conversation. Every user query is counted in a Redis sorted set, and
+    rebuild() pre-generates answers for the most frequent ones with the
+    current prompt and knowledge base.
+
+    Keys include an epoch that is bumped whenever the prompt changes, which
+    retires all previous answers at once. Knowledge-base changes only retire
+    the answers built from the changed documents (see KnowledgeBaseService).
+    """
+
+    def __init__(self):
+        self.client = redis_client
+        self.answer_ttl = int(os.getenv("ANSWER_CACHE_TTL", 604800))
+        self.prewarm_top_n = int(os.getenv("PREWARM_TOP_QUERIES", 200))
+        self.prewarm_concurrency = int(os.getenv("PREWARM_CONCURRENCY", 4))
+        self.query_log_max = int(os.getenv("QUERY_LOG_MAX_ENTRIES", 10000))
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._rebuild_pending = False
+        self._recorded_queries = 0
+
+    async def record_query(self, user_query: str):
+        """Count a user query in the query log."""
+        try:
+            await self.client.zincrby(QUERY_LOG_KEY, 1, normalize_query(user_query))
+        except Exception as e:
+            print(f"Error recording query: {e}")
+            return
+        self._recorded_queries += 1
+        if self._recorded_queries % QUERY_LOG_TRIM_EVERY == 0:
+            await self._trim_query_log()
+
+    async def top_queries(self, limit: int) -> List[str]:
+        """Most frequent normalized queries, most frequent first."""
+        try:
+            return await self.client.zrevrange(QUERY_LOG_KEY, 0, limit - 1)
+        except Exception as e:
+            print(f"Error reading query log: {e}")
+            return []
+
+    async def current_epoch(self) -> int:
+        """
+        Current answer epoch. Read it before resolving the prompt and pass it
+        to get_answer/set_answer, so an answer generated with an old prompt is
+        never stored under the epoch of a newer one.
+        """
+        try:
+            return int(await self.client.get(ANSWER_EPOCH_KEY) or 0)
+        except Exception as e:
+            print(f"Error reading answer cache epoch: {e}")
+            return 0
+
+    async def get_answer(self, user_query: str, epoch: Optional[int] = None) -> Optional[Dict]:
+        """Cached answer entry (answer, document_ids, kb_version) if still fresh."""
+        return await knowledge_base_service.get_cached(await self._answer_key(user_query, epoch))
+
+    async def set_answer(
+        self,
+        user_query: str,
+        answer: str,
+        document_ids: List[str],
+        kb_version: int,
+        sources: Optional[List[Dict]] = None,
+        epoch: Optional[int] = None
+    ):
+        await knowledge_base_service.set_cached(
+            await self._answer_key(user_query, epoch), answer, document_ids, kb_version,
+            expire=self.answer_ttl, sources=sources
+        )
+
+    async def bump_epoch(self) -> int:
+        """Retire every shared answer (call after prompt changes)."""
+        try:
+            epoch = await self.client.incr(ANSWER_EPOCH_KEY)
+            print(f"Answer cache epoch bumped to {epoch}")
+            return epoch
+        except Exception as e:
+            print(f"Error bumping answer cache epoch: {e}")
+            return 0
+
+    async def rebuild(self, limit: Optional[int] = None) -> Dict:
+        """
+        Pre-generate answers for the most frequent queries into the shared cache.
+
+        Returns:
+            Dict with counts of queries considered, generated and already cached
+        """
+        # Imported here: chat_service depends on this module for cache lookups
+        from app.services.chat_service import chat_service
+        from app.services.rag_service import rag_service
+        from app.services.admission_service import admission_controller
+
+        # Pinned for the whole run: a prompt change mid-rebuild retires these answers too
+        epoch = await self.current_epoch()
+        queries = await self.top_queries(limit or self.prewarm_top_n)
+        await self._trim_query_log()
+        if not queries:
+            return {"queries": 0, "generated": 0, "already_cached": 0, "failed": 0}
+
+        missing = [query for query in queries if not await self.get_answer(query, epoch)]
+        print(f"Prewarm: {len(queries)} top queries, {len(missing)} missing from cache")
+        stats = {"queries": len(queries), "generated": 0, "already_cached": len(queries) - len(missing), "failed": 0}
+        if not missing:
+            return stats
+
+        kb_version = await knowledge_base_service.get_version()
+        prompt_context = await chat_service._resolve_prompt_and_cache()
+        embeddings = await rag_service.generate_embeddings(missing)
+        limit_generations = asyncio.Semaphore(self.prewarm_concurrency)
+
+        async def warm(query: str, embedding: Optional[List[float]]):
+            if embedding is None:
+                stats["failed"] += 1
+                return
+            async with limit_generations, admission_controller.slot():
+                result = await chat_service.generate_standalone_answer(query, embedding, prompt_context)
+                if result:
+                    await self.set_answer(
+                        query, result["answer"], result["document_ids"], kb_version, result["sources"], epoch=epoch
+                    )
+                    stats["generated"] += 1
+                else:
+                    stats["failed"] += 1
+
+        await asyncio.gather(*(warm(query, embedding) for query, embedding in zip(missing, embeddings)))
+        print(f"Prewarm complete: {stats}")
+        return stats
+
+    def schedule_rebuild(self):
+        """
+        Rebuild in the background. If a rebuild is already running, one more
+        run is queued so changes made during the current run are picked up.
+        """
+        if self._rebuild_task and not self._rebuild_task.done():
+            self._rebuild_pending = True
+            return
+        self._rebuild_task = asyncio.create_task(self._run_rebuilds())
+
+    async def _run_rebuilds(self):
+        while True:
+            self._rebuild_pending = False
+            try:
+                await self.rebuild()
+            except Exception as e:
+                print(f"Error pre-warming answer cache: {e}")
+            if not self._rebuild_pending:
+                break
+
+    async def _answer_key(self, user_query: str, epoch: Optional[int] = None) -> str:
+        if epoch is None:
+            epoch = await self.current_epoch()
+        return f"answer:{epoch}:{query_hash(normalize_query(user_query))}"
+
+    async def _trim_query_log(self):
+        """Keep only the most frequent queries so the log stays bounded."""
+        try:
+            await self.client.zremrangebyrank(QUERY_LOG_KEY, 0, -self.query_log_max - 1)
+        except Exception as e:
+            print(f"Error trimming query log: {e}")
+
+
+answer_cache_service = AnswerCacheService()
@@ -1,49 +1,228 @@
+import os
 import json
+import asyncio
+from typing import Awaitable, Callable, Optional, Dict, Any, List
 from app.services.redis_service import redis_service
 from app.services.vectorstore_service import vectorstore_service
 from app.services.prompt_service import prompt_service
 from app.services.cache_service import cache_service
 from app.services.rag_service import rag_service
+from app.services.chunking_service import pack_chunks
+from app.services.admission_service import admission_controller
+from app.services.model_call_service import model_call_service
+from app.services.model_router import model_router
+from app.services.answer_cache_service import answer_cache_service, normalize_query, query_hash
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.corpus_cache_service import corpus_cache_service
+from app.services.prefetch_service import prefetch_service
+from app.services.chat_session import ChatSession
+from app.services.usage_service import usage_service
 
 class ChatService:
-    async def process_chat(self, conversation_id: str, user_query: str) -> dict:
+    def __init__(self):
+        # Token budget for retrieved chunks in the generation prompt
+        self.context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000))
+        # Overall time budget for model calls made while answering one message
+        self.request_deadline = float(os.getenv("CHAT_REQUEST_DEADLINE", 45))
+        # Default number of concurrent generations for batch requests
+        self.batch_concurrency = int(os.getenv("CHAT_BATCH_CONCURRENCY", 8))
+        # Cached answers are invalidated by KB version, so they can live for days
+        self.response_cache_ttl = int(os.getenv("RESPONSE_CACHE_TTL", 259200))
+
+    async def process_chat(
+        self,
+        conversation_id: str,
+        user_query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        relevant_chunks: Optional[List[Dict[str, Any]]] = None,
+        prompt_context: Optional[Dict[str, Any]] = None,
+        session: Optional[ChatSession] = None,
+        on_token: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> dict:
+        """
+        Answer a single chat message.
+
+        relevant_chunks and prompt_context may be supplied by callers that have
+        already retrieved them (e.g. batch processing); otherwise they are
+        resolved here. A WebSocket connection passes its ChatSession, so history
+        and prompt context come from memory (written through to Redis), and
+        on_token to receive generated text as it streams.
+        """
+        # Token usage of every model call below is attributed to this conversation
+        usage_service.attribute(conversation_id=conversation_id, prompt_id=None)
+
         # 1. Store user message in conversation history
-        await redis_service.store_conversation_message(conversation_id, "user", user_query)
+        if session:
+            await session.sync()
+        await self._store_message(conversation_id, "user", user_query, session)
         print(f"Stored user message for conversation {conversation_id}")
         
         # 2. Get conversation context (either summary or full history)
-        conversation_context = await self._get_conversation_context(conversation_id)
+        conversation_context = await self._get_conversation_context(conversation_id, session)
         
         # 3. Check message count and summarize if needed (after 5 user messages)
-        user_message_count = await redis_service.get_message_count(conversation_id)
+        if session:
+            user_message_count = session.user_message_count()
+        else:
+            user_message_count = await redis_service.get_message_count(conversation_id)
         print(f"User message count: {user_message_count}")
         
         if user_message_count >= 5:
             print("Message count >= 5, triggering summarization...")
             await self._summarize_conversation(conversation_id)
+            if session:
+                await session.load()
             # After summarization, update conversation context
-            conversation_context = await self._get_conversation_context(conversation_id)
+            conversation_context = await self._get_conversation_context(conversation_id, session)
+
+        # 4. Check Redis caches for this query
+        # Read the KB version before retrieval so a document change that lands
+        # while this answer is generated still invalidates it
+        kb_version = await knowledge_base_service.get_version()
 
-        # 4. Check Redis Cache for exact query (optional response caching)
-        cache_key = f"chat:{conversation_id}:{hash(user_query)}"
-        cached_response = await redis_service.get_cache(cache_key)
-        if cached_response:
+        # A first-turn, unscoped question gets the same answer for every visitor,
+        # so it can be served from (and stored in) the shared pre-warmed answer cache
+        is_standalone = not conversation_context and not filters
+        if not filters:
+            await answer_cache_service.record_query(user_query)
+        answer_epoch = await answer_cache_service.current_epoch() if is_standalone else None
+        if is_standalone:
+            shared_entry = await answer_cache_service.get_answer(user_query, answer_epoch)
+            if shared_entry:
+                shared_response = shared_entry["answer"]
+                print("Shared Answer Cache Hit")
+                await self._store_message(conversation_id, "assistant", shared_response, session)
+                return {"message": shared_response, "source": "answer_cache", "sources": shared_entry.get("sources", [])}
+
+        # Scoped chats must not share cached answers with unscoped ones
+        filters_key = json.dumps(filters, sort_keys=True, default=str) if filters else ""
+        cache_key = f"chat:{conversation_id}:{query_hash(normalize_query(user_query) + filters_key)}"
+        cached_entry = await knowledge_base_service.get_cached(cache_key)
+        if cached_entry:
+             cached_response = cached_entry["answer"]
              print("Redis Cache Hit")
              # Still store the cached response in conversation
-             await redis_service.store_conversation_message(conversation_id, "assistant", cached_response)
-             return {"message": cached_response, "source": "redis_cache"}
+             await self._store_message(conversation_id, "assistant", cached_response, session)
+             return {"message": cached_response, "source": "redis_cache", "sources": cached_entry.get("sources", [])}
 
         print("Redis Cache Miss - Proceeding to Semantic Search")
 
-        # 5. Embedding & Vector Search
-        embedding = await rag_service.generate_embedding(user_query)
-        relevant_chunks = await vectorstore_service.get_relevant_chunks(embedding)
-        
-        print(f"Vector Search: Retrieved {len(relevant_chunks)} chunks")
+        # 5. Route to a model tier, then Embedding & Vector Search if the route needs it
+        route = model_router.route(user_query, has_history=bool(conversation_context))
+        ai_response = None
+        document_ids: List[str] = []
+        packed_chunks: List[Dict[str, Any]] = []
+        sources: List[Dict[str, Any]] = []
+
+        # Cache-augmented generation: when the whole knowledge base is pinned in the
+        # context cache, answer from it and skip embedding and vector search
+        if relevant_chunks is None and route["use_retrieval"] and route["tier"] == "standard" and not filters:
+            if prompt_context is None:
+                prompt_context = await self._prompt_context_for(session)
+            usage_service.attribute(prompt_id=prompt_context["prompt_id"])
+            corpus_cache = await corpus_cache_service.get_active_cache(prompt_context["prompt_id"])
+            if corpus_cache:
+                try:
+                    ai_response = await rag_service.generate_with_corpus_cache(
+                        user_query, conversation_context, corpus_cache["cache_name"]
+                    )
+                    document_ids = corpus_cache["document_ids"]
+                    print("Answered from corpus context cache (CAG), retrieval skipped")
+                except Exception as e:
+                    print(f"Corpus cache generation failed, falling back to retrieval: {e}")
+
+        if ai_response is None and relevant_chunks is None:
+            if route["use_retrieval"]:
+                # Reuse retrieval done speculatively while the user was typing
+                prefetched = await prefetch_service.take(conversation_id, user_query, filters)
+                if prefetched:
+                    relevant_chunks = prefetched["chunks"]
+                    prompt_context = prompt_context or prefetched["prompt_context"]
+                else:
+                    embedding = await rag_service.generate_embedding(user_query)
+                    if embedding is None:
+                        # An answer without retrieval would be ungrounded: handle it like a failed generation
+                        ai_response = rag_service.ERROR_RESPONSE
+                    else:
+                        relevant_chunks = await vectorstore_service.get_relevant_chunks(embedding, filters=filters)
+            else:
+                relevant_chunks = []
+
+        if ai_response is None:
+            print(f"Vector Search: Retrieved {len(relevant_chunks)} chunks")
         
-        chunk_texts = [chunk.get('content', '') for chunk in relevant_chunks]
+            packed_chunks = self._pack_chunks(relevant_chunks)
+            chunk_texts = [chunk.get('content', '') for chunk in packed_chunks]
+            sources = self._sources(packed_chunks)
+
+            # 6-7. Resolve prompt template and Vertex AI context cache
+            if prompt_context is None:
+                prompt_context = await self._prompt_context_for(session)
+            usage_service.attribute(prompt_id=prompt_context["prompt_id"])
+            system_instruction = prompt_context["system_instruction"]
+            cache_name = prompt_context["cache_name"]
 
-        # 6. Fetch Latest Prompt Template (by version DESC)
+            # 8. Prepare context with conversation history
+            # Combine conversation context with retrieved chunks
+            context_with_conversation = self._build_context_with_conversation(
+                conversation_context, 
+                chunk_texts
+            )
+
+            # 9. Generate Response (RAG with conversation context)
+            if on_token:
+                ai_response = await rag_service.stream_response(
+                    user_query=user_query,
+                    context_chunks=context_with_conversation,
+                    system_instruction=system_instruction,
+                    on_token=on_token,
+                    cached_content_name=cache_name,
+                    tier=route["tier"]
+                )
+            else:
+                ai_response = await rag_service.generate_response(
+                    user_query=user_query,
+                    context_chunks=context_with_conversation,
+                    system_instruction=system_instruction,
+                    cached_content_name=cache_name,
+                    tier=route["tier"]
+                )
+            document_ids = knowledge_base_service.document_ids_from_chunks(packed_chunks)
+
+        source = "generated"
+        if ai_response == rag_service.ERROR_RESPONSE:
+            # Every model path failed; serve the last good answer for this query if we have one
+            stale_response = await redis_service.get_cache(f"{cache_key}:stale")
+            if stale_response:
+                print("Serving stale cached response after generation failure")
+                ai_response = stale_response
+                source = "stale_cache"
+
+        # 10. Store AI response in conversation history
+        await self._store_message(conversation_id, "assistant", ai_response, session)
+
+        # 11. Store in Redis response cache (never cache failures)
+        if source == "generated" and ai_response != rag_service.ERROR_RESPONSE:
+            await knowledge_base_service.set_cached(
+                cache_key, ai_response, document_ids, kb_version, expire=self.response_cache_ttl, sources=sources
+            )
+            await redis_service.set_cache(f"{cache_key}:stale", ai_response, expire=redis_service.stale_expiration)
+            if is_standalone:
+                await answer_cache_service.set_answer(
+                    user_query, ai_response, document_ids, kb_version, sources, epoch=answer_epoch
+                )
+
+        return {"message": ai_response, "source": source, "sources": sources if source == "generated" else []}
+
+    async def _resolve_prompt_and_cache(self) -> Dict[str, Any]:
+        """
+        Fetch the latest prompt template and a valid Vertex AI context cache for it,
+        creating the cache if it is missing or expired.
+
+        Returns:
+            Dict with system_instruction, prompt_id and cache_name
+        """
+        # Fetch Latest Prompt Template (by version DESC)
         prompt_data = await prompt_service.get_latest_prompt()
         if not prompt_data:
             system_instruction = "You are a helpful AI assistant."
@@ -55,7 +234,7 @@ class ChatService:
             print(f"Using prompt template: name='{prompt_data.get('name')}', version={prompt_data.get('version')}, id={prompt_id}")
             print(f"System instruction preview: {system_instruction[:100]}...")
 
-        # 7. Check & Validate Vertex AI Context Cache (with Vertex AI validation)
+        # Check & Validate Vertex AI Context Cache (with Vertex AI validation)
         cache_name = None
         if prompt_id:
             cache_name = await cache_service.validate_and_get_cache(prompt_id, rag_service)
@@ -72,42 +251,155 @@ class ChatService:
         elif cache_name:
             print(f"GCP Cache Valid: {cache_name}")
 
-        # 8. Prepare context with conversation history
-        # Combine conversation context with retrieved chunks
-        context_with_conversation = self._build_context_with_conversation(
-            conversation_context, 
-            chunk_texts
-        )
+        return {
+            "system_instruction": system_instruction,
+            "prompt_id": prompt_id,
+            "cache_name": cache_name,
+        }
+
+    async def _prompt_context_for(self, session: Optional[ChatSession]) -> Dict[str, Any]:
+        """Prompt context held by the session if still fresh, else resolved (and kept by the session)."""
+        prompt_context = session.get_prompt_context() if session else None
+        if prompt_context is None:
+            prompt_context = await self._resolve_prompt_and_cache()
+            if session:
+                session.set_prompt_context(prompt_context)
+        return prompt_context
 
-        # 9. Generate Response (RAG with conversation context)
-        ai_response = await rag_service.generate_response(
+    async def _store_message(self, conversation_id: str, role: str, content: str, session: Optional[ChatSession]):
+        if session:
+            await session.add_message(role, content)
+        else:
+            await redis_service.store_conversation_message(conversation_id, role, content)
+
+    async def generate_standalone_answer(
+        self,
+        user_query: str,
+        embedding: List[float],
+        prompt_context: Dict[str, Any]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Answer a question with no conversation history or filters (used to pre-warm
+        the shared answer cache).
+
+        Returns:
+            Dict with answer and the document_ids and sources it used, or None if
+            the answer should not be cached
+        """
+        route = model_router.route(user_query, has_history=False)
+        relevant_chunks = []
+        if route["use_retrieval"]:
+            if not embedding:
+                return None
+            relevant_chunks = await vectorstore_service.get_relevant_chunks(embedding)
+
+        packed_chunks = self._pack_chunks(relevant_chunks)
+        answer = await rag_service.generate_response(
             user_query=user_query,
-            context_chunks=context_with_conversation,
-            system_instruction=system_instruction,
-            cached_content_name=cache_name
+            context_chunks=[chunk.get('content', '') for chunk in packed_chunks],
+            system_instruction=prompt_context["system_instruction"],
+            cached_content_name=prompt_context["cache_name"],
+            tier=route["tier"]
         )
+        if answer == rag_service.ERROR_RESPONSE:
+            return None
+        return {
+            "answer": answer,
+            "document_ids": knowledge_base_service.document_ids_from_chunks(packed_chunks),
+            "sources": self._sources(packed_chunks),
+        }
 
-        # 10. Store AI response in conversation history
-        await redis_service.store_conversation_message(conversation_id, "assistant", ai_response)
+    async def process_chat_batch(
+        self,
+        items: List[Dict[str, Any]],
+        concurrency: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Answer many chat messages in one call.
 
-        # 11. Store in Redis response cache
-        await redis_service.set_cache(cache_key, ai_response)
+        The prompt and context cache are resolved once, all queries are embedded
+        in a single batched call, vector searches run concurrently, and
+        generation is fanned out under a concurrency limit. Messages that share
+        a conversation_id are processed in order so their history stays
+        consistent.
 
-        return {"message": ai_response, "source": "generated"}
+        Args:
+            items: Dicts with conversation_id, message and optional filters
+            concurrency: Maximum concurrent generations (defaults to CHAT_BATCH_CONCURRENCY)
 
-    async def _get_conversation_context(self, conversation_id: str) -> str:
+        Returns:
+            One result per item, in input order, with success and message or error
+        """
+        if not items:
+            return []
+
+        prompt_context = await self._resolve_prompt_and_cache()
+
+        print(f"Batch chat: embedding {len(items)} queries")
+        embeddings = await rag_service.generate_embeddings([item["message"] for item in items])
+
+        limit = asyncio.Semaphore(concurrency or self.batch_concurrency)
+
+        async def retrieve(item, embedding):
+            if embedding is None:
+                raise RuntimeError("Failed to embed message")
+            async with limit:
+                return await vectorstore_service.get_relevant_chunks(embedding, filters=item.get("filters"))
+
+        retrieved = await asyncio.gather(
+            *(retrieve(item, embedding) for item, embedding in zip(items, embeddings)),
+            return_exceptions=True
+        )
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+
+        async def run_conversation(indices: List[int]):
+            for index in indices:
+                item = items[index]
+                # Batch generations also count against the global concurrency limit
+                async with limit, admission_controller.slot():
+                    try:
+                        chunks = retrieved[index]
+                        if isinstance(chunks, Exception):
+                            raise chunks
+                        with model_call_service.deadline(self.request_deadline):
+                            result = await self.process_chat(
+                                item["conversation_id"],
+                                item["message"],
+                                filters=item.get("filters"),
+                                relevant_chunks=chunks,
+                                prompt_context=prompt_context
+                            )
+                        results[index] = {"success": True, "message": result["message"], "error": None}
+                    except Exception as e:
+                        print(f"Batch chat item {index} failed: {e}")
+                        results[index] = {"success": False, "message": None, "error": str(e)}
+
+        conversations: Dict[str, List[int]] = {}
+        for index, item in enumerate(items):
+            conversations.setdefault(item["conversation_id"], []).append(index)
+
+        await asyncio.gather(*(run_conversation(indices) for indices in conversations.values()))
+
+        return [
+            {"conversation_id": item["conversation_id"], **result}
+            for item, result in zip(items, results)
+        ]
+
+    async def _get_conversation_context(self, conversation_id: str, session: Optional[ChatSession] = None) -> str:
         """
         Get conversation context - either summary or full message history.
         """
         # First check if there's a summary
-        summary = await redis_service.get_conversation_summary(conversation_id)
+        summary = session.summary if session else await redis_service.get_conversation_summary(conversation_id)
         if summary:
             print(f"Using conversation summary for context")
             return f"Previous conversation summary: {summary}"
         
         # Otherwise get full message history
-        messages = await redis_service.get_conversation_history(conversation_id)
-        if not messages:
+        messages = session.messages if session else await redis_service.get_conversation_history(conversation_id)
+        if len(messages) <= 1:
+            # Only the current user message: no prior conversation
             return ""
         
         # Format messages as conversation context
@@ -143,8 +435,11 @@ class ChatService:
 Provide a brief summary (2-3 sentences) that captures the key points and current state of the conversation."""
         
         try:
-            summary = await rag_service.llm_client.ainvoke([("human", summarization_prompt)])
-            summary_text = summary.content
+            summary_text = await rag_service.complete(
+                summarization_prompt,
+                tier=model_router.route_task("summarize"),
+                call_name="summarize"
+            )
             
             # Store summary and clear messages
             await redis_service.store_conversation_summary(conversation_id, summary_text)
@@ -152,6 +447,27 @@ Provide a brief summary (2-3 sentences) that captures the key points and current
         except Exception as e:
             print(f"Error summarizing conversation: {e}")
 
+    def _pack_chunks(self, relevant_chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep the highest-ranked chunks that fit within the context token budget."""
+        packed, used_tokens = pack_chunks(relevant_chunks, self.context_token_budget)
+        print(f"Packed {len(packed)} chunks into context ({used_tokens}/{self.context_token_budget} tokens)")
+        return packed
+
+    def _sources(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Provenance for the chunks an answer was generated from."""
+        sources = []
+        for chunk in chunks:
+            metadata = chunk.get('metadata') or {}
+            similarity = chunk.get('similarity')
+            sources.append({
+                "chunk_id": chunk.get('id'),
+                "document_id": chunk.get('document_id') or metadata.get('document_id'),
+                "title": metadata.get('title'),
+                "chunk_index": metadata.get('chunk_index'),
+                "similarity": round(similarity, 4) if similarity is not None else None,
+            })
+        return sources
+
     def _build_context_with_conversation(self, conversation_context: str, chunk_texts: list) -> list:
         """
         Build context list that includes conversation history and retrieved chunks.
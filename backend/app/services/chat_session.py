@@ -0,0 +1,57 @@
+import time
+from typing import Any, Dict, List, Optional
+from app.services.redis_service import redis_service
+
+
+class ChatSession:
+    """
+    Conversation state kept in memory for one WebSocket connection.
+
+    Summary and history are read from Redis once when the socket connects;
+    every message is written through to Redis, so HTTP /chat, other workers
+    and a reconnecting client see the same conversation. Before each message
+    the stored history length is compared (LLEN, no payload) and the session
+    reloads if another writer (a second tab, HTTP /chat) changed it.
+
+    The resolved prompt/context cache is reused for prompt_context_ttl
+    seconds, or until a prompt_updated notification invalidates it.
+    """
+
+    def __init__(self, conversation_id: str, prompt_context_ttl: float):
+        self.conversation_id = conversation_id
+        self.prompt_context_ttl = prompt_context_ttl
+        self.summary: Optional[str] = None
+        self.messages: List[Dict[str, Any]] = []
+        self._prompt_context: Optional[Dict[str, Any]] = None
+        self._prompt_context_at = 0.0
+
+    async def load(self):
+        """(Re)read summary and history from Redis."""
+        self.summary = await redis_service.get_conversation_summary(self.conversation_id)
+        self.messages = await redis_service.get_conversation_history(self.conversation_id)
+
+    async def sync(self):
+        """Reload if the stored history no longer matches what this session holds."""
+        stored = await redis_service.get_history_length(self.conversation_id)
+        if stored is not None and stored != len(self.messages):
+            print(f"Conversation {self.conversation_id} changed elsewhere, reloading session")
+            await self.load()
+
+    async def add_message(self, role: str, content: str):
+        self.messages.append({"role": role, "content": content})
+        await redis_service.store_conversation_message(self.conversation_id, role, content)
+
+    def user_message_count(self) -> int:
+        return sum(1 for message in self.messages if message.get("role") == "user")
+
+    def get_prompt_context(self) -> Optional[Dict[str, Any]]:
+        if self._prompt_context and time.monotonic() - self._prompt_context_at < self.prompt_context_ttl:
+            return self._prompt_context
+        return None
+
+    def set_prompt_context(self, prompt_context: Dict[str, Any]):
+        self._prompt_context = prompt_context
+        self._prompt_context_at = time.monotonic()
+
+    def invalidate_prompt_context(self):
+        self._prompt_context = None
@@ -0,0 +1,212 @@
+import os
+import json
+import uuid
+import asyncio
+from typing import Any, Dict, Optional, Set
+from dotenv import load_dotenv
+from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from app.configs.redis import redis_client
+from app.configs.cors import CorsConfig
+from app.models.request import ChatSocketMessage
+from app.services.chat_service import chat_service
+from app.services.chat_session import ChatSession
+from app.services.admission_service import admission_controller, AdmissionRejected
+from app.services.model_call_service import model_call_service
+
+load_dotenv()
+
+# Redis pub/sub channel fanning notifications out to sockets on every worker
+NOTIFICATION_CHANNEL = "chat:notifications"
+
+
+class ChatConnection:
+    """One connected WebSocket: its session and the generation in flight, if any."""
+
+    def __init__(self, websocket: WebSocket, session: ChatSession, client_key: Optional[str]):
+        self.websocket = websocket
+        self.session = session
+        self.client_key = client_key
+        self.generation: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, payload: Dict[str, Any]) -> bool:
+        """Send one JSON frame; False if the socket is already gone."""
+        try:
+            async with self._send_lock:
+                await self.websocket.send_json(payload)
+            return True
+        except Exception:
+            return False
+
+
+class ChatSocketService:
+    """
+    WebSocket chat channel (/ws/chat/{conversation_id}).
+
+    Each connection keeps a ChatSession in memory, so messages skip the Redis
+    history/summary reads and prompt resolution that every HTTP /chat call
+    repeats. Generated text is streamed as it arrives, a new message cancels
+    the generation still running for the previous one, and server-side events
+    (prompt or knowledge base changes) are pushed to every connected client.
+
+    Frames are JSON objects with a "type":
+        client: message {message, message_id?, filters?, include_sources?}, cancel, ping
+        server: ready, token {message_id, delta}, done {message_id, message, source, sources?},
+                cancelled {message_id}, error {message_id, error, retry_after?},
+                notification {event, ...}, pong
+
+    Each message still goes through admission control and the request deadline.
+    """
+
+    def __init__(self):
+        self.max_connections = int(os.getenv("WS_MAX_CONNECTIONS", 1000))
+        self.prompt_context_ttl = float(os.getenv("WS_PROMPT_CONTEXT_TTL", 300))
+        self._connections: Set[ChatConnection] = set()
+        self._listener: Optional[asyncio.Task] = None
+
+    async def serve(self, websocket: WebSocket, conversation_id: str, client_key: Optional[str] = None):
+        """Run one chat connection until the client disconnects."""
+        # Browsers don't apply CORS to WebSockets: refuse pages from other sites
+        origin = websocket.headers.get("origin")
+        if origin and not CorsConfig.is_allowed(origin):
+            print(f"Rejected chat socket from origin {origin}")
+            await websocket.close(code=1008)
+            return
+        if len(self._connections) >= self.max_connections:
+            # 1013: try again later
+            await websocket.close(code=1013)
+            return
+
+        await websocket.accept()
+        session = ChatSession(conversation_id, self.prompt_context_ttl)
+        await session.load()
+        connection = ChatConnection(websocket, session, client_key)
+        self._connections.add(connection)
+        self._start_listener()
+        print(f"Chat socket connected for conversation {conversation_id} ({len(self._connections)} open)")
+
+        await connection.send({"type": "ready", "conversation_id": conversation_id})
+        try:
+            while True:
+                try:
+                    frame = json.loads(await websocket.receive_text())
+                except WebSocketDisconnect:
+                    break
+                except ValueError:
+                    await connection.send({"type": "error", "message_id": None, "error": "Invalid JSON"})
+                    continue
+                await self._handle_frame(connection, frame)
+        finally:
+            self._connections.discard(connection)
+            await self._cancel(connection)
+            print(f"Chat socket closed for conversation {conversation_id}")
+
+    async def notify(self, event: str, **data: Any):
+        """Push a notification to every connected chat client, on every worker."""
+        try:
+            await redis_client.publish(NOTIFICATION_CHANNEL, json.dumps({"event": event, **data}, default=str))
+        except Exception as e:
+            print(f"Error publishing chat notification: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "connections": len(self._connections),
+            "generating": sum(1 for c in self._connections if c.generation and not c.generation.done()),
+        }
+
+    async def _handle_frame(self, connection: ChatConnection, frame: Any):
+        kind = frame.get("type") if isinstance(frame, dict) else None
+        if kind == "ping":
+            await connection.send({"type": "pong"})
+        elif kind == "cancel":
+            await self._cancel(connection)
+        elif kind == "message":
+            try:
+                request = ChatSocketMessage(**frame)
+            except ValidationError as e:
+                await connection.send({"type": "error", "message_id": frame.get("message_id"), "error": str(e)})
+                return
+            # The user moved on: stop generating the previous answer
+            await self._cancel(connection)
+            connection.generation = asyncio.create_task(self._generate(connection, request))
+        else:
+            await connection.send({"type": "error", "message_id": None, "error": f"Unknown frame type: {kind}"})
+
+    async def _generate(self, connection: ChatConnection, request: ChatSocketMessage):
+        message_id = request.message_id or uuid.uuid4().hex
+        conversation_id = connection.session.conversation_id
+        filters = request.filters.model_dump(mode="json", exclude_none=True) if request.filters else None
+
+        async def on_token(delta: str):
+            await connection.send({"type": "token", "message_id": message_id, "delta": delta})
+
+        try:
+            async with admission_controller.admit(conversation_id, connection.client_key):
+                with model_call_service.deadline(chat_service.request_deadline):
+                    result = await chat_service.process_chat(
+                        conversation_id,
+                        request.message,
+                        filters,
+                        session=connection.session,
+                        on_token=on_token
+                    )
+            # The final text is authoritative (it replaces partial text after a failed stream)
+            payload = {"type": "done", "message_id": message_id, "message": result["message"], "source": result["source"]}
+            if request.include_sources:
+                payload["sources"] = result.get("sources", [])
+            await connection.send(payload)
+        except asyncio.CancelledError:
+            await connection.send({"type": "cancelled", "message_id": message_id})
+            raise
+        except AdmissionRejected as e:
+            await connection.send({"type": "error", "message_id": message_id, "error": e.reason, "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"Error in chat socket generation: {e}")
+            await connection.send({"type": "error", "message_id": message_id, "error": str(e)})
+
+    async def _cancel(self, connection: ChatConnection):
+        task = connection.generation
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            print(f"Cancelled generation for conversation {connection.session.conversation_id}")
+
+    def _start_listener(self):
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        """Relay pub/sub notifications to this worker's sockets, resubscribing after Redis errors."""
+        while True:
+            pubsub = redis_client.pubsub()
+            try:
+                await pubsub.subscribe(NOTIFICATION_CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        notification = json.loads(message["data"])
+                    except ValueError:
+                        continue
+                    await self._broadcast(notification)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Chat notification listener error: {e}")
+                await asyncio.sleep(5)
+            finally:
+                await pubsub.reset()
+
+    async def _broadcast(self, notification: Dict[str, Any]):
+        connections = list(self._connections)
+        if notification.get("event") == "prompt_updated":
+            for connection in connections:
+                connection.session.invalidate_prompt_context()
+        await asyncio.gather(*(connection.send({"type": "notification", **notification}) for connection in connections))
+
+
+chat_socket_service = ChatSocketService()
@@ -0,0 +1,232 @@
+import math
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from langchain_core.documents import Document
+from app.configs.chunking import ChunkingConfig
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+\S")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token) for when no tokenizer is available."""
+    return max(1, math.ceil(len(text) / 4)) if text else 0
+
+
+def pack_chunks(chunks: List[Dict[str, Any]], token_budget: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Keep the highest-ranked chunks that fit within token_budget (always at least one).
+
+    Uses the token_count stored in chunk metadata at ingestion, so no
+    tokenization happens at query time. Older chunks without a stored count
+    fall back to an estimate.
+
+    Returns:
+        Tuple of (packed chunks, tokens used)
+    """
+    packed = []
+    used_tokens = 0
+    for chunk in chunks:
+        metadata = chunk.get('metadata') or {}
+        tokens = metadata.get('token_count') or estimate_tokens(chunk.get('content', ''))
+        if packed and used_tokens + tokens > token_budget:
+            break
+        packed.append(chunk)
+        used_tokens += tokens
+    return packed, used_tokens
+
+
+class TokenCounter:
+    """
+    Counts tokens with the chat model's local tokenizer.
+
+    Uses the Vertex AI SDK's offline tokenizer so chunk sizes match what the
+    model will actually be charged for. Falls back to estimate_tokens if the
+    tokenizer cannot be loaded.
+    """
+
+    def __init__(self, model_name: str = None):
+        self.model_name = model_name or ChunkingConfig.tokenizer_model
+        self._tokenizer = None
+        self._loaded = False
+
+    def _get_tokenizer(self):
+        if not self._loaded:
+            self._loaded = True
+            try:
+                from vertexai.preview import tokenization
+                self._tokenizer = tokenization.get_tokenizer_for_model(self.model_name)
+                print(f"Using local tokenizer for {self.model_name}")
+            except Exception as e:
+                print(f"Local tokenizer unavailable ({e}), estimating token counts")
+        return self._tokenizer
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        tokenizer = self._get_tokenizer()
+        if tokenizer is None:
+            return estimate_tokens(text)
+        try:
+            return tokenizer.count_tokens(text).total_tokens
+        except Exception:
+            return estimate_tokens(text)
+
+
+class StructureAwareChunker:
+    """
+    Splits sections into chunks sized by token count.
+
+    Chunks never span a heading: each loader section starts a new chunk, and
+    Markdown-style heading lines inside a section do too. Within a section,
+    whole paragraphs are packed together; oversized paragraphs fall back to
+    sentences, and oversized sentences to word windows. The title prefix is
+    counted against the budget, and the final token count is stored in each
+    chunk's metadata as 'token_count'.
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: int = None,
+        chunk_overlap_tokens: int = None,
+        token_counter: Optional[TokenCounter] = None
+    ):
+        self.chunk_tokens = chunk_tokens or ChunkingConfig.chunk_tokens
+        self.chunk_overlap_tokens = (
+            chunk_overlap_tokens if chunk_overlap_tokens is not None else ChunkingConfig.chunk_overlap_tokens
+        )
+        self.token_counter = token_counter or TokenCounter()
+
+    def split_documents(self, documents: Iterable[Document], prefix: str = "") -> List[Document]:
+        """
+        Chunk a stream of section Documents.
+
+        Args:
+            documents: Sections yielded by a loader
+            prefix: Text prepended to every chunk (e.g. the document title)
+
+        Returns:
+            List of chunk Documents with 'token_count' in their metadata
+        """
+        prefix_tokens = self.token_counter.count(prefix)
+        budget = max(16, self.chunk_tokens - prefix_tokens)
+
+        chunks = []
+        for document in documents:
+            for content, tokens in self._split_text(document.page_content, prefix, budget, prefix_tokens + budget):
+                metadata = dict(document.metadata)
+                metadata["token_count"] = tokens
+                chunks.append(Document(page_content=content, metadata=metadata))
+        return chunks
+
+    def _split_text(self, text: str, prefix: str, budget: int, limit: int) -> List[Tuple[str, int]]:
+        """
+        Pack structural units (each at most `budget` tokens) into chunks.
+
+        Token counts don't add up exactly across joined text, so every candidate
+        chunk is counted as a whole, prefix included, and kept within `limit`.
+
+        Returns:
+            List of (chunk text with prefix, token count)
+        """
+        chunks = []
+        current: List[Tuple[str, int, str]] = []
+        current_tokens = 0
+
+        for unit, tokens, separator, starts_section in self._units(text, budget):
+            if current and not starts_section:
+                candidate_tokens = self.token_counter.count(prefix + self._join(current + [(unit, tokens, separator)]))
+                if candidate_tokens <= limit:
+                    current.append((unit, tokens, separator))
+                    current_tokens = candidate_tokens
+                    continue
+
+            if current:
+                chunks.append((prefix + self._join(current), current_tokens))
+                current = [] if starts_section else self._overlap(current)
+
+            current.append((unit, tokens, separator))
+            current_tokens = self.token_counter.count(prefix + self._join(current))
+            # Drop the overlap if it would leave no room for the new unit
+            if current_tokens > limit and len(current) > 1:
+                current = [(unit, tokens, separator)]
+                current_tokens = self.token_counter.count(prefix + unit)
+
+        if current:
+            chunks.append((prefix + self._join(current), current_tokens))
+        return chunks
+
+    def _units(self, text: str, budget: int):
+        """
+        Yield (text, tokens, separator, starts_section) packing units.
+
+        A unit is a paragraph if it fits the budget, otherwise its sentences,
+        otherwise word windows of a sentence.
+        """
+        for paragraph in PARAGRAPH_BREAK.split(text):
+            paragraph = paragraph.strip()
+            if not paragraph:
+                continue
+
+            starts_section = bool(MARKDOWN_HEADING.match(paragraph))
+            tokens = self.token_counter.count(paragraph)
+            if tokens <= budget:
+                yield paragraph, tokens, "\n\n", starts_section
+                continue
+
+            separator = "\n\n"
+            for sentence in SENTENCE_END.split(paragraph):
+                sentence_tokens = self.token_counter.count(sentence)
+                if sentence_tokens <= budget:
+                    yield sentence, sentence_tokens, separator, starts_section
+                else:
+                    for window, window_tokens in self._windows(sentence.split(), " ", sentence_tokens, budget):
+                        yield window, window_tokens, separator, starts_section
+                        separator, starts_section = " ", False
+                separator, starts_section = " ", False
+
+    def _windows(self, items: List[str], joiner: str, total_tokens: int, budget: int) -> List[Tuple[str, int]]:
+        """
+        Split text that alone exceeds the budget into consecutive windows of
+        words (or, for a single over-long word, characters). Window sizes start
+        from the text's average tokens per item and shrink until the counted
+        window fits.
+        """
+        items_per_window = max(1, int(len(items) * budget / max(total_tokens, 1)))
+        windows = []
+        start = 0
+        while start < len(items):
+            size = min(items_per_window, len(items) - start)
+            window = joiner.join(items[start:start + size])
+            tokens = self.token_counter.count(window)
+            while tokens > budget and size > 1:
+                size = max(1, min(size - 1, int(size * budget / tokens)))
+                window = joiner.join(items[start:start + size])
+                tokens = self.token_counter.count(window)
+            if tokens > budget and joiner:
+                windows.extend(self._windows(list(window), "", tokens, budget))
+            else:
+                windows.append((window, tokens))
+            start += size
+        return windows
+
+    def _overlap(self, units: List[Tuple[str, int, str]]) -> List[Tuple[str, int, str]]:
+        """Trailing units of the previous chunk that fit in the overlap budget."""
+        carried = []
+        total = 0
+        for unit in reversed(units):
+            if total + unit[1] > self.chunk_overlap_tokens:
+                break
+            carried.insert(0, unit)
+            total += unit[1]
+        return carried
+
+    def _join(self, units: List[Tuple[str, int, str]]) -> str:
+        body = units[0][0]
+        for unit, _, separator in units[1:]:
+            body += separator + unit
+        return body
+
+
+chunker = StructureAwareChunker()
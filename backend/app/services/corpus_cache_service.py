@@ -0,0 +1,276 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+from app.configs.redis import redis_client
+from app.configs.supabase import supabase_client
+from app.services.rag_service import rag_service
+from app.services.prompt_service import prompt_service
+from app.services.chunking_service import estimate_tokens
+from app.services.knowledge_base_service import knowledge_base_service
+
+load_dotenv()
+
+CORPUS_CACHE_STATE_KEY = "cag:state"
+CORPUS_CACHE_LOCK_KEY = "cag:rebuild_lock"
+# Title prefix added to every chunk at ingestion; the corpus groups chunks under a title instead
+TITLE_PREFIX = re.compile(r"^\[This content is from the .*?\] - ", re.DOTALL)
+
+
+class CorpusCacheService:
+    """
+    Cache-augmented generation (CAG): pin the whole knowledge base into a
+    Vertex AI context cache.
+
+    When CAG_ENABLED is true, prompt activation and every knowledge-base change
+    rebuild a context cache holding the system prompt plus the full corpus
+    from chunk_documents (exact duplicates and chunk overlaps removed, chunks
+    grouped per document in order). Chat then skips embedding and vector
+    search and sends only the conversation and the question.
+
+    The cache is used only while it matches the current prompt and KB version
+    and has not expired. If the corpus exceeds CAG_MAX_CORPUS_TOKENS (checked
+    from the stored chunk token counts before any content is read) or the
+    cache can't be created, chat stays on retrieval (RAG). A replaced or
+    abandoned corpus cache is deleted so it stops billing.
+    """
+
+    def __init__(self):
+        self.client = supabase_client
+        self.redis = redis_client
+        self.enabled = os.getenv("CAG_ENABLED", "false").strip().lower() == "true"
+        self.max_corpus_tokens = int(os.getenv("CAG_MAX_CORPUS_TOKENS", 200000))
+        self.ttl_hours = int(os.getenv("CAG_CACHE_TTL_HOURS", 1))
+        self.page_size = int(os.getenv("CAG_CORPUS_PAGE_SIZE", 1000))
+        self._rebuild_task: Optional[asyncio.Task] = None
+        self._rebuild_pending = False
+
+    async def get_active_cache(self, prompt_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """
+        The corpus cache to answer with, if CAG is usable for this prompt.
+
+        Returns:
+            Dict with cache_name and document_ids, or None to use retrieval.
+            A stale or expired cache schedules a rebuild in the background.
+        """
+        if not self.enabled or not prompt_id:
+            return None
+
+        state = await self.get_state()
+        if not state or state.get("mode") != "cag":
+            return None
+
+        expire_time = state.get("expire_time")
+        expired = bool(expire_time) and datetime.now(timezone.utc) >= datetime.fromisoformat(expire_time.replace('Z', '+00:00'))
+        current = (
+            state.get("prompt_id") == prompt_id
+            and state.get("kb_version") == await knowledge_base_service.get_version()
+        )
+        if expired or not current:
+            print(f"Corpus cache {'expired' if expired else 'out of date'}; using retrieval until it is rebuilt")
+            self.schedule_rebuild()
+            return None
+
+        return {"cache_name": state["cache_name"], "document_ids": state.get("document_ids", [])}
+
+    async def get_state(self) -> Optional[Dict[str, Any]]:
+        try:
+            raw = await self.redis.get(CORPUS_CACHE_STATE_KEY)
+            return json.loads(raw) if raw else None
+        except Exception as e:
+            print(f"Error reading corpus cache state: {e}")
+            return None
+
+    async def rebuild(
+        self,
+        system_instruction: Optional[str] = None,
+        prompt_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Build a new corpus cache for the given prompt (default: the latest active prompt).
+
+        Returns:
+            The new state: mode ("cag" or "rag"), reason, and cache details when in CAG mode
+        """
+        if not self.enabled:
+            return {"mode": "rag", "reason": "CAG disabled"}
+
+        # One rebuild at a time across workers; the token-checked lock can't be
+        # released by a rebuild that outlived its timeout and lost it
+        lock = self.redis.lock(CORPUS_CACHE_LOCK_KEY, timeout=600, blocking=False)
+        if not await lock.acquire():
+            print("Corpus cache rebuild already running in another worker")
+            return await self.get_state() or {"mode": "rag", "reason": "rebuild in progress"}
+
+        try:
+            if system_instruction is None or prompt_id is None:
+                prompt_data = await prompt_service.get_latest_prompt()
+                if not prompt_data:
+                    return await self._switch_to_rag({"reason": "no active prompt"})
+                system_instruction = prompt_data.get("template_content", "You are a helpful AI assistant.")
+                prompt_id = str(prompt_data.get("id"))
+
+            # Read before loading the corpus so changes made meanwhile mark this cache stale
+            kb_version = await knowledge_base_service.get_version()
+
+            # Size check from stored token counts, so a large KB is never read into memory
+            stored_tokens = await self._stored_corpus_tokens()
+            if stored_tokens is not None and stored_tokens > self.max_corpus_tokens:
+                return await self._too_large(stored_tokens, kb_version)
+
+            corpus, document_ids, corpus_tokens = await self._load_corpus()
+            if not corpus:
+                return await self._switch_to_rag({"reason": "empty knowledge base", "kb_version": kb_version})
+            if corpus_tokens > self.max_corpus_tokens:
+                return await self._too_large(corpus_tokens, kb_version)
+
+            # Loading the corpus can be slow: renew the lock, or stop if another worker took it over
+            await lock.reacquire()
+            print(f"Creating corpus cache: {len(document_ids)} documents, ~{corpus_tokens} tokens")
+            cache_result = await rag_service.create_context_cache(
+                system_instruction,
+                ttl_hours=self.ttl_hours,
+                corpus=corpus
+            )
+            if not cache_result:
+                return await self._switch_to_rag({"reason": "context cache creation failed", "kb_version": kb_version})
+
+            cache_name, expire_time = cache_result
+            previous = await self.get_state()
+            state = await self._save_state({
+                "mode": "cag",
+                "reason": "corpus pinned in context cache",
+                "cache_name": cache_name,
+                "expire_time": expire_time,
+                "prompt_id": prompt_id,
+                "kb_version": kb_version,
+                "document_ids": document_ids,
+                "corpus_tokens": corpus_tokens,
+            })
+            if previous and previous.get("cache_name") and previous["cache_name"] != cache_name:
+                await rag_service.delete_context_cache(previous["cache_name"])
+            return state
+        finally:
+            try:
+                await lock.release()
+            except Exception as e:
+                print(f"Error releasing corpus cache lock: {e}")
+
+    def schedule_rebuild(self):
+        """Rebuild in the background, coalescing changes made while a rebuild runs."""
+        if not self.enabled:
+            return
+        if self._rebuild_task and not self._rebuild_task.done():
+            self._rebuild_pending = True
+            return
+        self._rebuild_task = asyncio.create_task(self._run_rebuilds())
+
+    async def _run_rebuilds(self):
+        while True:
+            self._rebuild_pending = False
+            try:
+                await self.rebuild()
+            except Exception as e:
+                print(f"Error rebuilding corpus cache: {e}")
+            if not self._rebuild_pending:
+                break
+
+    async def _stored_corpus_tokens(self) -> Optional[int]:
+        """Upper bound of the corpus size from chunk metadata (None if the RPC is unavailable)."""
+        try:
+            response = await asyncio.to_thread(self.client.rpc("corpus_token_count", {}).execute)
+            return int(response.data or 0)
+        except Exception as e:
+            print(f"Error reading stored corpus token count, sizing from content: {e}")
+            return None
+
+    async def _too_large(self, corpus_tokens: int, kb_version: int) -> Dict[str, Any]:
+        print(f"Corpus too large for CAG ({corpus_tokens} > {self.max_corpus_tokens} tokens); using retrieval")
+        return await self._switch_to_rag({
+            "reason": f"corpus of {corpus_tokens} tokens exceeds CAG_MAX_CORPUS_TOKENS",
+            "corpus_tokens": corpus_tokens,
+            "kb_version": kb_version,
+        })
+
+    async def _switch_to_rag(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Save a retrieval-mode state and delete the corpus cache it replaces."""
+        previous = await self.get_state()
+        saved = await self._save_state({"mode": "rag", **state})
+        if previous and previous.get("cache_name"):
+            await rag_service.delete_context_cache(previous["cache_name"])
+        return saved
+
+    async def _load_corpus(self) -> Tuple[str, List[str], int]:
+        """
+        Read every chunk and assemble the deduplicated corpus text.
+
+        Returns:
+            Tuple of (corpus text, document_ids, estimated tokens)
+        """
+        rows = []
+        start = 0
+        while True:
+            request = (
+                self.client.table("chunk_documents")
+                .select("id, document_id, content, metadata")
+                .order("document_id")
+                .order("id")
+                .range(start, start + self.page_size - 1)
+            )
+            response = await asyncio.to_thread(request.execute)
+            page = response.data or []
+            rows.extend(page)
+            if len(page) < self.page_size:
+                break
+            start += self.page_size
+
+        documents: Dict[str, Dict[str, Any]] = {}
+        seen_hashes = set()
+        for row in rows:
+            content = TITLE_PREFIX.sub("", row.get("content") or "").strip()
+            content_hash = hashlib.sha256(content.encode("utf-8")).hexdigest()
+            if not content or content_hash in seen_hashes:
+                continue
+            seen_hashes.add(content_hash)
+
+            metadata = row.get("metadata") or {}
+            document_id = str(row.get("document_id") or metadata.get("document_id") or "unknown")
+            document = documents.setdefault(document_id, {"title": metadata.get("title") or document_id, "chunks": []})
+            document["chunks"].append((metadata.get("chunk_index", 0), content))
+
+        sections = []
+        for document in documents.values():
+            parts: List[str] = []
+            for _, content in sorted(document["chunks"], key=lambda chunk: chunk[0]):
+                parts.append(self._strip_overlap(parts[-1], content) if parts else content)
+            sections.append(f"## Document: {document['title']}\n\n" + "\n".join(part for part in parts if part))
+
+        corpus = "# Knowledge base\n\n" + "\n\n".join(sections) if sections else ""
+        document_ids = sorted(document_id for document_id in documents if document_id != "unknown")
+        return corpus, document_ids, estimate_tokens(corpus)
+
+    def _strip_overlap(self, previous: str, content: str) -> str:
+        """Drop the leading text a chunk repeats from the end of the previous chunk."""
+        probe = content[:40]
+        position = previous.rfind(probe) if probe else -1
+        if position != -1:
+            overlap = len(previous) - position
+            if content.startswith(previous[position:]) and overlap < len(content):
+                return content[overlap:].lstrip()
+        return content
+
+    async def _save_state(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        state["updated_at"] = datetime.now(timezone.utc).isoformat()
+        try:
+            await self.redis.set(CORPUS_CACHE_STATE_KEY, json.dumps(state))
+        except Exception as e:
+            print(f"Error saving corpus cache state: {e}")
+        print(f"Corpus cache mode: {state['mode']} ({state.get('reason')})")
+        return state
+
+
+corpus_cache_service = CorpusCacheService()
@@ -0,0 +1,121 @@
+import os
+import asyncio
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from app.configs.supabase import supabase_client
+from app.services.ingestion_pipeline import ingestion_pipeline
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.vector_snapshot import vector_snapshot
+
+load_dotenv()
+
+
+class DocumentIndexService:
+    """
+    Removes and rebuilds a document's chunks in chunk_documents.
+
+    - delete_document: bulk-deletes every chunk of a document in one RPC
+    - reindex_document: ingests the document again, then deletes only chunks
+      from other ingestions, so searches never see the document missing
+    - collect_garbage: sweeps chunks whose parent `documents` row is gone
+
+    Each change bumps the KB version for the affected documents so cached
+    answers built from them are retired.
+    """
+
+    def __init__(self):
+        self.client = supabase_client
+        self.gc_batch_size = int(os.getenv("CHUNK_GC_BATCH_SIZE", 5000))
+        # Seconds between background orphan sweeps (0 disables the periodic job)
+        self.gc_interval = int(os.getenv("CHUNK_GC_INTERVAL", 0))
+
+    async def delete_document(self, doc_id: str) -> int:
+        """
+        Delete all chunks of a document.
+
+        Returns:
+            Number of chunk rows deleted
+        """
+        deleted = await self._delete_chunks(doc_id)
+        print(f"Deleted {deleted} chunks for document {doc_id}")
+        if deleted:
+            await self._tombstone(doc_id)
+            await knowledge_base_service.document_changed(doc_id, removed=True)
+        return deleted
+
+    async def reindex_document(self, doc_id: str) -> Dict[str, Any]:
+        """
+        Re-run ingestion for a document and replace its previous chunks.
+
+        Returns:
+            Dict with success, chunks_processed and chunks_deleted, or error
+        """
+        result = await asyncio.to_thread(ingestion_pipeline, doc_id)
+        if not result["success"]:
+            # Previous chunks are left in place so the document stays searchable
+            return {**result, "chunks_deleted": 0}
+
+        # Unchanged content was upserted in place; only other generations are removed
+        request = self.client.rpc(
+            "delete_stale_document_chunks",
+            {"target_document_id": doc_id, "keep_ingest_hash": result["ingest_hash"]}
+        )
+        response = await asyncio.to_thread(request.execute)
+        deleted_ids = [row["id"] for row in response.data or []]
+        deleted = len(deleted_ids)
+        if deleted_ids:
+            await self._tombstone(doc_id, chunk_ids=deleted_ids)
+        print(f"Re-indexed document {doc_id}: {result['chunks_processed']} new chunks, {deleted} old chunks deleted")
+        await knowledge_base_service.document_changed(doc_id)
+        return {**result, "chunks_deleted": deleted}
+
+    async def collect_garbage(self) -> Dict[str, int]:
+        """
+        Delete chunks whose document no longer exists, in batches.
+
+        Returns:
+            Dict with chunks_deleted and documents (distinct orphaned document_ids)
+        """
+        chunks_deleted = 0
+        document_ids = set()
+        while True:
+            request = self.client.rpc("gc_orphan_chunks", {"batch_size": self.gc_batch_size})
+            response = await asyncio.to_thread(request.execute)
+            rows = response.data or []
+            batch_deleted = sum(int(row["deleted"]) for row in rows)
+            chunks_deleted += batch_deleted
+            document_ids.update(row["document_id"] for row in rows if row.get("document_id"))
+            if batch_deleted < self.gc_batch_size:
+                break
+
+        for doc_id in document_ids:
+            await self._tombstone(doc_id)
+            await knowledge_base_service.document_changed(doc_id, removed=True)
+        print(f"Chunk GC reclaimed {chunks_deleted} chunks from {len(document_ids)} deleted documents")
+        return {"chunks_deleted": chunks_deleted, "documents": len(document_ids)}
+
+    async def run_periodic_gc(self):
+        """Background loop that sweeps orphaned chunks every CHUNK_GC_INTERVAL seconds."""
+        while True:
+            await asyncio.sleep(self.gc_interval)
+            try:
+                await self.collect_garbage()
+            except Exception as e:
+                print(f"Error in chunk GC: {e}")
+
+    async def _delete_chunks(self, doc_id: str) -> int:
+        request = self.client.rpc("delete_document_chunks", {"target_document_id": doc_id})
+        response = await asyncio.to_thread(request.execute)
+        return int(response.data or 0)
+
+    async def _tombstone(self, doc_id: str, chunk_ids: Optional[List[int]] = None):
+        """Hide deleted rows (all of the document's, or just chunk_ids) from the local vector snapshot."""
+        if not vector_snapshot.enabled:
+            return
+        try:
+            await asyncio.to_thread(vector_snapshot.append_tombstone, doc_id, chunk_ids)
+        except Exception as e:
+            print(f"Error writing vector snapshot tombstone: {e}")
+
+
+document_index_service = DocumentIndexService()
@@ -0,0 +1,369 @@
+import csv
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterator, List, Optional
+from langchain_core.documents import Document
+from app.services.pdf_parser import pdf_parser
+
+# A loader takes a local file path and the original source URL and lazily yields sections
+Loader = Callable[[str, str], Iterator[Document]]
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+HTML_MIME = "text/html"
+MARKDOWN_MIME = "text/markdown"
+CSV_MIME = "text/csv"
+TEXT_MIME = "text/plain"
+UNKNOWN_MIME = "application/octet-stream"
+
+SNIFF_BYTES = 8192
+TEXT_SECTION_CHARS = 20000
+CSV_ROWS_PER_SECTION = 50
+READ_BLOCK_CHARS = 65536
+
+MARKDOWN_HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+HTML_HEADING_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6"}
+HTML_SKIP_TAGS = {"script", "style", "noscript", "template"}
+HTML_BLOCK_TAGS = HTML_HEADING_TAGS | {"p", "div", "li", "tr", "br", "section", "article", "table", "ul", "ol", "pre", "blockquote"}
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+class LoaderRegistry:
+    """
+    Registry of streaming document loaders keyed by MIME type.
+
+    File types are detected from the file's leading bytes. The extension is only
+    consulted when text content is too ambiguous to classify as Markdown or CSV.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Loader] = {}
+        self._extensions: Dict[str, str] = {}
+
+    def register(self, mime_type: str, extensions: List[str], loader: Loader):
+        """Register a loader for a MIME type and the extensions that hint at it."""
+        self._loaders[mime_type] = loader
+        for extension in extensions:
+            self._extensions[extension.lower()] = mime_type
+
+    def supported_mime_types(self) -> List[str]:
+        return list(self._loaders.keys())
+
+    def detect_mime_type(self, file_path: str, filename_hint: Optional[str] = None) -> str:
+        """
+        Detect a file's MIME type by sniffing its content.
+
+        Args:
+            file_path: Local path to the downloaded file
+            filename_hint: Original file name or URL, used only for text formats
+        """
+        with open(file_path, "rb") as f:
+            head = f.read(SNIFF_BYTES)
+
+        if head.startswith(b"%PDF-"):
+            return PDF_MIME
+        if head.startswith(b"PK\x03\x04"):
+            try:
+                with zipfile.ZipFile(file_path) as archive:
+                    if "word/document.xml" in archive.namelist():
+                        return DOCX_MIME
+            except zipfile.BadZipFile:
+                pass
+            return UNKNOWN_MIME
+
+        text = self._decode_head(head)
+        if text is None:
+            return UNKNOWN_MIME
+
+        lowered = text.lstrip().lower()
+        if lowered.startswith("<!doctype html") or lowered.startswith("<html") or "<body" in lowered[:2048]:
+            return HTML_MIME
+
+        if self._looks_like_csv(text):
+            return CSV_MIME
+        if self._looks_like_markdown(text):
+            return MARKDOWN_MIME
+
+        # Content reads as plain text; a .md/.csv name can still refine that
+        hinted = self._extensions.get(self._extension(filename_hint))
+        if hinted in (MARKDOWN_MIME, CSV_MIME):
+            return hinted
+        return TEXT_MIME
+
+    def iter_documents(self, file_path: str, source: str, filename_hint: Optional[str] = None) -> Iterator[Document]:
+        """
+        Detect the file type and lazily yield its sections as Documents.
+
+        Raises:
+            ValueError: If no loader is registered for the detected type
+        """
+        mime_type = self.detect_mime_type(file_path, filename_hint or source)
+        loader = self._loaders.get(mime_type)
+        if not loader:
+            raise ValueError(f"Unsupported file type: {mime_type}")
+
+        print(f"Detected {mime_type} for {source}")
+        for document in loader(file_path, source):
+            document.metadata.setdefault("mime_type", mime_type)
+            yield document
+
+    def _decode_head(self, head: bytes) -> Optional[str]:
+        if b"\x00" in head:
+            return None
+        try:
+            return head.decode("utf-8-sig")
+        except UnicodeDecodeError as e:
+            # The sniff window may cut a multi-byte character in half
+            if e.start >= len(head) - 3:
+                return head[:e.start].decode("utf-8-sig")
+            return None
+
+    def _extension(self, filename: Optional[str]) -> str:
+        if not filename:
+            return ""
+        path = filename.split("?")[0].split("#")[0]
+        return os.path.splitext(path)[1].lower()
+
+    def _looks_like_csv(self, text: str) -> bool:
+        lines = [line for line in text.splitlines()[:20] if line.strip()]
+        if len(lines) < 2:
+            return False
+        try:
+            dialect = csv.Sniffer().sniff("\n".join(lines), delimiters=",;\t|")
+        except csv.Error:
+            return False
+        counts = {line.count(dialect.delimiter) for line in lines[:-1]}
+        return len(counts) == 1 and counts.pop() > 0
+
+    def _looks_like_markdown(self, text: str) -> bool:
+        lines = text.splitlines()
+        headings = sum(1 for line in lines if MARKDOWN_HEADING.match(line))
+        fences = sum(1 for line in lines if line.startswith("```"))
+        links = len(re.findall(r"\[[^\]]+\]\([^)]+\)", text))
+        return headings >= 1 and (headings + fences + links) >= 2
+
+
+def _iter_text_blocks(file_path: str) -> Iterator[str]:
+    """Read a text file in fixed-size blocks without loading it whole."""
+    with open(file_path, "r", encoding="utf-8-sig", errors="replace") as f:
+        while True:
+            block = f.read(READ_BLOCK_CHARS)
+            if not block:
+                break
+            yield block
+
+
+def load_text(file_path: str, source: str) -> Iterator[Document]:
+    """Yield plain text in sections of whole paragraphs, up to TEXT_SECTION_CHARS each."""
+    buffer = ""
+    section_index = 0
+    for block in _iter_text_blocks(file_path):
+        buffer += block
+        while len(buffer) > TEXT_SECTION_CHARS:
+            cut = buffer.rfind("\n\n", 0, TEXT_SECTION_CHARS)
+            if cut <= 0:
+                cut = TEXT_SECTION_CHARS
+            section, buffer = buffer[:cut], buffer[cut:].lstrip("\n")
+            yield Document(page_content=section, metadata={"source": source, "section_index": section_index})
+            section_index += 1
+    if buffer.strip():
+        yield Document(page_content=buffer, metadata={"source": source, "section_index": section_index})
+
+
+def load_markdown(file_path: str, source: str) -> Iterator[Document]:
+    """Yield one section per Markdown heading, ignoring '#' lines inside code fences."""
+    heading = ""
+    lines: List[str] = []
+    in_fence = False
+    section_index = 0
+
+    with open(file_path, "r", encoding="utf-8-sig", errors="replace") as f:
+        for line in f:
+            if line.startswith("```"):
+                in_fence = not in_fence
+            match = None if in_fence else MARKDOWN_HEADING.match(line.rstrip("\n"))
+            if match:
+                if "".join(lines).strip():
+                    yield Document(
+                        page_content="".join(lines),
+                        metadata={"source": source, "section": heading, "section_index": section_index},
+                    )
+                    section_index += 1
+                heading = match.group(2).strip()
+                lines = [line]
+            else:
+                lines.append(line)
+
+    if "".join(lines).strip():
+        yield Document(
+            page_content="".join(lines),
+            metadata={"source": source, "section": heading, "section_index": section_index},
+        )
+
+
+class _HTMLSectionParser(HTMLParser):
+    """Incremental HTML-to-text parser that splits sections at heading tags."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.sections: List[tuple] = []
+        self._heading = ""
+        self._parts: List[str] = []
+        self._heading_parts: Optional[List[str]] = None
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HTML_SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in HTML_HEADING_TAGS:
+            self._flush()
+            self._heading_parts = []
+        elif tag in HTML_BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in HTML_SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in HTML_HEADING_TAGS and self._heading_parts is not None:
+            self._heading = " ".join("".join(self._heading_parts).split())
+            self._parts.append(f"{self._heading}\n\n")
+            self._heading_parts = None
+        elif tag in HTML_BLOCK_TAGS:
+            self._parts.append("\n")
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        if self._heading_parts is not None:
+            self._heading_parts.append(data)
+        else:
+            self._parts.append(data)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def _flush(self):
+        text = re.sub(r"\n\s*\n+", "\n\n", "".join(self._parts)).strip()
+        if text:
+            self.sections.append((self._heading, text))
+        self._parts = []
+
+
+def load_html(file_path: str, source: str) -> Iterator[Document]:
+    """Yield the visible text of an HTML page, one section per heading."""
+    parser = _HTMLSectionParser()
+    section_index = 0
+
+    def drain():
+        nonlocal section_index
+        for heading, text in parser.sections:
+            yield Document(
+                page_content=text,
+                metadata={"source": source, "section": heading, "section_index": section_index},
+            )
+            section_index += 1
+        parser.sections.clear()
+
+    for block in _iter_text_blocks(file_path):
+        parser.feed(block)
+        yield from drain()
+    parser.close()
+    yield from drain()
+
+
+def load_csv(file_path: str, source: str) -> Iterator[Document]:
+    """Yield CSV rows in groups of CSV_ROWS_PER_SECTION, rendered as 'column: value' lines."""
+    with open(file_path, "r", encoding="utf-8-sig", errors="replace", newline="") as f:
+        sample = f.read(SNIFF_BYTES)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+        except csv.Error:
+            dialect = csv.excel
+
+        reader = csv.reader(f, dialect)
+        header = next(reader, None)
+        if not header:
+            return
+
+        rows: List[str] = []
+        first_row = 1
+        for row_number, row in enumerate(reader, start=1):
+            if not any(cell.strip() for cell in row):
+                continue
+            rows.append("\n".join(f"{column}: {value}" for column, value in zip(header, row) if value.strip()))
+            if len(rows) >= CSV_ROWS_PER_SECTION:
+                yield Document(
+                    page_content="\n\n".join(rows),
+                    metadata={"source": source, "row_start": first_row, "row_end": row_number},
+                )
+                rows = []
+                first_row = row_number + 1
+
+        if rows:
+            yield Document(
+                page_content="\n\n".join(rows),
+                metadata={"source": source, "row_start": first_row, "row_end": row_number},
+            )
+
+
+def load_docx(file_path: str, source: str) -> Iterator[Document]:
+    """
+    Stream paragraphs out of word/document.xml and yield one section per heading.
+
+    Uses iterparse and clears each paragraph once read, so large documents are
+    never fully materialized in memory.
+    """
+    heading = ""
+    paragraphs: List[str] = []
+    section_index = 0
+
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open("word/document.xml") as xml_file:
+            for _, element in ET.iterparse(xml_file, events=("end",)):
+                if element.tag != f"{WORD_NS}p":
+                    continue
+
+                text = "".join(node.text or "" for node in element.iter(f"{WORD_NS}t")).strip()
+                style = element.find(f"{WORD_NS}pPr/{WORD_NS}pStyle")
+                style_name = style.get(f"{WORD_NS}val", "") if style is not None else ""
+                element.clear()
+
+                if not text:
+                    continue
+
+                if style_name.lower().startswith(("heading", "title")):
+                    if paragraphs:
+                        yield Document(
+                            page_content="\n\n".join(paragraphs),
+                            metadata={"source": source, "section": heading, "section_index": section_index},
+                        )
+                        section_index += 1
+                    heading = text
+                    paragraphs = [text]
+                else:
+                    paragraphs.append(text)
+
+    if paragraphs:
+        yield Document(
+            page_content="\n\n".join(paragraphs),
+            metadata={"source": source, "section": heading, "section_index": section_index},
+        )
+
+
+def load_pdf(file_path: str, source: str) -> Iterator[Document]:
+    """Yield PDF pages in order, parsed in parallel by the PDF worker pool."""
+    return pdf_parser.iter_pages(file_path, source=source)
+
+
+loader_registry = LoaderRegistry()
+loader_registry.register(PDF_MIME, [".pdf"], load_pdf)
+loader_registry.register(DOCX_MIME, [".docx"], load_docx)
+loader_registry.register(HTML_MIME, [".html", ".htm"], load_html)
+loader_registry.register(MARKDOWN_MIME, [".md", ".markdown"], load_markdown)
+loader_registry.register(CSV_MIME, [".csv", ".tsv"], load_csv)
+loader_registry.register(TEXT_MIME, [".txt", ".text", ".log"], load_text)
@@ -0,0 +1,197 @@
+import os
+import json
+import shutil
+import hashlib
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+load_dotenv()
+
+
+class RangeNotHonoured(IOError):
+    """Raised when a server answers a range request with something other than that range."""
+
+
+class StorageDownloader:
+    """
+    Download layer for Supabase Storage objects.
+
+    - One shared requests.Session with a keep-alive connection pool, so repeat
+      downloads reuse TCP/TLS connections
+    - Large read buffers (DOWNLOAD_BUFFER_SIZE) instead of 8KB chunks
+    - Objects above DOWNLOAD_RANGE_THRESHOLD are fetched as parallel HTTP range
+      requests written straight into their offsets of one file
+    - A local cache keyed by URL; with a cached ETag the download is
+      conditional (If-None-Match) and an unchanged object isn't transferred
+    """
+
+    def __init__(self):
+        self.buffer_size = int(os.getenv("DOWNLOAD_BUFFER_SIZE", 1024 * 1024))
+        self.range_threshold = int(os.getenv("DOWNLOAD_RANGE_THRESHOLD", 8 * 1024 * 1024))
+        self.range_part_size = int(os.getenv("DOWNLOAD_RANGE_PART_SIZE", 4 * 1024 * 1024))
+        self.parallelism = int(os.getenv("DOWNLOAD_PARALLELISM", 4))
+        self.timeout = float(os.getenv("DOWNLOAD_TIMEOUT", 30))
+        self.cache_dir = Path(os.getenv("DOWNLOAD_CACHE_DIR", "/tmp/turing-download-cache"))
+        self.cache_max_files = int(os.getenv("DOWNLOAD_CACHE_MAX_FILES", 50))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=4,
+            pool_maxsize=max(self.parallelism, 4),
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504), allowed_methods=("GET",)),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._cache_lock = threading.Lock()
+
+    def download(self, url: str, suffix: str = "") -> Tuple[str, str]:
+        """
+        Download an object to a new temporary file.
+
+        Returns:
+            Tuple of (temp file path, sha256 of the content). The caller deletes the file.
+        """
+        cached = self._cache_entry(url)
+        headers = {"If-None-Match": cached["etag"]} if cached and cached.get("etag") else {}
+
+        # One conditional GET: a 304 is answered from the cache, otherwise its
+        # headers decide between streaming this body and parallel ranges
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304 and cached:
+                print(f"Download skipped, object unchanged (ETag {cached['etag']})")
+                return self._copy_from_cache(url, suffix), cached["content_hash"]
+            response.raise_for_status()
+
+            size = int(response.headers.get("Content-Length") or 0)
+            etag = response.headers.get("ETag")
+            supports_ranges = (
+                response.headers.get("Accept-Ranges", "").lower() == "bytes"
+                and not response.headers.get("Content-Encoding")
+            )
+
+            fd, path = tempfile.mkstemp(suffix=suffix)
+            os.close(fd)
+            try:
+                if supports_ranges and size > self.range_threshold:
+                    # The parallel ranges replace this body; drop it unread
+                    response.close()
+                    try:
+                        content_hash = self._download_ranges(url, path, size, etag)
+                    except RangeNotHonoured as e:
+                        print(f"{e}; falling back to a single download")
+                        content_hash = self._download_stream(url, path)
+                else:
+                    content_hash = self._write_body(response, path)
+            except Exception:
+                os.unlink(path)
+                raise
+
+        if etag:
+            self._store_in_cache(url, path, etag, content_hash)
+        return path, content_hash
+
+    def _download_stream(self, url: str, path: str) -> str:
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            return self._write_body(response, path)
+
+    def _write_body(self, response: requests.Response, path: str) -> str:
+        content_hash = hashlib.sha256()
+        with open(path, "wb") as file:
+            for chunk in response.iter_content(chunk_size=self.buffer_size):
+                file.write(chunk)
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    def _download_ranges(self, url: str, path: str, size: int, etag: Optional[str]) -> str:
+        parts = [(start, min(start + self.range_part_size, size) - 1) for start in range(0, size, self.range_part_size)]
+        print(f"Downloading {size} bytes in {len(parts)} parallel ranges")
+
+        with open(path, "r+b") as file:
+            file.truncate(size)
+            fd = file.fileno()
+
+            def fetch(part: Tuple[int, int]):
+                start, end = part
+                headers = {"Range": f"bytes={start}-{end}"}
+                if etag:
+                    # Fail instead of mixing bytes from two versions of the object
+                    headers["If-Match"] = etag
+                with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+                    if response.status_code == 200:
+                        # Range ignored (e.g. by a CDN): the body is the whole object
+                        raise RangeNotHonoured("Server ignored the Range header")
+                    if response.status_code != 206:
+                        raise IOError(f"Range request returned {response.status_code}")
+                    content_range = response.headers.get("Content-Range", "")
+                    if not content_range.startswith(f"bytes {start}-{end}/"):
+                        raise RangeNotHonoured(f"Range {start}-{end} answered with Content-Range '{content_range}'")
+                    offset = start
+                    for chunk in response.iter_content(chunk_size=self.buffer_size):
+                        os.pwrite(fd, chunk, offset)
+                        offset += len(chunk)
+                    if offset != end + 1:
+                        raise IOError(f"Range {start}-{end} ended early at {offset}")
+
+            with ThreadPoolExecutor(max_workers=self.parallelism) as executor:
+                list(executor.map(fetch, parts))
+
+        content_hash = hashlib.sha256()
+        with open(path, "rb") as file:
+            while chunk := file.read(self.buffer_size):
+                content_hash.update(chunk)
+        return content_hash.hexdigest()
+
+    def _cache_key(self, url: str) -> str:
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+    def _cache_entry(self, url: str) -> Optional[Dict[str, str]]:
+        key = self._cache_key(url)
+        try:
+            entry = json.loads((self.cache_dir / f"{key}.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry if (self.cache_dir / f"{key}.bin").exists() else None
+
+    def _copy_from_cache(self, url: str, suffix: str) -> str:
+        fd, path = tempfile.mkstemp(suffix=suffix)
+        os.close(fd)
+        shutil.copyfile(self.cache_dir / f"{self._cache_key(url)}.bin", path)
+        return path
+
+    def _store_in_cache(self, url: str, path: str, etag: str, content_hash: str):
+        key = self._cache_key(url)
+        try:
+            with self._cache_lock:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                # Unique temp name: other processes may be caching the same URL
+                fd, tmp = tempfile.mkstemp(prefix=f"{key}.", suffix=".bin.tmp", dir=self.cache_dir)
+                os.close(fd)
+                try:
+                    shutil.copyfile(path, tmp)
+                    os.replace(tmp, self.cache_dir / f"{key}.bin")
+                except OSError:
+                    os.unlink(tmp)
+                    raise
+                (self.cache_dir / f"{key}.json").write_text(json.dumps({"url": url, "etag": etag, "content_hash": content_hash}))
+                self._evict()
+        except OSError as e:
+            print(f"Error caching download: {e}")
+
+    def _evict(self):
+        """Keep only the most recently stored DOWNLOAD_CACHE_MAX_FILES objects."""
+        entries = sorted(self.cache_dir.glob("*.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for entry in entries[self.cache_max_files:]:
+            entry.with_suffix(".bin").unlink(missing_ok=True)
+            entry.unlink(missing_ok=True)
+
+
+storage_downloader = StorageDownloader()
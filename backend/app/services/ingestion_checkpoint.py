@@ -0,0 +1,84 @@
+import os
+import re
+import json
+import shutil
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class IngestionCheckpointStore:
+    """
+    Local checkpoint store for resumable ingestion.
+
+    Intermediate results are kept per document and ingest hash (a hash of the
+    source file, its metadata and the chunking/embedding settings):
+
+        <INGEST_CHECKPOINT_DIR>/<doc_id>/<ingest_hash>/
+            chunks.json         chunk texts and metadata
+            batch-00000.f32     packed float32 embeddings, one file per batch
+
+    A retry of the same content reuses the saved chunks and only embeds
+    batches that have no checkpoint yet. Files are written to a
+    temporary name and renamed, so a crash never leaves a partial checkpoint.
+    """
+
+    def __init__(self):
+        self.directory = Path(os.getenv("INGEST_CHECKPOINT_DIR", "/tmp/turing-ingest-checkpoints"))
+
+    def load_chunks(self, doc_id: str, ingest_hash: str) -> Optional[List[Dict[str, Any]]]:
+        try:
+            return json.loads((self._path(doc_id, ingest_hash) / "chunks.json").read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save_chunks(self, doc_id: str, ingest_hash: str, chunks: List[Dict[str, Any]]):
+        self._write(self._path(doc_id, ingest_hash) / "chunks.json", json.dumps(chunks).encode("utf-8"))
+
+    def load_embedding_batch(self, doc_id: str, ingest_hash: str, index: int, rows: int) -> Optional[List[List[float]]]:
+        path = self._path(doc_id, ingest_hash) / f"batch-{index:05d}.f32"
+        try:
+            packed = array("f")
+            packed.frombytes(path.read_bytes())
+        except FileNotFoundError:
+            return None
+        if not rows or len(packed) % rows:
+            return None
+        dimensions = len(packed) // rows
+        return [packed[i * dimensions:(i + 1) * dimensions].tolist() for i in range(rows)]
+
+    def save_embedding_batch(self, doc_id: str, ingest_hash: str, index: int, vectors: List[List[float]]):
+        packed = array("f")
+        for vector in vectors:
+            packed.extend(vector)
+        self._write(self._path(doc_id, ingest_hash) / f"batch-{index:05d}.f32", packed.tobytes())
+
+    def clear(self, doc_id: str, keep_hash: Optional[str] = None):
+        """Remove a document's checkpoints (except those for keep_hash)."""
+        doc_dir = self.directory / self._safe_name(doc_id)
+        if not doc_dir.exists():
+            return
+        for path in doc_dir.iterdir():
+            if path.name != keep_hash:
+                shutil.rmtree(path, ignore_errors=True)
+        if keep_hash is None:
+            shutil.rmtree(doc_dir, ignore_errors=True)
+
+    def _path(self, doc_id: str, ingest_hash: str) -> Path:
+        return self.directory / self._safe_name(doc_id) / self._safe_name(ingest_hash)
+
+    def _safe_name(self, name: str) -> str:
+        # doc_id comes from the request; keep it a single path component
+        return re.sub(r"[^A-Za-z0-9_-]", "_", name)
+
+    def _write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+
+
+ingestion_checkpoints = IngestionCheckpointStore()
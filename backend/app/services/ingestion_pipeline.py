@@ -1,26 +1,39 @@
 import os
+import json
+import time
+import hashlib
+from typing import Any, Dict, List
 from dotenv import load_dotenv
 from app.configs.supabase import supabase_client
+from app.configs.chunking import ChunkingConfig
+from app.configs.embedding import EmbeddingConfig
 from app.services.supabase_service import (
     document_data_fetcher,
     supabase_storage_loader
 )
-from app.services.embedding_service import EmbeddingService
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from app.services.embedding_service import EmbeddingService, reduce_dimensions
+from app.services.chunking_service import chunker
+from app.services.model_provider import model_provider
+from app.services.vector_snapshot import vector_snapshot
+from app.services.ingestion_checkpoint import ingestion_checkpoints
 
 load_dotenv()
 
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", 100))
+EMBED_BATCH_RETRIES = int(os.getenv("INGEST_EMBED_BATCH_RETRIES", 3))
+WRITE_BATCH_SIZE = int(os.getenv("INGEST_WRITE_BATCH_SIZE", 500))
+
 
 def ingestion_pipeline(doc_id: str):
     """
     Main ingestion pipeline that processes a document for embedding generation.
     
-    Workflow:
+    Workflow (chunks and embedding batches are checkpointed, so a retry resumes where it failed):
     1. Fetch document metadata and URL from Supabase database
     2. Load document content from Supabase Storage
-    3. Chunk the document into smaller pieces
-    4. Add metadata to each chunk
-    5. Generate embeddings and store in chunk_documents table
+    3. Chunk the document by structure and token count, and add metadata
+    4. Generate embeddings in batches
+    5. Upsert chunks into chunk_documents (idempotent on document_id, ingest_hash, chunk_index)
     
     Args:
         doc_id: Document UUID as string
@@ -29,6 +42,7 @@ def ingestion_pipeline(doc_id: str):
         Dict with keys:
             - success: bool indicating success/failure
             - chunks_processed: int (if successful)
+            - ingest_hash: str (if successful)
             - error: str (if failed)
     """
     try:
@@ -38,65 +52,158 @@ def ingestion_pipeline(doc_id: str):
         )
 
         print(f"Loading document from: {doc_access_url}")
-        document = supabase_storage_loader.load_from_supabase_url(doc_access_url)
+        temp_file_path, content_hash = supabase_storage_loader.download(doc_access_url)
+        try:
+            ingest_hash = _ingest_hash(content_hash, doc_metadata)
+            # Checkpoints from older content or settings can't be resumed
+            ingestion_checkpoints.clear(doc_id, keep_hash=ingest_hash)
+            chunks = _chunk_stage(doc_id, ingest_hash, doc_metadata, temp_file_path, doc_access_url)
+        finally:
+            os.unlink(temp_file_path)
 
-        print("Chunking document")
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=900, 
-            chunk_overlap=200
-        )
-        chunks = text_splitter.split_documents(document)
-        print(f"Chunks: {len(chunks)}")
-
-        print("Adding metadata to each chunk")
-        for i, chunk in enumerate(chunks):
-            original_content = chunk.page_content
-            custom_text = f'[This content is from the {doc_metadata.get("title", "")}] - {original_content}'
-            chunk.page_content = custom_text
-
-            chunk.metadata.update(
-                {
-                    "document_id": doc_id,
-                    "chunk_index": i,
-                    "title": doc_metadata.get("title", ""),
-                    "source_type": doc_metadata.get("source_type", ""),
-                    "source_path": doc_metadata.get("source_path", ""),
-                }
-            )
-        print("Metadata added to each chunk")
-
-        # Initialize embedding service based on LLM_PROVIDER env var
-        embedding_service = EmbeddingService()
-        embeddings = embedding_service.get_embeddings()
-
-        print("Generating embeddings for chunks")
-        # Batch generate embeddings for all chunks at once (more efficient)
-        chunk_texts = [chunk.page_content for chunk in chunks]
-        embedding_vectors = embeddings.embed_documents(chunk_texts)
-        
-        # Prepare rows for manual insertion to ensure document_id is populated
-        rows_to_insert = []
-        for i, chunk in enumerate(chunks):
-            # Prepare row with explicit document_id field
-            row = {
-                "content": chunk.page_content,
-                "embedding": embedding_vectors[i],
-                "metadata": chunk.metadata,
-                "document_id": doc_id  # Explicitly set document_id from function parameter
-            }
-            rows_to_insert.append(row)
+        embedding_vectors = _embed_stage(doc_id, ingest_hash, chunks)
+        inserted_rows = _write_stage(doc_id, ingest_hash, chunks, embedding_vectors)
 
-        print(f"Inserting {len(rows_to_insert)} chunks into chunk_documents table")
-        # Insert all chunks in batch
-        result = supabase_client.table("chunk_documents").insert(rows_to_insert).execute()
-        
-        if not result.data:
-            raise Exception("Failed to insert chunks into database")
+        if vector_snapshot.enabled:
+            # Upserted rows come back in request order, aligned with embedding_vectors
+            try:
+                vector_snapshot.append_rows(
+                    [row["id"] for row in inserted_rows],
+                    [doc_id] * len(inserted_rows),
+                    embedding_vectors
+                )
+            except Exception as e:
+                print(f"Error appending to vector snapshot (re-export to resync): {e}")
 
+        ingestion_checkpoints.clear(doc_id)
         print(f"Successfully processed {len(chunks)} chunks for document {doc_id}")
-        return {"success": True, "chunks_processed": len(chunks)}
+        return {"success": True, "chunks_processed": len(chunks), "ingest_hash": ingest_hash}
 
     except Exception as e:
         error_msg = str(e)
         print(f"Error in ingestion pipeline: {error_msg}")
         return {"success": False, "error": error_msg}
+
+
+def _ingest_hash(content_hash: str, doc_metadata: Dict[str, Any]) -> str:
+    """Identify one ingestion of a document: same source, metadata and settings give the same rows."""
+    key = json.dumps(
+        [
+            content_hash,
+            doc_metadata,
+            ChunkingConfig.chunk_tokens,
+            ChunkingConfig.chunk_overlap_tokens,
+            model_provider.embed_model_name,
+            EmbeddingConfig.output_dimensionality,
+        ],
+        sort_keys=True
+    )
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def _chunk_stage(
+    doc_id: str,
+    ingest_hash: str,
+    doc_metadata: Dict[str, Any],
+    file_path: str,
+    url: str
+) -> List[Dict[str, Any]]:
+    chunks = ingestion_checkpoints.load_chunks(doc_id, ingest_hash)
+    if chunks is not None:
+        print(f"Resuming from checkpoint: {len(chunks)} chunks already split")
+        return chunks
+
+    print("Chunking document")
+    # Sections are yielded lazily by the format-specific loader and consumed by the splitter
+    document = supabase_storage_loader.iter_from_file(file_path, url)
+    # Title prefix is added by the chunker so it counts against the token budget
+    title_prefix = f'[This content is from the {doc_metadata.get("title", "")}] - '
+    split_chunks = chunker.split_documents(document, prefix=title_prefix)
+    print(f"Chunks: {len(split_chunks)}")
+
+    print("Adding metadata to each chunk")
+    chunks = []
+    for i, chunk in enumerate(split_chunks):
+        chunk.metadata.update(
+            {
+                "document_id": doc_id,
+                "chunk_index": i,
+                "title": doc_metadata.get("title", ""),
+                "source_type": doc_metadata.get("source_type", ""),
+                "source_path": doc_metadata.get("source_path", ""),
+            }
+        )
+        chunks.append({"content": chunk.page_content, "metadata": chunk.metadata})
+    print("Metadata added to each chunk")
+
+    ingestion_checkpoints.save_chunks(doc_id, ingest_hash, chunks)
+    return chunks
+
+
+def _embed_stage(doc_id: str, ingest_hash: str, chunks: List[Dict[str, Any]]) -> List[List[float]]:
+    # Shared embeddings client (provider chosen by LLM_PROVIDER)
+    embeddings = EmbeddingService().get_embeddings()
+
+    print("Generating embeddings for chunks")
+    vectors: List[List[float]] = []
+    resumed = 0
+    for index, start in enumerate(range(0, len(chunks), EMBED_BATCH_SIZE)):
+        texts = [chunk["content"] for chunk in chunks[start:start + EMBED_BATCH_SIZE]]
+        batch = ingestion_checkpoints.load_embedding_batch(doc_id, ingest_hash, index, len(texts))
+        if batch is None:
+            batch = _embed_batch(embeddings, texts, index)
+            ingestion_checkpoints.save_embedding_batch(doc_id, ingest_hash, index, batch)
+        else:
+            resumed += 1
+        vectors.extend(batch)
+
+    if resumed:
+        print(f"Resumed {resumed} embedding batches from checkpoint")
+    return vectors
+
+
+def _embed_batch(embeddings, texts: List[str], index: int) -> List[List[float]]:
+    """Embed one batch, retrying only this batch on failure."""
+    for attempt in range(EMBED_BATCH_RETRIES + 1):
+        try:
+            return [reduce_dimensions(vector) for vector in embeddings.embed_documents(texts)]
+        except Exception as e:
+            if attempt == EMBED_BATCH_RETRIES:
+                raise
+            delay = min(30, 2 ** attempt)
+            print(f"Embedding batch {index} failed ({e}); retrying in {delay}s")
+            time.sleep(delay)
+
+
+def _write_stage(
+    doc_id: str,
+    ingest_hash: str,
+    chunks: List[Dict[str, Any]],
+    embedding_vectors: List[List[float]]
+) -> List[Dict[str, Any]]:
+    rows_to_upsert = [
+        {
+            "content": chunk["content"],
+            "embedding": embedding_vectors[i],
+            "metadata": chunk["metadata"],
+            "document_id": doc_id,  # Explicitly set document_id from function parameter
+            "chunk_index": i,
+            "ingest_hash": ingest_hash,
+        }
+        for i, chunk in enumerate(chunks)
+    ]
+
+    print(f"Upserting {len(rows_to_upsert)} chunks into chunk_documents table")
+    written = []
+    for start in range(0, len(rows_to_upsert), WRITE_BATCH_SIZE):
+        # Idempotent: a retried batch updates the rows it already wrote
+        result = (
+            supabase_client.table("chunk_documents")
+            .upsert(rows_to_upsert[start:start + WRITE_BATCH_SIZE], on_conflict="document_id,ingest_hash,chunk_index")
+            .execute()
+        )
+        if not result.data:
+            raise Exception("Failed to insert chunks into database")
+        written.extend(result.data)
+
+    return written
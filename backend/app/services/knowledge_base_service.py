@@ -0,0 +1,146 @@
+import os
+import json
+from typing import Any, Dict, Iterable, List, Optional
+from dotenv import load_dotenv
+from app.configs.redis import redis_client
+from app.services.redis_service import redis_service
+
+load_dotenv()
+
+KB_VERSION_KEY = "kb:version"
+KB_DOCUMENT_VERSIONS_KEY = "kb:document_versions"
+KB_INDEXED_DOCUMENTS_KEY = "kb:indexed_documents"
+KB_LAST_ADDITION_KEY = "kb:last_addition_version"
+
+
+class KnowledgeBaseService:
+    """
+    Knowledge-base versioning for cache invalidation.
+
+    A monotonically increasing KB version is bumped whenever a document is
+    ingested, re-indexed or deleted, and the version of that change is recorded
+    per document. Cached answers store the KB version they were built at and
+    the document_ids they used; an entry is stale only if one of *its*
+    documents changed after it was cached, so an update invalidates just the
+    affected entries and cache TTLs can be long. Adding a document the KB
+    doesn't have yet retires every entry (any question may now be answered
+    from it), and entries built from no documents (no retrieval, or nothing
+    relevant found) are stale after any change.
+    """
+
+    def __init__(self):
+        self.client = redis_client
+        # When true, ingesting any document also retires every shared answer, so
+        # cached answers can't miss content from newly added documents
+        self.full_invalidation_on_ingest = os.getenv("KB_FULL_INVALIDATION_ON_INGEST", "false").strip().lower() == "true"
+
+    async def get_version(self) -> int:
+        try:
+            return int(await self.client.get(KB_VERSION_KEY) or 0)
+        except Exception as e:
+            print(f"Error reading KB version: {e}")
+            return 0
+
+    async def document_changed(self, document_id: str, removed: bool = False) -> int:
+        """
+        Bump the KB version and mark a document as changed at that version.
+
+        Args:
+            removed: The document's chunks were deleted (otherwise it was ingested or re-indexed)
+        """
+        try:
+            version = await self.client.incr(KB_VERSION_KEY)
+            await self.client.hset(KB_DOCUMENT_VERSIONS_KEY, document_id, version)
+            if removed:
+                await self.client.srem(KB_INDEXED_DOCUMENTS_KEY, document_id)
+            elif await self.client.sadd(KB_INDEXED_DOCUMENTS_KEY, document_id):
+                # A new document can answer questions cached from other documents
+                await self.client.set(KB_LAST_ADDITION_KEY, version)
+                print(f"KB version bumped to {version} for new document {document_id}")
+                return version
+            print(f"KB version bumped to {version} for document {document_id}")
+            return version
+        except Exception as e:
+            print(f"Error bumping KB version: {e}")
+            return 0
+
+    async def get_cached(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Read a KB-aware cache entry.
+
+        Returns:
+            Dict with answer, document_ids, kb_version and sources, or None if missing or stale
+        """
+        raw = await redis_service.get_cache(key)
+        if not raw:
+            return None
+        try:
+            entry = json.loads(raw)
+            if not isinstance(entry, dict) or "answer" not in entry:
+                return None
+        except (TypeError, ValueError):
+            # Entries written before KB versioning carry no provenance
+            return None
+
+        try:
+            fresh = await self._is_fresh(entry)
+        except Exception as e:
+            # Can't prove the entry is current: treat it as a miss
+            print(f"Error checking cache entry freshness: {e}")
+            return None
+        if not fresh:
+            print(f"Cache entry stale (knowledge base changed since version {entry.get('kb_version')}): {key}")
+            await self.client.delete(key)
+            return None
+        return entry
+
+    async def set_cached(
+        self,
+        key: str,
+        answer: str,
+        document_ids: Iterable[str],
+        kb_version: int,
+        expire: Optional[int] = None,
+        sources: Optional[List[Dict[str, Any]]] = None
+    ):
+        """
+        Write a KB-aware cache entry.
+
+        Args:
+            kb_version: KB version read *before* retrieval, so a change that
+                lands while the answer is being generated still invalidates it
+            sources: Optional provenance (chunk ids and scores) returned with cache hits
+        """
+        entry = {
+            "answer": answer,
+            "document_ids": sorted({str(d) for d in document_ids if d}),
+            "kb_version": kb_version,
+            "sources": sources or [],
+        }
+        await redis_service.set_cache(key, json.dumps(entry), expire=expire)
+
+    def document_ids_from_chunks(self, chunks: List[Dict[str, Any]]) -> List[str]:
+        """Collect the document_ids behind a list of retrieved chunks."""
+        document_ids = set()
+        for chunk in chunks:
+            document_id = chunk.get("document_id") or (chunk.get("metadata") or {}).get("document_id")
+            if document_id:
+                document_ids.add(str(document_id))
+        return sorted(document_ids)
+
+    async def _is_fresh(self, entry: Dict[str, Any]) -> bool:
+        """Raises if the versions can't be read; callers treat that as a miss."""
+        entry_version = int(entry.get("kb_version") or 0)
+        document_ids = entry.get("document_ids") or []
+        if not document_ids:
+            return int(await self.client.get(KB_VERSION_KEY) or 0) <= entry_version
+        pipe = self.client.pipeline(transaction=False)
+        pipe.get(KB_LAST_ADDITION_KEY)
+        pipe.hmget(KB_DOCUMENT_VERSIONS_KEY, document_ids)
+        last_addition, versions = await pipe.execute()
+        if int(last_addition or 0) > entry_version:
+            return False
+        return all(int(version or 0) <= entry_version for version in versions)
+
+
+knowledge_base_service = KnowledgeBaseService()
@@ -0,0 +1,365 @@
+import os
+import asyncio
+import random
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Absolute time.monotonic() deadline for the current request, if any
+_deadline: ContextVar[Optional[float]] = ContextVar("model_call_deadline", default=None)
+
+# Transient errors worth retrying (google.api_core and builtin names, matched by class name
+# so wrapped SDK errors are recognized without importing every client library here)
+RETRYABLE_ERROR_NAMES = {
+    "TimeoutError",
+    "ResourceExhausted",
+    "TooManyRequests",
+    "ServiceUnavailable",
+    "DeadlineExceeded",
+    "InternalServerError",
+    "Aborted",
+    "RetryError",
+    "ConnectionError",
+    "ConnectionResetError",
+}
+
+
+class ModelCallError(Exception):
+    """Raised when a model call fails after retries or is rejected by the circuit breaker."""
+
+
+class CircuitOpenError(ModelCallError):
+    """Raised without calling the model while a call's circuit breaker is open."""
+
+
+class DeadlineExceededError(ModelCallError):
+    """Raised when the request deadline leaves no time for another attempt."""
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    Opens after `failure_threshold` consecutive failures, rejects calls for
+    `cooldown` seconds, then lets a single trial call through (half-open).
+    """
+
+    def __init__(self, failure_threshold: int, cooldown: float):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self.trial_in_flight:
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.consecutive_failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.consecutive_failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def release_trial(self):
+        """Give up a half-open trial without an outcome (e.g. the caller was cancelled)."""
+        self.trial_in_flight = False
+
+
+class CallMetrics:
+    """Per-call-name counters and a rolling latency window."""
+
+    def __init__(self, window: int = 200):
+        self.counters: Dict[str, int] = {
+            "calls": 0,
+            "successes": 0,
+            "failures": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+            "circuit_rejections": 0,
+        }
+        self.latencies: Deque[float] = deque(maxlen=window)
+
+    def percentile(self, p: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.counters,
+            "p50_ms": self._ms(self.percentile(0.50)),
+            "p95_ms": self._ms(self.percentile(0.95)),
+            "p99_ms": self._ms(self.percentile(0.99)),
+        }
+
+    def _ms(self, seconds: Optional[float]) -> Optional[float]:
+        return round(seconds * 1000, 1) if seconds is not None else None
+
+
+class ModelCallService:
+    """
+    Wrapper for every Vertex AI call: per-attempt timeouts bounded by the
+    request deadline, jittered retries on retryable errors, optional hedged
+    second requests, a circuit breaker per call name, and metrics.
+    """
+
+    def __init__(self):
+        self.default_timeout = float(os.getenv("MODEL_CALL_TIMEOUT", 30))
+        self.max_retries = int(os.getenv("MODEL_CALL_RETRIES", 2))
+        self.backoff_base = float(os.getenv("MODEL_CALL_BACKOFF_BASE", 0.25))
+        self.backoff_max = float(os.getenv("MODEL_CALL_BACKOFF_MAX", 4.0))
+        self.default_hedge_delay = float(os.getenv("MODEL_HEDGE_DELAY", 1.0))
+        self.hedge_min_samples = int(os.getenv("MODEL_HEDGE_MIN_SAMPLES", 20))
+        self.breaker_threshold = int(os.getenv("MODEL_BREAKER_THRESHOLD", 5))
+        self.breaker_cooldown = float(os.getenv("MODEL_BREAKER_COOLDOWN", 30))
+
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._metrics: Dict[str, CallMetrics] = {}
+
+    @contextmanager
+    def deadline(self, seconds: float):
+        """
+        Bound every model call made inside this block (in the current task) to
+        finish within `seconds`. Nested scopes can only shorten the deadline.
+        """
+        new_deadline = time.monotonic() + seconds
+        current = _deadline.get()
+        token = _deadline.set(min(current, new_deadline) if current else new_deadline)
+        try:
+            yield
+        finally:
+            _deadline.reset(token)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the current deadline, or None if unbounded."""
+        deadline = _deadline.get()
+        return None if deadline is None else deadline - time.monotonic()
+
+    def is_available(self, name: str) -> bool:
+        """Whether the circuit for `name` currently accepts calls."""
+        return self._breaker(name).state != "open"
+
+    def acquire(self, name: str) -> bool:
+        """
+        Pass the circuit breaker for `name` (claiming the single half-open
+        trial if that's the state). Calls made outside call() must report the
+        outcome with record() and then call release().
+
+        Returns:
+            Whether this call is the half-open trial
+
+        Raises:
+            CircuitOpenError: If the circuit doesn't accept the call
+        """
+        breaker = self._breaker(name)
+        is_trial = breaker.state == "half_open"
+        if not breaker.allow():
+            self._metric(name).counters["circuit_rejections"] += 1
+            raise CircuitOpenError(f"Circuit open for {name}")
+        return is_trial
+
+    def release(self, name: str, is_trial: bool):
+        """Give back a half-open trial that ended without an outcome (e.g. cancelled)."""
+        breaker = self._breaker(name)
+        if is_trial and breaker.trial_in_flight:
+            breaker.release_trial()
+
+    async def call(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None,
+        retries: Optional[int] = None,
+        hedge: bool = False
+    ) -> Any:
+        """
+        Run a model call with resilience policies.
+
+        Args:
+            name: Call name used for metrics and the circuit breaker (e.g. "embedding")
+            fn: Zero-argument function returning a fresh awaitable per attempt
+            timeout: Per-attempt timeout in seconds (defaults to MODEL_CALL_TIMEOUT)
+            retries: Retries after the first attempt (defaults to MODEL_CALL_RETRIES)
+            hedge: Start a duplicate request if the first is slower than the recent p95
+
+        Raises:
+            CircuitOpenError, DeadlineExceededError or ModelCallError
+        """
+        self._metric(name).counters["calls"] += 1
+        is_trial = self.acquire(name)
+        try:
+            return await self._call_with_retries(name, fn, timeout, retries, hedge)
+        finally:
+            # Cancellation records no outcome; don't leave the half-open trial claimed
+            self.release(name, is_trial)
+
+    async def _call_with_retries(
+        self,
+        name: str,
+        fn: Callable[[], Awaitable[Any]],
+        timeout: Optional[float],
+        retries: Optional[int],
+        hedge: bool
+    ) -> Any:
+        metrics = self._metric(name)
+        breaker = self._breaker(name)
+        retries = self.max_retries if retries is None else retries
+        last_error: Optional[BaseException] = None
+
+        for attempt in range(retries + 1):
+            attempt_timeout = self._attempt_timeout(timeout)
+            if attempt_timeout <= 0:
+                last_error = DeadlineExceededError(f"Deadline exceeded before {name} attempt {attempt + 1}")
+                break
+
+            started = time.monotonic()
+            try:
+                if hedge:
+                    result = await self._hedged(name, fn, attempt_timeout)
+                else:
+                    result = await asyncio.wait_for(fn(), timeout=attempt_timeout)
+                metrics.latencies.append(time.monotonic() - started)
+                metrics.counters["successes"] += 1
+                breaker.record_success()
+                return result
+            except Exception as e:
+                last_error = e
+                if isinstance(e, asyncio.TimeoutError):
+                    metrics.counters["timeouts"] += 1
+                if not self._is_retryable(e) or attempt == retries:
+                    break
+
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+                remaining = self.remaining()
+                if remaining is not None and remaining <= delay:
+                    break
+                metrics.counters["retries"] += 1
+                print(f"Retrying {name} after {type(e).__name__} (attempt {attempt + 1}, backoff {delay:.2f}s)")
+                await asyncio.sleep(delay)
+
+        metrics.counters["failures"] += 1
+        # Only transient errors say the model is unhealthy; a bad request (or running
+        # out of deadline before an attempt) shouldn't open the circuit for other calls
+        if self._is_retryable(last_error):
+            breaker.record_failure()
+        if breaker.state != "closed":
+            print(f"Circuit breaker for {name} is {breaker.state}")
+        raise ModelCallError(f"{name} failed: {type(last_error).__name__}: {last_error}") from last_error
+
+    def record(
+        self,
+        name: str,
+        success: bool,
+        latency: Optional[float] = None,
+        error: Optional[BaseException] = None
+    ):
+        """
+        Record the outcome of a call made outside call() (e.g. a streamed
+        generation) in the metrics and circuit breaker for `name`. A failure
+        with a non-transient `error` is counted but doesn't trip the breaker.
+        """
+        metrics = self._metric(name)
+        breaker = self._breaker(name)
+        metrics.counters["calls"] += 1
+        if success:
+            if latency is not None:
+                metrics.latencies.append(latency)
+            metrics.counters["successes"] += 1
+            breaker.record_success()
+        else:
+            metrics.counters["failures"] += 1
+            if error is None or self._is_retryable(error):
+                breaker.record_failure()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Metrics and circuit state for every call name seen so far."""
+        return {
+            name: {**metrics.snapshot(), "circuit": self._breaker(name).state}
+            for name, metrics in self._metrics.items()
+        }
+
+    async def _hedged(self, name: str, fn: Callable[[], Awaitable[Any]], timeout: float) -> Any:
+        """Run fn(); if it hasn't finished by the hedge delay, race a second fn()."""
+        metrics = self._metric(name)
+        hedge_delay = self._hedge_delay(metrics)
+        primary = asyncio.ensure_future(fn())
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=min(hedge_delay, timeout))
+            if not done:
+                metrics.counters["hedges"] += 1
+                tasks.append(asyncio.ensure_future(fn()))
+
+            end = time.monotonic() + max(0.0, timeout - hedge_delay) if not done else None
+            while True:
+                for task in [t for t in tasks if t.done()]:
+                    if task.exception() is None:
+                        if task is not primary:
+                            metrics.counters["hedge_wins"] += 1
+                        return task.result()
+                    tasks.remove(task)
+                    if not tasks:
+                        raise task.exception()
+                wait_timeout = None if end is None else max(0.0, end - time.monotonic())
+                done, _ = await asyncio.wait(tasks, timeout=wait_timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def _hedge_delay(self, metrics: CallMetrics) -> float:
+        if len(metrics.latencies) >= self.hedge_min_samples:
+            return metrics.percentile(0.95)
+        return self.default_hedge_delay
+
+    def _attempt_timeout(self, timeout: Optional[float]) -> float:
+        attempt_timeout = timeout or self.default_timeout
+        remaining = self.remaining()
+        return attempt_timeout if remaining is None else min(attempt_timeout, remaining)
+
+    def _is_retryable(self, error: BaseException) -> bool:
+        if isinstance(error, asyncio.TimeoutError):
+            return True
+        return any(cls.__name__ in RETRYABLE_ERROR_NAMES for cls in type(error).__mro__)
+
+    def _breaker(self, name: str) -> CircuitBreaker:
+        if name not in self._breakers:
+            self._breakers[name] = CircuitBreaker(self.breaker_threshold, self.breaker_cooldown)
+        return self._breakers[name]
+
+    def _metric(self, name: str) -> CallMetrics:
+        if name not in self._metrics:
+            self._metrics[name] = CallMetrics()
+        return self._metrics[name]
+
+
+model_call_service = ModelCallService()
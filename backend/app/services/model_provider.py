@@ -0,0 +1,162 @@
+import os
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class ModelProvider:
+    """
+    Builds chat and embedding clients for the configured provider, shared by
+    ingestion and chat so both always embed with the same model.
+
+    Provider is selected via LLM_PROVIDER env var:
+    - "vertex": Uses Vertex AI with service account / application default credentials
+    - "google_ai_studio": Uses Google AI Studio with API key
+
+    Chat models come in two tiers:
+    - "standard": VERTEX_CHAT_MODEL / GOOGLE_CHAT_MODEL, used for retrieval-heavy answers
+    - "fast": FAST_CHAT_MODEL, a smaller model for greetings, follow-ups and summarization
+      (only when set; otherwise the fast tier uses the standard model)
+    """
+
+    TIERS = ("standard", "fast")
+
+    def __init__(self):
+        self.provider = os.getenv("LLM_PROVIDER", "vertex").strip().lower()
+
+        if self.provider == "vertex":
+            self.project = os.getenv("GOOGLE_CLOUD_PROJECT")
+            self.location = os.getenv("GOOGLE_CLOUD_REGION", "us-central1")
+            self.chat_model_name = os.getenv("VERTEX_CHAT_MODEL", "gemini-1.5-flash").strip()
+            self.embed_model_name = os.getenv("VERTEX_EMBED_MODEL", "text-embedding-004").strip()
+        elif self.provider == "google_ai_studio":
+            self.api_key = os.getenv("GOOGLE_API_KEY")
+            self.chat_model_name = os.getenv("GOOGLE_CHAT_MODEL", "gemini-1.5-flash").strip()
+            self.embed_model_name = os.getenv("GOOGLE_EMBED_MODEL", "text-embedding-004").strip()
+        else:
+            raise ValueError(
+                f'Invalid LLM_PROVIDER="{self.provider}". Must be "vertex" or "google_ai_studio".'
+            )
+
+        # No default: the fast model must be enabled for the project/region explicitly
+        self.fast_chat_model_name = os.getenv("FAST_CHAT_MODEL", "").strip() or None
+        self._chat_models: Dict[str, object] = {}
+        self._embeddings: Dict[str, object] = {}
+
+    @property
+    def supports_context_cache(self) -> bool:
+        """Vertex AI context caching is only available on the Vertex provider."""
+        return self.provider == "vertex"
+
+    def model_name_for(self, tier: str) -> str:
+        if tier == "fast" and self.fast_chat_model_name:
+            return self.fast_chat_model_name
+        return self.chat_model_name
+
+    def get_chat_model(self, tier: str = "standard", cached_content: Optional[str] = None):
+        """
+        Get a chat model for a tier. Models without cached content are reused.
+
+        Args:
+            tier: "standard" or "fast"
+            cached_content: Vertex AI context cache ID (standard tier only)
+        """
+        model_name = self.model_name_for(tier)
+        if cached_content:
+            return self._build_chat_model(model_name, cached_content)
+
+        if model_name not in self._chat_models:
+            self._chat_models[model_name] = self._build_chat_model(model_name)
+        return self._chat_models[model_name]
+
+    def get_embeddings(self, purpose: str = "document"):
+        """
+        Get the embeddings client.
+
+        Args:
+            purpose: "document" for ingestion or "query" for chat-time search
+        """
+        if purpose not in self._embeddings:
+            if self.provider == "vertex":
+                self._embeddings[purpose] = self._init_vertex_embeddings()
+            else:
+                self._embeddings[purpose] = self._init_google_ai_studio_embeddings(purpose)
+        return self._embeddings[purpose]
+
+    def _build_chat_model(self, model_name: str, cached_content: Optional[str] = None):
+        if self.provider == "vertex":
+            try:
+                from langchain_google_vertexai import ChatVertexAI
+            except ImportError:
+                raise ImportError(
+                    "langchain-google-vertexai is required for Vertex AI. "
+                    "Install it with: pip install langchain-google-vertexai"
+                )
+            kwargs = {"model_name": model_name}
+            if cached_content:
+                kwargs["cached_content"] = cached_content
+            return ChatVertexAI(**kwargs)
+
+        try:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+        except ImportError:
+            raise ImportError(
+                "langchain-google-genai is required for Google AI Studio. "
+                "Install it with: pip install langchain-google-genai"
+            )
+        return ChatGoogleGenerativeAI(model=model_name, google_api_key=self.api_key)
+
+    def _init_vertex_embeddings(self):
+        """Initialize Vertex AI embeddings."""
+
+        print("Initializing Vertex AI embeddings")
+
+        if not self.project:
+            raise ValueError("GOOGLE_CLOUD_PROJECT is required for Vertex AI")
+        if not self.location:
+            raise ValueError("GOOGLE_CLOUD_REGION is required for Vertex AI")
+
+        try:
+            from langchain_google_vertexai import VertexAIEmbeddings
+        except ImportError:
+            raise ImportError(
+                "langchain-google-vertexai is required for Vertex AI. "
+                "Install it with: pip install langchain-google-vertexai"
+            )
+
+        # Task type is chosen per call (embed_documents vs embed_query)
+        return VertexAIEmbeddings(
+            model_name=self.embed_model_name,
+            project=self.project,
+            location=self.location,
+        )
+
+    def _init_google_ai_studio_embeddings(self, purpose: str):
+        """Initialize Google AI Studio embeddings with API key authentication."""
+
+        print("Initializing Google AI Studio embeddings")
+
+        if not self.api_key:
+            raise ValueError("GOOGLE_API_KEY is required for Google AI Studio")
+
+        embed_model = self.embed_model_name
+        if not embed_model.startswith("models/"):
+            embed_model = f"models/{embed_model}"
+
+        try:
+            from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        except ImportError:
+            raise ImportError(
+                "langchain-google-genai is required for Google AI Studio. "
+                "Install it with: pip install langchain-google-genai"
+            )
+
+        return GoogleGenerativeAIEmbeddings(
+            model=embed_model,
+            google_api_key=self.api_key,
+            task_type="RETRIEVAL_QUERY" if purpose == "query" else "RETRIEVAL_DOCUMENT",
+        )
+
+
+model_provider = ModelProvider()
@@ -0,0 +1,75 @@
+import os
+import re
+from typing import Dict
+from dotenv import load_dotenv
+from app.services.model_provider import model_provider
+
+load_dotenv()
+
+GREETING = re.compile(
+    r"^(hi|hii+|hello|hey|hiya|yo|greetings|good (morning|afternoon|evening)|"
+    r"thanks|thank you|thx|cheers|ok|okay|cool|great|nice|awesome|bye|goodbye|see you)"
+    r"( there| so much| a lot| again)?[\s!.,?:)]*$",
+    re.IGNORECASE
+)
+FOLLOW_UP = re.compile(
+    r"^(and|also|what about|how about|why|how so|really|tell me more|more|go on|"
+    r"can you elaborate|elaborate|explain|such as|for example|which one|what else)\b",
+    re.IGNORECASE
+)
+
+
+class ModelRouter:
+    """
+    Picks a model tier (and whether retrieval is needed) for each message.
+
+    - Greetings and acknowledgements -> fast tier, no retrieval
+    - Short follow-ups in an ongoing conversation -> fast tier, with retrieval
+    - Summarization tasks -> fast tier
+    - Everything else -> standard tier, with retrieval
+
+    Without FAST_CHAT_MODEL there is no fast tier: the same messages are
+    still routed (e.g. greetings skip retrieval) but on the standard model.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("MODEL_ROUTING_ENABLED", "true").strip().lower() == "true"
+        self.follow_up_max_words = int(os.getenv("FAST_ROUTE_MAX_WORDS", 8))
+        self.fast_tier = model_provider.fast_chat_model_name is not None
+
+    def route(self, user_query: str, has_history: bool) -> Dict:
+        """
+        Route a chat message.
+
+        Returns:
+            Dict with tier ("fast" or "standard"), use_retrieval and reason
+        """
+        if not self.enabled:
+            decision = self._decision("standard", True, "routing disabled")
+        else:
+            query = user_query.strip()
+            word_count = len(query.split())
+
+            if GREETING.match(query):
+                decision = self._decision("fast", False, "greeting")
+            elif has_history and word_count <= self.follow_up_max_words and FOLLOW_UP.match(query):
+                decision = self._decision("fast", True, "short follow-up")
+            else:
+                decision = self._decision("standard", True, "retrieval answer")
+
+        print(f"Model route: tier={decision['tier']}, retrieval={decision['use_retrieval']}, reason={decision['reason']}")
+        return decision
+
+    def route_task(self, task: str) -> str:
+        """Tier for an internal task such as "summarize"."""
+        tier = "fast" if self.enabled and self.fast_tier and task == "summarize" else "standard"
+        print(f"Model route: task={task}, tier={tier}")
+        return tier
+
+    def _decision(self, tier: str, use_retrieval: bool, reason: str) -> Dict:
+        if tier == "fast" and not self.fast_tier:
+            tier = "standard"
+        return {"tier": tier, "use_retrieval": use_retrieval, "reason": reason}
+
+
+model_router = ModelRouter()
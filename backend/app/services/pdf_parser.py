@@ -0,0 +1,84 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+from langchain_core.documents import Document
+from pypdf import PdfReader
+
+load_dotenv()
+
+
+def _extract_page_range(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """
+    Extract text for pages [start, end) of a PDF.
+
+    Runs inside a worker process, so it opens its own reader instead of
+    receiving one from the parent.
+    """
+    reader = PdfReader(file_path)
+    return [(page_number, reader.pages[page_number].extract_text() or "") for page_number in range(start, end)]
+
+
+class ParallelPDFParser:
+    """
+    Parse PDFs page by page across a process pool.
+
+    Pages are split into contiguous ranges of PDF_PAGES_PER_TASK pages and
+    farmed out to PDF_PARSE_WORKERS processes. Results are yielded in page
+    order as soon as each range completes, so callers can start chunking
+    before the whole file is parsed.
+    """
+
+    def __init__(self):
+        self.max_workers = int(os.getenv("PDF_PARSE_WORKERS", os.cpu_count() or 1))
+        self.pages_per_task = max(1, int(os.getenv("PDF_PAGES_PER_TASK", 8)))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Lazily create the worker pool so importing this module stays cheap."""
+        if self._executor is None:
+            # spawn avoids forking a parent that holds gRPC/HTTP client threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def iter_pages(self, file_path: str, source: Optional[str] = None) -> Iterator[Document]:
+        """
+        Yield one Document per page, in order.
+
+        Args:
+            file_path: Local path to the PDF
+            source: Value stored as the 'source' metadata (defaults to file_path)
+        """
+        source = source or file_path
+        total_pages = len(PdfReader(file_path).pages)
+        starts = list(range(0, total_pages, self.pages_per_task))
+        ends = [min(start + self.pages_per_task, total_pages) for start in starts]
+
+        if self.max_workers <= 1 or len(starts) <= 1:
+            page_batches = map(_extract_page_range, repeat(file_path), starts, ends)
+        else:
+            print(f"Parsing {total_pages} PDF pages in {len(starts)} ranges across {self.max_workers} workers")
+            page_batches = self._get_executor().map(_extract_page_range, repeat(file_path), starts, ends)
+
+        for page_batch in page_batches:
+            for page_number, text in page_batch:
+                yield Document(
+                    page_content=text,
+                    metadata={
+                        "source": source,
+                        "page": page_number,
+                        "total_pages": total_pages,
+                    },
+                )
+
+    def load(self, file_path: str, source: Optional[str] = None) -> List[Document]:
+        """Parse the whole PDF and return its pages as a list."""
+        return list(self.iter_pages(file_path, source))
+
+
+pdf_parser = ParallelPDFParser()
@@ -0,0 +1,124 @@
+import os
+import json
+from difflib import SequenceMatcher
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from app.services.redis_service import redis_service
+from app.services.rag_service import rag_service
+from app.services.vectorstore_service import vectorstore_service
+from app.services.model_router import model_router
+from app.services.answer_cache_service import normalize_query
+
+load_dotenv()
+
+
+class PrefetchService:
+    """
+    Speculative retrieval while the user is typing.
+
+    The chat widget sends the debounced partial query; the embedding, the
+    retrieved chunks and the resolved prompt/context cache are stored in a
+    short-lived per-conversation slot in Redis. process_chat takes the slot
+    when the final query matches the prefetched one closely enough
+    (PREFETCH_MATCH_RATIO), so retrieval latency is hidden behind typing time.
+    """
+
+    def __init__(self):
+        self.ttl = int(os.getenv("PREFETCH_TTL", 30))
+        self.match_ratio = float(os.getenv("PREFETCH_MATCH_RATIO", 0.9))
+        self.min_chars = int(os.getenv("PREFETCH_MIN_CHARS", 12))
+        # Prefetches cost an embedding call, so each client gets its own budget
+        self.rate_per_minute = int(os.getenv("PREFETCH_RATE_PER_MINUTE", 60))
+
+    async def prefetch(
+        self,
+        conversation_id: str,
+        partial_query: str,
+        filters: Optional[Dict[str, Any]] = None,
+        client_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Retrieve for a partial query into the conversation's prefetch slot.
+
+        Returns:
+            Dict with prefetched (bool) and chunk count or the reason it was skipped
+        """
+        normalized = normalize_query(partial_query)
+        if len(normalized) < self.min_chars:
+            return {"prefetched": False, "reason": "query too short"}
+        if not model_router.route(partial_query, has_history=False)["use_retrieval"]:
+            return {"prefetched": False, "reason": "no retrieval needed"}
+        if client_key and self.rate_per_minute > 0:
+            allowed, _ = await redis_service.consume_token(
+                f"ratelimit:prefetch:{client_key}", self.rate_per_minute, self.rate_per_minute / 60
+            )
+            if not allowed:
+                return {"prefetched": False, "reason": "rate limited"}
+
+        slot = await self._get_slot(conversation_id)
+        if slot and slot["query"] == normalized and slot["filters"] == self._filters_key(filters):
+            return {"prefetched": True, "chunks": len(slot["chunks"]), "reused": True}
+
+        # Imported here: chat_service depends on this module
+        from app.services.chat_service import chat_service
+
+        embedding = await rag_service.generate_embedding(partial_query)
+        if not embedding:
+            return {"prefetched": False, "reason": "embedding failed"}
+        chunks = await vectorstore_service.get_relevant_chunks(embedding, filters=filters)
+        prompt_context = await chat_service._resolve_prompt_and_cache()
+
+        await redis_service.set_cache(
+            self._key(conversation_id),
+            json.dumps({
+                "query": normalized,
+                "filters": self._filters_key(filters),
+                "chunks": chunks,
+                "prompt_context": prompt_context,
+            }, default=str),
+            expire=self.ttl
+        )
+        print(f"Prefetched {len(chunks)} chunks for conversation {conversation_id}")
+        return {"prefetched": True, "chunks": len(chunks), "reused": False}
+
+    async def take(
+        self,
+        conversation_id: str,
+        user_query: str,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Consume the prefetch slot if it matches the final query.
+
+        Returns:
+            Dict with chunks and prompt_context, or None on a miss
+        """
+        slot = await self._get_slot(conversation_id)
+        if not slot:
+            return None
+        await redis_service.client.delete(self._key(conversation_id))
+
+        normalized = normalize_query(user_query)
+        ratio = SequenceMatcher(None, slot["query"], normalized).ratio()
+        if slot["filters"] != self._filters_key(filters) or ratio < self.match_ratio:
+            print(f"Prefetch miss (similarity {ratio:.2f})")
+            return None
+
+        print(f"Prefetch hit (similarity {ratio:.2f}), skipping retrieval")
+        return {"chunks": slot["chunks"], "prompt_context": slot["prompt_context"]}
+
+    async def _get_slot(self, conversation_id: str) -> Optional[Dict[str, Any]]:
+        raw = await redis_service.get_cache(self._key(conversation_id))
+        try:
+            return json.loads(raw) if raw else None
+        except ValueError:
+            return None
+
+    def _key(self, conversation_id: str) -> str:
+        return f"prefetch:{conversation_id}"
+
+    def _filters_key(self, filters: Optional[Dict[str, Any]]) -> str:
+        return json.dumps(filters, sort_keys=True, default=str) if filters else ""
+
+
+prefetch_service = PrefetchService()
@@ -0,0 +1,151 @@
+import os
+import re
+import json
+import time
+import uuid
+import random
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+PROFILE_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ProfilingService:
+    """
+    Opt-in, per-request profiling of chat and ingestion.
+
+    A request is profiled when it sends the X-Profile header matching
+    PROFILING_TOKEN or is picked by PROFILE_SAMPLE_RATE. Without a token,
+    header-triggered profiling and the admin endpoints are disabled.
+    Profiles are captured with pyinstrument in async mode, so time spent
+    awaiting Redis, Supabase or Vertex shows up as await frames next to CPU
+    work (JSON parsing, context building, validation), and are written to
+    PROFILE_DIR as speedscope JSON with a small metadata sidecar.
+    Only the newest PROFILE_MAX_FILES profiles are kept.
+    """
+
+    def __init__(self):
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", 0.0))
+        self.token = os.getenv("PROFILING_TOKEN") or None
+        self.profile_dir = Path(os.getenv("PROFILE_DIR", "/tmp/turing-profiles"))
+        self.max_files = int(os.getenv("PROFILE_MAX_FILES", 100))
+        self.interval = float(os.getenv("PROFILE_INTERVAL", 0.001))
+
+    def is_authorized(self, token: Optional[str]) -> bool:
+        """Whether a caller may request profiles or read them (never if no PROFILING_TOKEN is set)."""
+        return self.token is not None and token == self.token
+
+    def should_profile(self, header_value: Optional[str]) -> Optional[str]:
+        """
+        Decide whether to profile a request.
+
+        Returns:
+            "header" or "sampled" if the request should be profiled, else None
+        """
+        if header_value and self.is_authorized(header_value.strip()):
+            return "header"
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return "sampled"
+        return None
+
+    @asynccontextmanager
+    async def profile(self, name: str, trigger: Optional[str]):
+        """
+        Profile the enclosed block if trigger is set.
+
+        Yields a dict that receives profile_id once the profile is saved
+        (empty if the block was not profiled).
+
+        Usage:
+            async with profiling_service.profile("chat", trigger) as profile:
+                ...
+            profile.get("profile_id")
+        """
+        info: Dict[str, Any] = {}
+        profiler = self._start_profiler() if trigger else None
+        if profiler is None:
+            yield info
+            return
+
+        started_wall = time.perf_counter()
+        started_cpu = time.process_time()
+        try:
+            yield info
+        finally:
+            profiler.stop()
+            metadata = {
+                "name": name,
+                "trigger": trigger,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "wall_ms": round((time.perf_counter() - started_wall) * 1000, 1),
+                # Process CPU time also includes other requests running concurrently
+                "cpu_ms": round((time.process_time() - started_cpu) * 1000, 1),
+            }
+            try:
+                info["profile_id"] = await asyncio.to_thread(self._save, profiler, metadata)
+                print(f"Saved {name} profile {info['profile_id']} ({metadata['wall_ms']} ms wall)")
+            except Exception as e:
+                print(f"Error saving profile: {e}")
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        """Metadata for stored profiles, newest first."""
+        profiles = []
+        for path in sorted(self.profile_dir.glob("*.meta.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+            try:
+                profiles.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    def get_profile_path(self, profile_id: str) -> Optional[Path]:
+        """Path of a stored speedscope profile, or None if unknown."""
+        if not PROFILE_ID_PATTERN.match(profile_id):
+            return None
+        path = self.profile_dir / f"{profile_id}.speedscope.json"
+        return path if path.exists() else None
+
+    def _start_profiler(self):
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("pyinstrument is required for profiling. Install it with: pip install pyinstrument")
+            return None
+        profiler = Profiler(interval=self.interval, async_mode="enabled")
+        try:
+            profiler.start()
+        except RuntimeError as e:
+            # pyinstrument allows one profiler per thread/async context
+            print(f"Profiling skipped: {e}")
+            return None
+        return profiler
+
+    def _save(self, profiler, metadata: Dict[str, Any]) -> str:
+        from pyinstrument.renderers import SpeedscopeRenderer
+
+        profile_id = uuid.uuid4().hex
+        metadata["profile_id"] = profile_id
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        (self.profile_dir / f"{profile_id}.speedscope.json").write_text(profiler.output(SpeedscopeRenderer()))
+        (self.profile_dir / f"{profile_id}.meta.json").write_text(json.dumps(metadata))
+        self._prune()
+        return profile_id
+
+    def _prune(self):
+        """Delete the oldest profiles beyond PROFILE_MAX_FILES."""
+        metas = sorted(self.profile_dir.glob("*.meta.json"), key=lambda p: p.stat().st_mtime, reverse=True)
+        for meta in metas[self.max_files:]:
+            profile_id = meta.name.split(".", 1)[0]
+            for path in (meta, self.profile_dir / f"{profile_id}.speedscope.json"):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+
+profiling_service = ProfilingService()
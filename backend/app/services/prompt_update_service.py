@@ -2,6 +2,7 @@ from typing import Dict, Optional
 from app.configs.supabase import supabase_client
 from app.services.rag_service import rag_service
 from app.services.cache_service import cache_service
+from app.services.corpus_cache_service import corpus_cache_service
 
 
 class PromptUpdateService:
@@ -37,6 +38,7 @@ class PromptUpdateService:
         1. Fetch the prompt template by ID
         2. Create Vertex AI context cache with the template content
         3. Save cache reference to gcp_cache table
+        4. In CAG mode, also cache the prompt together with the whole knowledge base
         
         Args:
             prompt_id: UUID of the prompt to activate
@@ -90,10 +92,19 @@ class PromptUpdateService:
             )
             
             print(f"Successfully activated prompt and created cache: {cache_name}")
+
+            # Step 4: Corpus cache for cache-augmented generation (falls back to RAG on its own)
+            message = f"Prompt '{prompt_name}' activated and cached successfully"
+            if corpus_cache_service.enabled:
+                try:
+                    corpus_state = await corpus_cache_service.rebuild(template_content, str(prompt_id))
+                    message += f" (answer mode: {corpus_state['mode']}, {corpus_state.get('reason')})"
+                except Exception as e:
+                    print(f"Error building corpus cache: {e}")
             
             return {
                 "success": True,
-                "message": f"Prompt '{prompt_name}' activated and cached successfully",
+                "message": message,
                 "cache_name": cache_name
             }
             
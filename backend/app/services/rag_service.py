@@ -1,97 +1,294 @@
 import os
 import time
-from typing import List, Optional, Any
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Any
 from datetime import timedelta
-from langchain_google_vertexai import ChatVertexAI, VertexAIEmbeddings
 from google.cloud import aiplatform
 from vertexai.preview import caching
 from dotenv import load_dotenv
+from app.services.embedding_service import reduce_dimensions
+from app.services.model_call_service import model_call_service, ModelCallError
+from app.services.model_provider import model_provider
+from app.services.usage_service import usage_service, extract_usage
 
 load_dotenv()
 
 class RAGService:
+    # Returned when generation fails on every path; callers should not cache it
+    ERROR_RESPONSE = "I apologize, but I encountered an error generating the response."
+
     def __init__(self):
-        self.project = os.getenv("GOOGLE_CLOUD_PROJECT")
-        self.location = os.getenv("GOOGLE_CLOUD_REGION", "us-central1")
-        
-        # Initialize Vertex AI
-        aiplatform.init(project=self.project, location=self.location)
+        self.model_provider = model_provider
+
+        # Initialize Vertex AI (needed for context caching)
+        if self.model_provider.supports_context_cache:
+            aiplatform.init(project=self.model_provider.project, location=self.model_provider.location)
         
-        self.chat_model_name = os.getenv("VERTEX_CHAT_MODEL", "gemini-1.5-flash")
-        self.embed_model_name = os.getenv("VERTEX_EMBED_MODEL", "text-embedding-004")
+        self.chat_model_name = self.model_provider.chat_model_name
+        # Creating a cache (up to a whole corpus for CAG) is slow and billable per cache
+        self.cache_create_timeout = float(os.getenv("CONTEXT_CACHE_CREATE_TIMEOUT", 300))
+        self.embed_model_name = self.model_provider.embed_model_name
         
-        self.embeddings_client = VertexAIEmbeddings(model_name=self.embed_model_name)
+        # Same embeddings model as ingestion, configured for query-side embedding
+        self.embeddings_client = self.model_provider.get_embeddings("query")
         # Default LLM client (without cache)
-        self.llm_client = ChatVertexAI(model_name=self.chat_model_name)
+        self.llm_client = self.model_provider.get_chat_model("standard")
 
-    async def generate_embedding(self, text: str) -> List[float]:
+    async def generate_embedding(self, text: str) -> Optional[List[float]]:
+        """Embed one query; None if the call fails (never an empty vector that looks like a result)."""
         try:
-            return await self.embeddings_client.aembed_query(text)
+            # Embeddings are cheap and idempotent, so slow calls are hedged
+            embedding = await model_call_service.call(
+                "embedding",
+                lambda: self.embeddings_client.aembed_query(text),
+                hedge=True
+            )
+            return reduce_dimensions(embedding)
         except Exception as e:
             print(f"Error generating embedding: {e}")
-            return []
+            return None
+
+    async def generate_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Embed many queries with a single batched model call.
+
+        Returns one embedding per input text; on failure every entry is None,
+        so callers can tell a failed embedding from an empty result.
+        """
+        try:
+            embed = getattr(self.embeddings_client, "embed", None)
+            if embed:
+                # Batched call with the same task type aembed_query uses
+                embeddings = await model_call_service.call(
+                    "embedding_batch",
+                    lambda: asyncio.to_thread(embed, texts, embeddings_task_type="RETRIEVAL_QUERY")
+                )
+            else:
+                embeddings = await model_call_service.call(
+                    "embedding_batch",
+                    lambda: asyncio.gather(*(self.embeddings_client.aembed_query(text) for text in texts))
+                )
+            return [reduce_dimensions(embedding) for embedding in embeddings]
+        except Exception as e:
+            print(f"Error generating batch embeddings: {e}")
+            return [None for _ in texts]
 
     async def generate_response(
         self, 
         user_query: str, 
         context_chunks: List[str], 
         system_instruction: str,
-        cached_content_name: Optional[str] = None
+        cached_content_name: Optional[str] = None,
+        tier: str = "standard"
     ) -> str:
         """
         Generates response using Vertex AI. 
         If cached_content_name is provided, uses context caching.
         Otherwise, uses standard generation.
+        The "fast" tier always uses standard generation on the smaller model,
+        since context caches are bound to the standard model.
+
+        If the cached path fails (or its circuit is open), falls back to the
+        uncached llm_client path. If that fails too, returns ERROR_RESPONSE.
         """
+        # Prepare context from chunks
+        context_str = "\n\n".join(context_chunks)
+        full_prompt = f"Context:\n{context_str}\n\nUser Question: {user_query}"
+
+        if cached_content_name and tier == "standard":
+            try:
+                return await self._generate_with_cache(full_prompt, cached_content_name)
+            except Exception as e:
+                print(f"Cached generation failed, falling back to uncached model: {e}")
+
         try:
-            # Prepare context from chunks
-            context_str = "\n\n".join(context_chunks)
-            full_prompt = f"Context:\n{context_str}\n\nUser Question: {user_query}"
-
-            if cached_content_name:
-                # Cache has already been validated by chat_service
-                # Use existing cache (system instruction is cached)
-                print(f"Using Vertex AI Context Cache: {cached_content_name}")
-                
-                # Extract only the cache ID from the full resource path
-                # ChatVertexAI will automatically construct the full path
-                # Format: projects/{project}/locations/{location}/cachedContents/{cache_id}
-                cache_id = cached_content_name.split('/')[-1] if '/' in cached_content_name else cached_content_name
-                print(f"Extracted cache ID: {cache_id}")
-                
-                # Create model instance with cached content (pass only the ID)
-                model_with_cache = ChatVertexAI(
-                    model_name=self.chat_model_name,
-                    cached_content=cache_id
-                )
-                
-                response = await model_with_cache.ainvoke(full_prompt)
-                return response.content
-            else:
-                # Standard generation (context in prompt with system instruction)
-                messages = [
-                    ("system", system_instruction),
-                    ("human", full_prompt)
-                ]
-                response = await self.llm_client.ainvoke(messages)
-                return response.content
+            # Standard generation (context in prompt with system instruction)
+            messages = [
+                ("system", system_instruction),
+                ("human", full_prompt)
+            ]
+            llm = self.model_provider.get_chat_model(tier)
+            call_name = f"generate_{tier}" if tier != "standard" else "generate"
+            response = await model_call_service.call(call_name, lambda: llm.ainvoke(messages))
+            await usage_service.record(call_name, extract_usage(response))
+            return response.content
 
         except Exception as e:
             print(f"Error generating response: {e}")
-            return "I apologize, but I encountered an error generating the response."
-            
+            return self.ERROR_RESPONSE
+
+    async def stream_response(
+        self,
+        user_query: str,
+        context_chunks: List[str],
+        system_instruction: str,
+        on_token: Callable[[str], Awaitable[None]],
+        cached_content_name: Optional[str] = None,
+        tier: str = "standard"
+    ) -> str:
+        """
+        Same as generate_response, but passes text to on_token as it is generated.
+
+        Falls back from the cached to the uncached model only while nothing has
+        been streamed yet. Returns the full response, or ERROR_RESPONSE if
+        generation fails (callers replace any partial text already streamed).
+        """
+        context_str = "\n\n".join(context_chunks)
+        full_prompt = f"Context:\n{context_str}\n\nUser Question: {user_query}"
+
+        attempts = []
+        if cached_content_name and tier == "standard":
+            cache_id = cached_content_name.split('/')[-1] if '/' in cached_content_name else cached_content_name
+            attempts.append((
+                "generate_cached",
+                self.model_provider.get_chat_model("standard", cached_content=cache_id),
+                full_prompt,
+                cached_content_name
+            ))
+        attempts.append((
+            f"generate_{tier}" if tier != "standard" else "generate",
+            self.model_provider.get_chat_model(tier),
+            [("system", system_instruction), ("human", full_prompt)],
+            None
+        ))
+
+        for call_name, llm, prompt, cache_name in attempts:
+            parts: List[str] = []
+            try:
+                await self._stream(call_name, llm, prompt, parts, on_token, cache_name)
+                return "".join(parts)
+            except Exception as e:
+                if parts:
+                    print(f"Streaming generation failed mid-response: {e}")
+                    return self.ERROR_RESPONSE
+                print(f"Streaming {call_name} failed before any output: {e}")
+        return self.ERROR_RESPONSE
+
+    async def _stream(
+        self,
+        call_name: str,
+        llm,
+        prompt,
+        parts: List[str],
+        on_token: Callable[[str], Awaitable[None]],
+        cache_name: Optional[str] = None
+    ):
+        """
+        Stream one model call into parts. The circuit breaker and request
+        deadline apply, but there are no retries or hedging once output has
+        been sent.
+        """
+        remaining = model_call_service.remaining()
+        if remaining is not None and remaining <= 0:
+            raise ModelCallError(f"Deadline exceeded before {call_name}")
+        is_trial = model_call_service.acquire(call_name)
+        try:
+            await self._consume_stream(call_name, llm, prompt, parts, on_token, cache_name, remaining)
+        finally:
+            # A cancelled stream (superseded by a new message) records nothing
+            model_call_service.release(call_name, is_trial)
+
+    async def _consume_stream(
+        self,
+        call_name: str,
+        llm,
+        prompt,
+        parts: List[str],
+        on_token: Callable[[str], Awaitable[None]],
+        cache_name: Optional[str],
+        remaining: Optional[float]
+    ):
+        usage = None
+
+        async def consume():
+            nonlocal usage
+            async for chunk in llm.astream(prompt):
+                # Usage arrives on stream chunks as increments
+                chunk_usage = extract_usage(chunk)
+                if chunk_usage:
+                    usage = {k: (usage or {}).get(k, 0) + v for k, v in chunk_usage.items()}
+                if chunk.content:
+                    parts.append(chunk.content)
+                    await on_token(chunk.content)
+
+        # Bounded by the request deadline only: a long answer streams past MODEL_CALL_TIMEOUT
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(consume(), timeout=remaining)
+        except Exception as e:
+            model_call_service.record(call_name, success=False, error=e)
+            raise
+        model_call_service.record(call_name, success=True, latency=time.monotonic() - started)
+        await usage_service.record(call_name, usage, cache_name)
+
+    async def _generate_with_cache(self, full_prompt: str, cached_content_name: str) -> str:
+        """Generate with a Vertex AI context cache (system instruction is cached)."""
+        # Cache has already been validated by chat_service
+        print(f"Using Vertex AI Context Cache: {cached_content_name}")
+        
+        # Extract only the cache ID from the full resource path
+        # ChatVertexAI will automatically construct the full path
+        # Format: projects/{project}/locations/{location}/cachedContents/{cache_id}
+        cache_id = cached_content_name.split('/')[-1] if '/' in cached_content_name else cached_content_name
+        print(f"Extracted cache ID: {cache_id}")
+        
+        # Create model instance with cached content (pass only the ID)
+        model_with_cache = self.model_provider.get_chat_model("standard", cached_content=cache_id)
+        
+        response = await model_call_service.call(
+            "generate_cached",
+            lambda: model_with_cache.ainvoke(full_prompt)
+        )
+        await usage_service.record("generate_cached", extract_usage(response), cached_content_name)
+        return response.content
+
+    async def generate_with_corpus_cache(
+        self,
+        user_query: str,
+        conversation_context: str,
+        cached_content_name: str
+    ) -> str:
+        """
+        Generate against a context cache that already holds the system
+        instruction and the whole knowledge base, so only the conversation and
+        the question are sent.
+
+        Raises:
+            ModelCallError if the call fails (callers fall back to retrieval,
+            since the uncached model has no corpus)
+        """
+        prompt = f"{conversation_context}\n\nUser Question: {user_query}" if conversation_context else f"User Question: {user_query}"
+        return await self._generate_with_cache(prompt, cached_content_name)
+
+    async def complete(self, prompt: str, tier: str = "standard", call_name: str = "complete") -> str:
+        """
+        Run a plain single-prompt completion (no retrieval context) on a model tier.
+
+        Raises:
+            ModelCallError if the call fails after retries
+        """
+        llm = self.model_provider.get_chat_model(tier)
+        response = await model_call_service.call(call_name, lambda: llm.ainvoke([("human", prompt)]))
+        await usage_service.record(call_name, extract_usage(response))
+        return response.content
+
     async def create_context_cache(
         self, 
         system_instruction: str, 
-        ttl_hours: int = 1
+        ttl_hours: int = 1,
+        corpus: Optional[str] = None
     ) -> Optional[tuple[str, str]]:
         """
         Creates a Vertex AI context cache for the system instruction.
         Returns tuple of (cache_resource_name, expire_time) or None.
         
         NOTE: Vertex AI requires 'contents' parameter with at least one user content.
-        We provide a placeholder to enable caching of the system instruction.
+        We provide a placeholder to enable caching of the system instruction,
+        or the knowledge-base corpus when one is given (cache-augmented generation).
         """
+        if not self.model_provider.supports_context_cache:
+            return None
+
         try:
             print(f"Creating Vertex AI context cache with TTL: {ttl_hours} hours")
             
@@ -101,15 +298,23 @@ class RAGService:
             
             placeholder_content = Content(
                 role="user",
-                parts=[Part.from_text("Context caching placeholder - this enables system instruction caching")]
+                parts=[Part.from_text(corpus or "Context caching placeholder - this enables system instruction caching")]
             )
             
             # Create cached content with system instruction and placeholder
-            cached_content = caching.CachedContent.create(
-                model_name=self.chat_model_name,
-                system_instruction=system_instruction,
-                contents=[placeholder_content],  # Required: at least one user content
-                ttl=timedelta(hours=ttl_hours),
+            cached_content = await model_call_service.call(
+                "create_cache",
+                lambda: asyncio.to_thread(
+                    caching.CachedContent.create,
+                    model_name=self.chat_model_name,
+                    system_instruction=system_instruction,
+                    contents=[placeholder_content],  # Required: at least one user content
+                    ttl=timedelta(hours=ttl_hours),
+                ),
+                # No retries: a timed-out attempt's thread may still create the cache,
+                # and a retry would create (and bill) a second one
+                timeout=self.cache_create_timeout,
+                retries=0
             )
             
             # Get the full resource name
@@ -135,6 +340,16 @@ class RAGService:
             print("Falling back to standard generation without caching")
             return None
 
+    async def delete_context_cache(self, cache_name: str):
+        """Delete a Vertex AI context cache (best effort; it expires on its own otherwise)."""
+        try:
+            cache_id = cache_name.split('/')[-1] if '/' in cache_name else cache_name
+            cached_content = await asyncio.to_thread(caching.CachedContent.get, cache_id)
+            await asyncio.to_thread(cached_content.delete)
+            print(f"Deleted context cache: {cache_id}")
+        except Exception as e:
+            print(f"Error deleting context cache {cache_name}: {e}")
+
     async def validate_cache_exists(self, cache_name: str) -> bool:
         """
         Validates if a cache exists in Vertex AI by attempting to retrieve it.
@@ -149,8 +364,12 @@ class RAGService:
             # Extract cache ID if full resource name provided
             cache_id = cache_name.split('/')[-1] if '/' in cache_name else cache_name
             
-            # Try to get the cached content
-            cached_content = caching.CachedContent.get(cache_id)
+            # Try to get the cached content (a missing cache is an expected
+            # outcome here, so this bypasses the retry/circuit-breaker wrapper)
+            cached_content = await asyncio.wait_for(
+                asyncio.to_thread(caching.CachedContent.get, cache_id),
+                timeout=model_call_service.default_timeout
+            )
             
             print(f"Cache validation successful: {cache_id}")
             return True
@@ -1,12 +1,38 @@
 from app.configs.redis import redis_client
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
 import json
+import time
+
+# Atomic token bucket: refills at ARGV[2] tokens/second up to ARGV[1], consumes one token.
+# Returns {allowed (0/1), seconds until a token is available}.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local refill_rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill_rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / refill_rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill_rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
 
 class RedisService:
     def __init__(self):
         self.client = redis_client
         self.expiration = 3600  # 1 hour default
         self.conversation_expiration = 86400  # 24 hours for conversations
+        self.stale_expiration = 86400  # 24 hours for last-good fallback answers
+        self._token_bucket = self.client.register_script(TOKEN_BUCKET_SCRIPT)
 
     async def get_cache(self, key: str):
         try:
@@ -25,6 +51,23 @@ class RedisService:
         except Exception as e:
             print(f"Redis set error: {e}")
 
+    async def consume_token(self, key: str, capacity: int, refill_per_second: float) -> Tuple[bool, float]:
+        """
+        Take one token from a Redis-backed token bucket.
+
+        Returns:
+            Tuple of (allowed, retry_after_seconds). Fails open if Redis is unavailable.
+        """
+        try:
+            allowed, retry_after = await self._token_bucket(
+                keys=[key],
+                args=[capacity, refill_per_second, time.time()]
+            )
+            return bool(int(allowed)), float(retry_after)
+        except Exception as e:
+            print(f"Redis rate limit error: {e}")
+            return True, 0.0
+
     # ========== Conversation Memory Methods ==========
     
     async def store_conversation_message(self, conversation_id: str, role: str, content: str):
@@ -70,6 +113,19 @@ class RedisService:
             print(f"Error retrieving conversation history: {e}")
             return []
 
+    async def get_history_length(self, conversation_id: str) -> Optional[int]:
+        """
+        Number of stored messages (not yet summarized), without reading them.
+
+        Returns:
+            Message count, or None if Redis is unavailable
+        """
+        try:
+            return await self.client.llen(f"conversation:{conversation_id}:messages")
+        except Exception as e:
+            print(f"Error reading conversation length: {e}")
+            return None
+
     async def get_message_count(self, conversation_id: str) -> int:
         """
         Count the number of user messages in the conversation.
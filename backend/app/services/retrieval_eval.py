@@ -0,0 +1,470 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+from datetime import datetime, timezone
+from itertools import product
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+from dotenv import load_dotenv
+from app.configs.chunking import ChunkingConfig
+from app.configs.embedding import EmbeddingConfig
+from app.services.chunking_service import pack_chunks
+from app.services.model_provider import model_provider
+
+load_dotenv()
+
+
+def load_golden_set(path: Path) -> List[Dict[str, Any]]:
+    """
+    Read a golden query set: JSONL, one object per line with query,
+    expected_document_ids and optional id and filters. Blank lines and
+    lines starting with # are skipped.
+    """
+    queries = []
+    with open(path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            item = json.loads(line)
+            if not item.get("query") or not item.get("expected_document_ids"):
+                raise ValueError(f"{path}:{line_number}: query and expected_document_ids are required")
+            item.setdefault("id", str(line_number))
+            queries.append(item)
+    return queries
+
+
+def score_query(chunks: List[Dict[str, Any]], expected_document_ids: Sequence[str], ks: Sequence[int]) -> Dict[str, Any]:
+    """
+    Recall@k (share of expected documents with a chunk in the top k) and the
+    reciprocal rank of the first chunk from an expected document.
+    """
+    expected = {str(document_id) for document_id in expected_document_ids}
+    ranked = [_document_id(chunk) for chunk in chunks]
+    first_hit = next((rank for rank, document_id in enumerate(ranked, 1) if document_id in expected), None)
+    return {
+        "recall": {str(k): round(len(expected & set(ranked[:k])) / len(expected), 4) for k in ks},
+        "reciprocal_rank": round(1 / first_hit, 4) if first_hit else 0.0,
+    }
+
+
+def _document_id(chunk: Dict[str, Any]) -> Optional[str]:
+    document_id = chunk.get("document_id") or (chunk.get("metadata") or {}).get("document_id")
+    return str(document_id) if document_id else None
+
+
+def _percentile(ordered: List[float], p: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+
+def _slug(value: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.-]+", "-", value).strip("-") or "run"
+
+
+class EvalRecordings:
+    """
+    Query embeddings and chunk token counts recorded for offline runs.
+
+    One file per embedding model and dimensionality, so changing either
+    never reuses vectors from another model.
+    """
+
+    def __init__(self, directory: Path):
+        dimensions = EmbeddingConfig.output_dimensionality or "full"
+        self.path = directory / f"recordings-{_slug(model_provider.embed_model_name)}-{dimensions}.json"
+        data = json.loads(self.path.read_text()) if self.path.exists() else {}
+        self.embeddings: Dict[str, List[float]] = data.get("embeddings", {})
+        self.chunk_tokens: Dict[str, int] = data.get("chunk_tokens", {})
+        self._dirty = False
+
+    def embedding(self, query: str) -> Optional[List[float]]:
+        return self.embeddings.get(self._key(query))
+
+    def add_embedding(self, query: str, embedding: List[float]):
+        self.embeddings[self._key(query)] = embedding
+        self._dirty = True
+
+    def add_chunk_tokens(self, counts: Dict[str, int]):
+        self.chunk_tokens.update(counts)
+        self._dirty = True
+
+    def save(self):
+        if not self._dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"embeddings": self.embeddings, "chunk_tokens": self.chunk_tokens}))
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+    def _key(self, query: str) -> str:
+        return hashlib.sha256(query.encode("utf-8")).hexdigest()[:32]
+
+
+class LiveBackend:
+    """Retrieval through VectorStoreService (Supabase RPCs or the snapshot, as configured), result cache off."""
+
+    name = "live"
+
+    def __init__(self):
+        from app.services.vectorstore_service import vectorstore_service
+
+        self.store = vectorstore_service
+        # Every query must reach the index for latency to mean anything
+        self.store.result_cache_enabled = False
+
+    async def search(self, embedding, match_threshold, match_count, filters) -> List[Dict[str, Any]]:
+        return await self.store.get_relevant_chunks(embedding, match_threshold, match_count, filters)
+
+    def describe(self) -> Dict[str, Any]:
+        from app.services.vector_snapshot import vector_snapshot
+
+        return {"quantization": self.store.quantization, "vector_snapshot": vector_snapshot.enabled}
+
+
+class LocalBackend:
+    """
+    Exact in-process search over a vector snapshot directory, with no network.
+
+    Chunk token counts come from the recordings (fetched from Supabase with
+    --record); chunks without one make that query's prompt cost unknown.
+    """
+
+    name = "local"
+
+    def __init__(self, snapshot_dir: Optional[str], recordings: EvalRecordings):
+        from app.services.vector_snapshot import VectorSnapshot
+
+        self.snapshot = VectorSnapshot()
+        self.snapshot.enabled = True
+        if snapshot_dir:
+            self.snapshot.directory = Path(snapshot_dir)
+        if not self.snapshot.is_ready:
+            raise ValueError(f"No vector snapshot in {self.snapshot.directory} (export one with POST /index/snapshot)")
+        self.recordings = recordings
+
+    async def search(self, embedding, match_threshold, match_count, filters) -> List[Dict[str, Any]]:
+        if set(filters or {}) - {"document_ids"}:
+            raise ValueError("The local backend only supports document_ids filters")
+        matches = self.snapshot.search(embedding, match_count, match_threshold, (filters or {}).get("document_ids"))
+        document_ids = self.snapshot.document_ids_for(chunk_id for chunk_id, _ in matches)
+        chunks = []
+        for chunk_id, similarity in matches:
+            token_count = self.recordings.chunk_tokens.get(str(chunk_id))
+            chunks.append({
+                "id": chunk_id,
+                "document_id": document_ids.get(chunk_id),
+                "similarity": similarity,
+                "metadata": {"token_count": token_count} if token_count else {},
+            })
+        return chunks
+
+    def describe(self) -> Dict[str, Any]:
+        status = self.snapshot.status()
+        return {"snapshot_dir": str(self.snapshot.directory), "snapshot_base": status.get("base"), "snapshot_rows": status.get("rows")}
+
+
+class RetrievalEvaluator:
+    """
+    Replays a golden query set against the retrieval stage and scores it.
+
+    For each configuration (match_threshold x match_count) a run reports
+    recall@k, MRR, retrieval latency (p50/p95/p99), and prompt-token cost:
+    tokens of the retrieved chunks and of the chunks packed into the
+    CONTEXT_TOKEN_BUDGET, as chat would send them. Runs are saved as JSON in
+    EVAL_RUNS_DIR with the chunking and embedding settings in effect, so runs
+    before and after re-ingesting with a new chunk size or embedding model
+    can be compared side by side.
+
+    Query embeddings are replayed from recordings, so runs are offline and
+    latency covers retrieval only. --record embeds missing queries (and, for
+    the local backend, fetches missing chunk token counts); that needs the
+    model provider and Supabase.
+
+    Usage (from backend/):
+        python -m app.services.retrieval_eval run eval/golden.jsonl --backend local --match-count 5,10 --record
+        python -m app.services.retrieval_eval run eval/golden.jsonl --match-threshold 0.4,0.5 --name tuned
+        python -m app.services.retrieval_eval compare <run_id> <run_id>
+        python -m app.services.retrieval_eval list
+    """
+
+    def __init__(self):
+        self.runs_dir = Path(os.getenv("EVAL_RUNS_DIR", "eval/runs"))
+        self.recordings_dir = Path(os.getenv("EVAL_RECORDINGS_DIR", "eval/recordings"))
+        # Same budget as ChatService packs retrieved chunks into
+        self.context_token_budget = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000))
+
+    async def run(
+        self,
+        golden_path: Path,
+        backend: str = "live",
+        match_thresholds: Sequence[float] = (0.5,),
+        match_counts: Sequence[int] = (5,),
+        ks: Sequence[int] = (1, 3, 5),
+        name: Optional[str] = None,
+        record: bool = False,
+        snapshot_dir: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Evaluate every configuration and save one run per configuration."""
+        golden = load_golden_set(golden_path)
+        recordings = EvalRecordings(self.recordings_dir)
+        await self._ensure_embeddings(golden, recordings, record)
+        searcher = LiveBackend() if backend == "live" else LocalBackend(snapshot_dir, recordings)
+
+        golden_hash = hashlib.sha256(golden_path.read_bytes()).hexdigest()[:16]
+        runs = []
+        for match_threshold, match_count in product(match_thresholds, match_counts):
+            results = []
+            for item in golden:
+                embedding = recordings.embedding(item["query"])
+                if not embedding:
+                    results.append({"id": item["id"], "query": item["query"], "skipped": "no recorded embedding"})
+                    continue
+                started = time.perf_counter()
+                chunks = await searcher.search(embedding, match_threshold, match_count, item.get("filters"))
+                latency_ms = (time.perf_counter() - started) * 1000
+                results.append({"id": item["id"], "query": item["query"], "chunks": chunks, "latency_ms": round(latency_ms, 2)})
+
+            if backend == "local" and record:
+                await self._record_chunk_tokens(results, recordings)
+            recordings.save()
+
+            queries = [self._score(item, result, ks) for item, result in zip(golden, results)]
+            run = {
+                "run_id": f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{_slug(name or backend)}-t{match_threshold}-n{match_count}",
+                "name": name,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "golden_set": str(golden_path),
+                "golden_set_hash": golden_hash,
+                "config": {
+                    "backend": backend,
+                    "match_threshold": match_threshold,
+                    "match_count": match_count,
+                    "ks": list(ks),
+                    "embedding_model": model_provider.embed_model_name,
+                    "embedding_dimensions": EmbeddingConfig.output_dimensionality or None,
+                    "chunk_tokens": ChunkingConfig.chunk_tokens,
+                    "chunk_overlap_tokens": ChunkingConfig.chunk_overlap_tokens,
+                    "context_token_budget": self.context_token_budget,
+                    **searcher.describe(),
+                },
+                "summary": self._summarize(queries, ks),
+                "queries": queries,
+            }
+            self._save(run)
+            runs.append(run)
+        return runs
+
+    def load_run(self, run_id: str) -> Dict[str, Any]:
+        path = self.runs_dir / f"{_slug(run_id)}.json"
+        if not path.exists():
+            raise ValueError(f"Unknown run: {run_id}")
+        return json.loads(path.read_text())
+
+    def list_runs(self) -> List[Dict[str, Any]]:
+        runs = []
+        for path in sorted(self.runs_dir.glob("*.json")):
+            run = json.loads(path.read_text())
+            runs.append({"run_id": run["run_id"], "name": run.get("name"), "config": run["config"], "summary": run["summary"]})
+        return runs
+
+    def compare(self, run_ids: Sequence[str]) -> str:
+        """Side-by-side table of run summaries, with deltas against the first run."""
+        runs = [self.load_run(run_id) for run_id in run_ids]
+        if len({run["golden_set_hash"] for run in runs}) > 1:
+            print("Warning: runs used different golden sets; metrics are not directly comparable")
+
+        rows = [
+            ("backend", lambda run: run["config"]["backend"]),
+            ("embedding_model", lambda run: run["config"]["embedding_model"]),
+            ("chunk_tokens", lambda run: run["config"]["chunk_tokens"]),
+            ("match_threshold", lambda run: run["config"]["match_threshold"]),
+            ("match_count", lambda run: run["config"]["match_count"]),
+            ("evaluated", lambda run: run["summary"]["evaluated"]),
+        ]
+        ks = sorted({int(k) for run in runs for k in run["summary"]["recall"]})
+        metrics = [(f"recall@{k}", lambda run, k=k: run["summary"]["recall"].get(str(k))) for k in ks]
+        metrics += [
+            ("mrr", lambda run: run["summary"]["mrr"]),
+            ("latency_p50_ms", lambda run: run["summary"]["latency_ms"]["p50"]),
+            ("latency_p95_ms", lambda run: run["summary"]["latency_ms"]["p95"]),
+            ("latency_p99_ms", lambda run: run["summary"]["latency_ms"]["p99"]),
+            ("retrieved_tokens", lambda run: run["summary"]["prompt_tokens"]["mean_retrieved"]),
+            ("packed_tokens", lambda run: run["summary"]["prompt_tokens"]["mean_packed"]),
+        ]
+
+        width = max(24, *(len(run["run_id"]) + 2 for run in runs))
+        lines = ["metric".ljust(18) + "".join(run["run_id"].ljust(width) for run in runs)]
+        for label, value in rows:
+            lines.append(label.ljust(18) + "".join(str(value(run)).ljust(width) for run in runs))
+        for label, value in metrics:
+            baseline = value(runs[0])
+            cells = []
+            for index, run in enumerate(runs):
+                current = value(run)
+                cell = "-" if current is None else f"{current:g}"
+                if index and current is not None and baseline is not None:
+                    cell += f" ({current - baseline:+.4g})"
+                cells.append(cell.ljust(width))
+            lines.append(label.ljust(18) + "".join(cells))
+        return "\n".join(lines)
+
+    async def _ensure_embeddings(self, golden: List[Dict[str, Any]], recordings: EvalRecordings, record: bool):
+        missing = [item["query"] for item in golden if recordings.embedding(item["query"]) is None]
+        if not missing:
+            return
+        if not record:
+            print(f"{len(missing)} queries have no recorded embedding and will be skipped (run with --record)")
+            return
+
+        # Imported only when recording: it initializes the model provider clients
+        from app.services.rag_service import rag_service
+
+        print(f"Recording embeddings for {len(missing)} queries with {model_provider.embed_model_name}")
+        for query, embedding in zip(missing, await rag_service.generate_embeddings(missing)):
+            if embedding:
+                recordings.add_embedding(query, embedding)
+        recordings.save()
+
+    async def _record_chunk_tokens(self, results: List[Dict[str, Any]], recordings: EvalRecordings):
+        from app.configs.supabase import supabase_client
+        from app.services.chunking_service import estimate_tokens
+
+        missing = {
+            chunk["id"]
+            for result in results
+            for chunk in result.get("chunks", [])
+            if str(chunk["id"]) not in recordings.chunk_tokens
+        }
+        if not missing or not supabase_client:
+            return
+        request = supabase_client.table("chunk_documents").select("id, content, metadata").in_("id", sorted(missing))
+        response = await asyncio.to_thread(request.execute)
+        recordings.add_chunk_tokens({
+            str(row["id"]): (row.get("metadata") or {}).get("token_count") or estimate_tokens(row.get("content") or "")
+            for row in response.data or []
+        })
+        for result in results:
+            for chunk in result.get("chunks", []):
+                token_count = recordings.chunk_tokens.get(str(chunk["id"]))
+                if token_count:
+                    chunk["metadata"] = {"token_count": token_count}
+
+    def _score(self, item: Dict[str, Any], result: Dict[str, Any], ks: Sequence[int]) -> Dict[str, Any]:
+        if result.get("skipped"):
+            return {"id": item["id"], "skipped": result["skipped"]}
+
+        chunks = result["chunks"]
+        scored = score_query(chunks, item["expected_document_ids"], ks)
+        # Unknown token counts make the cost unknown rather than silently low
+        known = all((chunk.get("metadata") or {}).get("token_count") or chunk.get("content") for chunk in chunks)
+        packed, packed_tokens = pack_chunks(chunks, self.context_token_budget)
+        retrieved_tokens = pack_chunks(chunks, float("inf"))[1]
+        return {
+            "id": item["id"],
+            "query": item["query"],
+            "expected_document_ids": item["expected_document_ids"],
+            "retrieved": [
+                {"chunk_id": chunk.get("id"), "document_id": _document_id(chunk), "similarity": chunk.get("similarity")}
+                for chunk in chunks
+            ],
+            **scored,
+            "latency_ms": result["latency_ms"],
+            "retrieved_tokens": retrieved_tokens if known else None,
+            "packed_tokens": packed_tokens if known else None,
+            "packed_chunks": len(packed),
+        }
+
+    def _summarize(self, queries: List[Dict[str, Any]], ks: Sequence[int]) -> Dict[str, Any]:
+        scored = [query for query in queries if not query.get("skipped")]
+        latencies = sorted(query["latency_ms"] for query in scored)
+        retrieved = [query["retrieved_tokens"] for query in scored if query["retrieved_tokens"] is not None]
+        packed = [query["packed_tokens"] for query in scored if query["packed_tokens"] is not None]
+
+        def mean(values):
+            return round(sum(values) / len(values), 4) if values else None
+
+        return {
+            "queries": len(queries),
+            "evaluated": len(scored),
+            "skipped": len(queries) - len(scored),
+            "empty_results": sum(1 for query in scored if not query["retrieved"]),
+            "recall": {str(k): mean([query["recall"][str(k)] for query in scored]) for k in ks},
+            "mrr": mean([query["reciprocal_rank"] for query in scored]),
+            "latency_ms": {
+                "mean": mean(latencies),
+                "p50": _percentile(latencies, 0.50),
+                "p95": _percentile(latencies, 0.95),
+                "p99": _percentile(latencies, 0.99),
+                "max": latencies[-1] if latencies else None,
+            },
+            "prompt_tokens": {
+                "mean_retrieved": mean(retrieved),
+                "mean_packed": mean(packed),
+                "queries_with_unknown_cost": len(scored) - len(packed),
+            },
+        }
+
+    def _save(self, run: Dict[str, Any]):
+        self.runs_dir.mkdir(parents=True, exist_ok=True)
+        (self.runs_dir / f"{run['run_id']}.json").write_text(json.dumps(run, indent=2, default=str))
+        summary = run["summary"]
+        recall = ", ".join(f"recall@{k}={value}" for k, value in summary["recall"].items())
+        print(f"{run['run_id']}: {recall}, mrr={summary['mrr']}, p95={summary['latency_ms']['p95']} ms, "
+              f"packed tokens={summary['prompt_tokens']['mean_packed']} ({summary['evaluated']}/{summary['queries']} queries)")
+
+
+retrieval_evaluator = RetrievalEvaluator()
+
+
+def _parse_list(value: str, cast):
+    return [cast(part) for part in value.split(",") if part.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval evaluation over a golden query set")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Evaluate one or more retrieval configurations")
+    run_parser.add_argument("golden", type=Path, help="Golden set (JSONL with query and expected_document_ids)")
+    run_parser.add_argument("--backend", choices=("live", "local"), default="live")
+    run_parser.add_argument("--match-threshold", default="0.5", help="Comma-separated thresholds to try")
+    run_parser.add_argument("--match-count", default="5", help="Comma-separated match counts to try")
+    run_parser.add_argument("--k", default="1,3,5", help="Comma-separated k values for recall@k")
+    run_parser.add_argument("--name", help="Label stored with the run")
+    run_parser.add_argument("--snapshot-dir", help="Vector snapshot for the local backend (default VECTOR_SNAPSHOT_DIR)")
+    run_parser.add_argument("--record", action="store_true", help="Embed queries / fetch token counts that are not recorded yet")
+
+    compare_parser = commands.add_parser("compare", help="Compare saved runs side by side")
+    compare_parser.add_argument("run_ids", nargs="+")
+
+    commands.add_parser("list", help="List saved runs")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        asyncio.run(retrieval_evaluator.run(
+            args.golden,
+            backend=args.backend,
+            match_thresholds=_parse_list(args.match_threshold, float),
+            match_counts=_parse_list(args.match_count, int),
+            ks=_parse_list(args.k, int),
+            name=args.name,
+            record=args.record,
+            snapshot_dir=args.snapshot_dir
+        ))
+    elif args.command == "compare":
+        print(retrieval_evaluator.compare(args.run_ids))
+    else:
+        for run in retrieval_evaluator.list_runs():
+            summary = run["summary"]
+            print(f"{run['run_id']}  mrr={summary['mrr']}  recall={summary['recall']}  p95={summary['latency_ms']['p95']} ms")
+
+
+if __name__ == "__main__":
+    main()
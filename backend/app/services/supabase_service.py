@@ -1,10 +1,11 @@
 import os
-import tempfile
-from urllib.parse import urlparse
+from typing import Iterator, Tuple
+from urllib.parse import urlparse, unquote
 
-import requests
 from app.configs.supabase import supabase_client
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
+from langchain_core.documents import Document
+from app.services.document_loaders import loader_registry
+from app.services.download_service import storage_downloader
 
 
 class DocumentDataFetcher:
@@ -70,68 +71,67 @@ class SupabaseStorageLoader:
         Returns:
             List of LangChain Document objects
         """
-        try:
-            if not self._is_supabase_storage_url(url):
-                raise ValueError("URL is not a valid Supabase Storage URL")
+        return list(self.iter_from_supabase_url(url))
 
-            file_ext = self._get_file_extension_from_url(url)
-
-            if file_ext == ".txt":
-                documents = self._load_text_from_url(url)
-            elif file_ext == ".pdf":
-                documents = self._load_pdf_from_url(url)
-            else:
-                raise ValueError(f"Unsupported file type: {file_ext}")
+    def iter_from_supabase_url(self, url: str) -> Iterator[Document]:
+        """
+        Lazily load a document from a Supabase Storage URL.
 
-            return documents
+        The file type is detected from its content and dispatched to the
+        matching loader in the loader registry, which yields sections as
+        they are parsed.
 
-        except Exception as e:
-            print(f"Error loading document from URL {url}: {e}")
-            raise
+        Args:
+            url: Full Supabase Storage URL
 
-    def _load_text_from_url(self, url: str):
-        """Load a text file from URL."""
+        Yields:
+            LangChain Document objects, one per section/page
+        """
+        temp_file_path, _ = self.download(url)
         try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-
-            with tempfile.NamedTemporaryFile(
-                mode="w", suffix=".txt", delete=False, encoding="utf-8"
-            ) as temp_file:
-                temp_file.write(response.text)
-                temp_file_path = temp_file.name
-
-            loader = TextLoader(temp_file_path, encoding="utf-8")
-            document = loader.load()
-
+            yield from self.iter_from_file(temp_file_path, url)
+        finally:
             os.unlink(temp_file_path)
 
-            return document
+    def download(self, url: str) -> Tuple[str, str]:
+        """
+        Download a Supabase Storage object to a temporary file.
+
+        Returns:
+            Tuple of (temp file path, sha256 of the content). The caller deletes the file.
+        """
+        try:
+            if not self._is_supabase_storage_url(url):
+                raise ValueError("URL is not a valid Supabase Storage URL")
 
+            return self._download_to_tempfile(url)
         except Exception as e:
-            print(f"Error loading text file: {e}")
+            print(f"Error loading document from URL {url}: {e}")
             raise
 
-    def _load_pdf_from_url(self, url: str):
-        """Load a PDF file from URL."""
+    def iter_from_file(self, file_path: str, url: str) -> Iterator[Document]:
+        """Lazily load a downloaded file with the loader registry."""
         try:
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
-
-            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_file:
-                for chunk in response.iter_content(chunk_size=8192):
-                    temp_file.write(chunk)
-                temp_file_path = temp_file.name
-
-            loader = PyPDFLoader(temp_file_path)
-            document = loader.load()
-
-            os.unlink(temp_file_path)
+            yield from loader_registry.iter_documents(
+                file_path,
+                source=url,
+                filename_hint=self._get_filename_from_url(url)
+            )
+        except Exception as e:
+            print(f"Error loading document from URL {url}: {e}")
+            raise
 
-            return document
+    def _download_to_tempfile(self, url: str) -> Tuple[str, str]:
+        """
+        Download a file into a temporary file, returning its path and sha256.
+        Uses the pooled, range-parallel and ETag-cached storage downloader.
+        """
+        try:
+            suffix = os.path.splitext(self._get_filename_from_url(url))[1]
+            return storage_downloader.download(url, suffix=suffix)
 
         except Exception as e:
-            print(f"Error loading PDF file: {e}")
+            print(f"Error downloading file: {e}")
             raise
 
     def _is_supabase_storage_url(self, url: str) -> bool:
@@ -145,23 +145,10 @@ class SupabaseStorageLoader:
         except Exception:
             return False
 
-    def _get_file_extension_from_url(self, url: str) -> str:
-        """Extract file extension from URL."""
+    def _get_filename_from_url(self, url: str) -> str:
+        """Extract the file name from URL (used only as a hint for text formats)."""
         parsed = urlparse(url)
-        path = parsed.path.lower()
-
-        path_without_query = path.split("?")[0]
-
-        if path_without_query.endswith(".txt"):
-            return ".txt"
-        elif path_without_query.endswith(".pdf"):
-            return ".pdf"
-        elif path_without_query.endswith(".docx"):
-            return ".docx"
-        elif path_without_query.endswith(".doc"):
-            return ".doc"
-        else:
-            return ".unknown"
+        return os.path.basename(unquote(parsed.path))
 
 
 # Create singleton instances
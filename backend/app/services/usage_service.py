@@ -0,0 +1,202 @@
+import os
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+from app.configs.redis import redis_client
+
+load_dotenv()
+
+USAGE_FIELDS = ("calls", "unreported_calls", "input_tokens", "cached_tokens", "output_tokens")
+
+# Labels (conversation_id, prompt_id) that model calls in the current task are attributed to
+_attribution: ContextVar[Dict[str, Optional[str]]] = ContextVar("usage_attribution", default={})
+
+
+def extract_usage(message: Any) -> Optional[Dict[str, int]]:
+    """
+    Token usage reported on a LangChain message (or stream chunk).
+
+    Reads usage_metadata, falling back to Vertex AI's raw usage in
+    response_metadata. Cached tokens are the part of the input served from
+    the context cache (Vertex counts them inside the prompt tokens).
+
+    Returns:
+        Dict with input_tokens, cached_tokens and output_tokens, or None if not reported
+    """
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        details = usage.get("input_token_details") or {}
+        return {
+            "input_tokens": int(usage.get("input_tokens") or 0),
+            "cached_tokens": int(details.get("cache_read") or 0),
+            "output_tokens": int(usage.get("output_tokens") or 0),
+        }
+    raw = (getattr(message, "response_metadata", None) or {}).get("usage_metadata")
+    if raw:
+        return {
+            "input_tokens": int(raw.get("prompt_token_count") or 0),
+            "cached_tokens": int(raw.get("cached_content_token_count") or 0),
+            "output_tokens": int(raw.get("candidates_token_count") or 0),
+        }
+    return None
+
+
+class UsageService:
+    """
+    Token accounting for every generation call.
+
+    rag_service records the usage each model response reports; counters are
+    kept in Redis hashes per call name, prompt id, context cache and
+    conversation, plus time buckets (USAGE_BUCKET_SECONDS) for throughput.
+    Per-prompt and per-cache counters expire USAGE_RETENTION_SECONDS after
+    their last call (caches are replaced on every rebuild), and report()
+    prunes ids whose counters have expired.
+    Which conversation and prompt a call belongs to comes from attribute(),
+    set by ChatService in the task answering a message.
+    """
+
+    def __init__(self):
+        self.redis = redis_client
+        self.enabled = os.getenv("USAGE_TRACKING_ENABLED", "true").strip().lower() == "true"
+        self.bucket_seconds = int(os.getenv("USAGE_BUCKET_SECONDS", 300))
+        self.retention_seconds = int(os.getenv("USAGE_RETENTION_SECONDS", 7 * 86400))
+        # Matches conversation history expiry in redis_service
+        self.conversation_ttl = int(os.getenv("USAGE_CONVERSATION_TTL", 86400))
+
+    def attribute(self, **labels: Optional[str]):
+        """Attribute model calls made from here on in the current task (e.g. conversation_id, prompt_id)."""
+        _attribution.set({**_attribution.get(), **labels})
+
+    async def record(self, call_name: str, usage: Optional[Dict[str, int]], cache_name: Optional[str] = None):
+        """Add one call's usage to every counter it belongs to."""
+        if not self.enabled:
+            return
+
+        fields = {"calls": 1}
+        if usage:
+            fields.update(usage)
+        else:
+            fields["unreported_calls"] = 1
+
+        labels = _attribution.get()
+        prompt_id = labels.get("prompt_id")
+        conversation_id = labels.get("conversation_id")
+        cache_id = cache_name.split('/')[-1] if cache_name else None
+        bucket = int(time.time()) // self.bucket_seconds * self.bucket_seconds
+
+        keys = ["usage:total", f"usage:call:{call_name}", f"usage:bucket:{bucket}"]
+        if prompt_id:
+            keys.append(f"usage:prompt:{prompt_id}")
+        if cache_id:
+            keys.append(f"usage:cache:{cache_id}")
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                for field, value in fields.items():
+                    pipe.hincrby(key, field, value)
+            pipe.expire(f"usage:bucket:{bucket}", self.retention_seconds)
+            if prompt_id:
+                pipe.expire(f"usage:prompt:{prompt_id}", self.retention_seconds)
+            if cache_id:
+                pipe.expire(f"usage:cache:{cache_id}", self.retention_seconds)
+            if conversation_id:
+                for field, value in fields.items():
+                    pipe.hincrby(f"usage:conversation:{conversation_id}", field, value)
+                pipe.expire(f"usage:conversation:{conversation_id}", self.conversation_ttl)
+            pipe.sadd("usage:calls", call_name)
+            if prompt_id:
+                pipe.sadd("usage:prompts", prompt_id)
+            if cache_id:
+                pipe.sadd("usage:caches", cache_id)
+            await pipe.execute()
+        except Exception as e:
+            print(f"Error recording token usage: {e}")
+
+    async def report(self, minutes: int = 60, conversation_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Usage totals and cache effectiveness.
+
+        Returns:
+            Dict with total, by_call, by_prompt, by_cache, an optional
+            conversation summary, and a timeseries of the last `minutes`
+        """
+        calls = await self._members("usage:calls")
+        prompts = await self._live_members("usage:prompts", "usage:prompt:")
+        caches = await self._live_members("usage:caches", "usage:cache:")
+
+        now_bucket = int(time.time()) // self.bucket_seconds * self.bucket_seconds
+        bucket_count = max(1, minutes * 60 // self.bucket_seconds)
+        buckets = [now_bucket - i * self.bucket_seconds for i in reversed(range(bucket_count))]
+
+        keys = (
+            ["usage:total"]
+            + [f"usage:call:{name}" for name in calls]
+            + [f"usage:prompt:{prompt_id}" for prompt_id in prompts]
+            + [f"usage:cache:{cache_id}" for cache_id in caches]
+            + [f"usage:bucket:{bucket}" for bucket in buckets]
+            + ([f"usage:conversation:{conversation_id}"] if conversation_id else [])
+        )
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            rows = iter([self._summary(row) for row in await pipe.execute()])
+        except Exception as e:
+            print(f"Error reading token usage: {e}")
+            return {"error": str(e)}
+
+        report: Dict[str, Any] = {
+            "total": next(rows),
+            "by_call": {name: next(rows) for name in calls},
+            "by_prompt": {prompt_id: next(rows) for prompt_id in prompts},
+            "by_cache": {cache_id: next(rows) for cache_id in caches},
+        }
+        timeseries = []
+        for bucket in buckets:
+            summary = next(rows)
+            summary["bucket_start"] = datetime.fromtimestamp(bucket, timezone.utc).isoformat()
+            summary["tokens_per_second"] = round((summary["input_tokens"] + summary["output_tokens"]) / self.bucket_seconds, 2)
+            timeseries.append(summary)
+        report["timeseries"] = timeseries
+        if conversation_id:
+            report["conversation"] = {"conversation_id": conversation_id, **next(rows)}
+        return report
+
+    async def _members(self, key: str) -> List[str]:
+        try:
+            return sorted(await self.redis.smembers(key))
+        except Exception as e:
+            print(f"Error reading {key}: {e}")
+            return []
+
+    async def _live_members(self, key: str, hash_prefix: str) -> List[str]:
+        """Members of an id set whose counters still exist; expired ids are removed from the set."""
+        members = await self._members(key)
+        if not members:
+            return []
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            for member in members:
+                pipe.exists(f"{hash_prefix}{member}")
+            exists = await pipe.execute()
+            expired = [member for member, present in zip(members, exists) if not present]
+            if expired:
+                await self.redis.srem(key, *expired)
+        except Exception as e:
+            print(f"Error pruning {key}: {e}")
+            return members
+        return [member for member, present in zip(members, exists) if present]
+
+    def _summary(self, row: Dict[str, str]) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {field: int((row or {}).get(field, 0)) for field in USAGE_FIELDS}
+        summary["uncached_input_tokens"] = summary["input_tokens"] - summary["cached_tokens"]
+        summary["cached_input_ratio"] = (
+            round(summary["cached_tokens"] / summary["input_tokens"], 4) if summary["input_tokens"] else None
+        )
+        return summary
+
+
+usage_service = UsageService()
@@ -0,0 +1,348 @@
+import os
+import json
+import fcntl
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+from app.configs.supabase import supabase_client
+
+load_dotenv()
+
+MANIFEST_NAME = "MANIFEST.json"
+
+
+class SnapshotSegment:
+    """One on-disk segment: a float32 matrix plus its row ids and document_ids."""
+
+    def __init__(self, name: str, matrix, ids, document_ids, tombstones: List[Dict[str, Any]]):
+        self.name = name
+        self.matrix = matrix
+        self.ids = ids
+        self.document_ids = document_ids
+        self.tombstones = tombstones
+        self.alive = None
+
+
+class VectorSnapshot:
+    """
+    On-disk, memory-mapped copy of chunk_documents embeddings for in-process search.
+
+    Layout in VECTOR_SNAPSHOT_DIR:
+    - MANIFEST.json: current base segment, delta segments and dimensions
+    - <segment>.f32: contiguous row-major float32 matrix (row i at i * dims * 4)
+    - <segment>.json: sidecar with the chunk id and document_id of every row,
+      plus tombstones recorded by deletions
+
+    Workers map the base segment read-only with numpy.memmap, so every worker
+    shares one page-cache copy and opening a snapshot takes milliseconds.
+    Ingestion appends small delta segments and deletions append tombstones;
+    once there are more than VECTOR_SNAPSHOT_MAX_DELTAS deltas they are
+    compacted into a new base. Writers serialize on a file lock, and the
+    manifest is replaced atomically, so readers always see a complete snapshot.
+    """
+
+    def __init__(self):
+        self.client = supabase_client
+        self.enabled = os.getenv("VECTOR_SNAPSHOT_ENABLED", "false").strip().lower() == "true"
+        self.directory = Path(os.getenv("VECTOR_SNAPSHOT_DIR", "/var/lib/turing/vector-snapshot"))
+        self.max_deltas = int(os.getenv("VECTOR_SNAPSHOT_MAX_DELTAS", 20))
+        self.export_page_size = int(os.getenv("VECTOR_SNAPSHOT_PAGE_SIZE", 1000))
+
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._manifest_mtime: Optional[float] = None
+        self._segments: List[SnapshotSegment] = []
+
+    # ------------------------------------------------------------------ reads
+
+    @property
+    def is_ready(self) -> bool:
+        return self.enabled and self._refresh()
+
+    def search(
+        self,
+        embedding: Sequence[float],
+        match_count: int,
+        match_threshold: float,
+        document_ids: Optional[Iterable[str]] = None
+    ) -> List[Tuple[int, float]]:
+        """
+        Exact cosine search over the snapshot (rows are L2-normalized at ingestion).
+
+        Returns:
+            List of (chunk id, similarity), best first
+        """
+        import numpy as np
+
+        if not self._refresh():
+            return []
+
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        allowed = np.asarray(sorted(set(document_ids)), dtype=object) if document_ids else None
+
+        candidates: List[Tuple[float, int]] = []
+        for segment in self._segments:
+            if not len(segment.ids):
+                continue
+            scores = segment.matrix @ query
+            mask = segment.alive & (scores >= match_threshold)
+            if allowed is not None:
+                mask &= np.isin(segment.document_ids, allowed)
+            rows = np.flatnonzero(mask)
+            if len(rows) > match_count:
+                rows = rows[np.argpartition(-scores[rows], match_count - 1)[:match_count]]
+            candidates.extend((float(scores[row]), int(segment.ids[row])) for row in rows)
+
+        # Re-ingested rows are upserted in place, so an id can appear in more than one segment
+        best: Dict[int, float] = {}
+        for score, chunk_id in candidates:
+            best[chunk_id] = max(score, best.get(chunk_id, score))
+        ranked = sorted(best.items(), key=lambda item: item[1], reverse=True)
+        return ranked[:match_count]
+
+    def document_ids_for(self, chunk_ids: Iterable[int]) -> Dict[int, Optional[str]]:
+        """document_id of each given chunk id that is in the snapshot."""
+        import numpy as np
+
+        if not self._refresh():
+            return {}
+        wanted = np.asarray(list(chunk_ids), dtype=np.int64)
+        found: Dict[int, Optional[str]] = {}
+        # Later segments hold the newest copy of a re-ingested row
+        for segment in self._segments:
+            for row in np.flatnonzero(np.isin(segment.ids, wanted)):
+                found[int(segment.ids[row])] = segment.document_ids[row]
+        return found
+
+    def status(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        if not self._refresh():
+            return {"enabled": True, "ready": False}
+        return {
+            "enabled": True,
+            "ready": True,
+            "base": self._manifest["base"],
+            "deltas": len(self._manifest["deltas"]),
+            "dimensions": self._manifest["dimensions"],
+            "rows": int(sum(segment.alive.sum() for segment in self._segments)),
+        }
+
+    # ----------------------------------------------------------------- writes
+
+    def export(self, only_if_missing: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Write a fresh base segment from every row in chunk_documents.
+
+        Rows are streamed page by page into the matrix file, so memory stays
+        flat regardless of corpus size.
+
+        Args:
+            only_if_missing: Skip if a snapshot exists (e.g. another worker
+                exported it first at startup)
+        """
+        import numpy as np
+
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if manifest and only_if_missing:
+                return None
+            generation = (manifest["generation"] + 1) if manifest else 1
+            name = f"base-{generation:06d}"
+            ids: List[int] = []
+            document_ids: List[Optional[str]] = []
+            dimensions = None
+
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with open(self.directory / f"{name}.f32.tmp", "wb") as matrix_file:
+                start = 0
+                while True:
+                    response = (
+                        self.client.table("chunk_documents")
+                        .select("id, document_id, embedding")
+                        .order("id")
+                        .range(start, start + self.export_page_size - 1)
+                        .execute()
+                    )
+                    page = response.data or []
+                    for row in page:
+                        vector = self._parse_vector(row["embedding"])
+                        dimensions = dimensions or len(vector)
+                        matrix_file.write(np.asarray(vector, dtype=np.float32).tobytes())
+                        ids.append(int(row["id"]))
+                        document_ids.append(row.get("document_id"))
+                    if len(page) < self.export_page_size:
+                        break
+                    start += self.export_page_size
+
+            if dimensions is None:
+                dimensions = manifest["dimensions"] if manifest else 0
+            self._commit_segment(name, ids, document_ids, [])
+            self._write_manifest({"generation": generation, "dimensions": dimensions, "base": name, "deltas": []})
+            self._remove_unreferenced()
+
+        print(f"Vector snapshot exported: {len(ids)} rows, {dimensions} dims ({name})")
+        return {"rows": len(ids), "dimensions": dimensions, "base": name}
+
+    def append_rows(self, ids: Sequence[int], document_ids: Sequence[Optional[str]], vectors: Sequence[Sequence[float]]):
+        """Append newly ingested rows as a delta segment."""
+        self._append_delta(ids, document_ids, vectors, tombstones=[])
+
+    def append_tombstone(self, document_id: str, chunk_ids: Optional[Sequence[int]] = None):
+        """
+        Hide a document's rows written before this point (all of them, or only
+        chunk_ids, e.g. the previous generation after a re-index).
+        """
+        tombstone = {"document_id": document_id, "chunk_ids": list(chunk_ids) if chunk_ids else None}
+        self._append_delta([], [], [], tombstones=[tombstone])
+
+    def compact(self) -> Optional[Dict[str, Any]]:
+        """Merge the base and all deltas into a new base, dropping deleted rows."""
+        import numpy as np
+
+        with self._write_lock():
+            if not self._refresh() or not self._manifest["deltas"]:
+                return None
+            manifest = self._manifest
+            generation = manifest["generation"] + 1
+            name = f"base-{generation:06d}"
+            ids: List[int] = []
+            document_ids: List[Optional[str]] = []
+
+            with open(self.directory / f"{name}.f32.tmp", "wb") as matrix_file:
+                for segment in self._segments:
+                    rows = np.flatnonzero(segment.alive)
+                    if len(rows):
+                        matrix_file.write(np.ascontiguousarray(segment.matrix[rows], dtype=np.float32).tobytes())
+                        ids.extend(int(chunk_id) for chunk_id in segment.ids[rows])
+                        document_ids.extend(segment.document_ids[rows].tolist())
+
+            self._commit_segment(name, ids, document_ids, [])
+            self._write_manifest({**manifest, "generation": generation, "base": name, "deltas": []})
+            self._remove_unreferenced()
+
+        print(f"Vector snapshot compacted: {len(ids)} rows ({name})")
+        return {"rows": len(ids), "base": name}
+
+    # -------------------------------------------------------------- internals
+
+    def _append_delta(self, ids, document_ids, vectors, tombstones):
+        import numpy as np
+
+        if not self.enabled:
+            return
+        with self._write_lock():
+            manifest = self._read_manifest()
+            if not manifest:
+                # No base yet; the first export will include these rows
+                return
+            name = f"delta-{manifest['generation']:06d}-{len(manifest['deltas']) + 1:04d}"
+            with open(self.directory / f"{name}.f32.tmp", "wb") as matrix_file:
+                if len(vectors):
+                    matrix_file.write(np.asarray(vectors, dtype=np.float32).tobytes())
+            self._commit_segment(name, list(ids), list(document_ids), tombstones)
+            manifest["deltas"].append(name)
+            self._write_manifest(manifest)
+            needs_compaction = len(manifest["deltas"]) > self.max_deltas
+
+        if needs_compaction:
+            self.compact()
+
+    def _commit_segment(self, name: str, ids, document_ids, tombstones):
+        sidecar = {"ids": ids, "document_ids": document_ids, "tombstones": tombstones}
+        sidecar_tmp = self.directory / f"{name}.json.tmp"
+        sidecar_tmp.write_text(json.dumps(sidecar))
+        os.replace(self.directory / f"{name}.f32.tmp", self.directory / f"{name}.f32")
+        os.replace(sidecar_tmp, self.directory / f"{name}.json")
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        tmp = self.directory / f"{MANIFEST_NAME}.tmp"
+        tmp.write_text(json.dumps(manifest))
+        os.replace(tmp, self.directory / MANIFEST_NAME)
+
+    def _read_manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads((self.directory / MANIFEST_NAME).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _refresh(self) -> bool:
+        """(Re)open segments if the manifest changed since they were loaded."""
+        try:
+            mtime = (self.directory / MANIFEST_NAME).stat().st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._manifest_mtime:
+            return True
+
+        manifest = self._read_manifest()
+        if not manifest:
+            return False
+        try:
+            segments = [self._open_segment(name, manifest["dimensions"]) for name in [manifest["base"], *manifest["deltas"]]]
+        except FileNotFoundError:
+            # Compaction replaced the files between reading the manifest and opening them
+            return self._segments != []
+        self._apply_tombstones(segments)
+        self._manifest, self._manifest_mtime, self._segments = manifest, mtime, segments
+        return True
+
+    def _open_segment(self, name: str, dimensions: int) -> SnapshotSegment:
+        import numpy as np
+
+        sidecar = json.loads((self.directory / f"{name}.json").read_text())
+        rows = len(sidecar["ids"])
+        path = self.directory / f"{name}.f32"
+        if rows and name.startswith("base-"):
+            # Read-only shared mapping: pages come from the OS page cache
+            matrix = np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dimensions))
+        else:
+            matrix = np.fromfile(path, dtype=np.float32).reshape(rows, dimensions)
+        return SnapshotSegment(
+            name,
+            matrix,
+            np.asarray(sidecar["ids"], dtype=np.int64),
+            np.asarray(sidecar["document_ids"], dtype=object),
+            sidecar.get("tombstones", []),
+        )
+
+    def _apply_tombstones(self, segments: List[SnapshotSegment]):
+        """A tombstone hides matching rows in every earlier segment (not later re-ingested rows)."""
+        import numpy as np
+
+        for index, segment in enumerate(segments):
+            segment.alive = np.ones(len(segment.ids), dtype=bool)
+            for later in segments[index + 1:]:
+                for tombstone in later.tombstones:
+                    dead = segment.document_ids == tombstone["document_id"]
+                    if tombstone.get("chunk_ids"):
+                        dead &= np.isin(segment.ids, tombstone["chunk_ids"])
+                    segment.alive &= ~dead
+
+    def _remove_unreferenced(self):
+        """Delete segment files no longer in the manifest (open mappings stay valid)."""
+        manifest = self._read_manifest() or {}
+        keep = {manifest.get("base"), *manifest.get("deltas", [])}
+        for path in self.directory.glob("*-*.*"):
+            if path.name.split(".", 1)[0] not in keep and not path.name.endswith(".tmp"):
+                path.unlink(missing_ok=True)
+
+    @contextmanager
+    def _write_lock(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _parse_vector(self, value) -> List[float]:
+        # pgvector columns come back from PostgREST as "[0.1,0.2,...]" strings
+        return json.loads(value) if isinstance(value, str) else list(value)
+
+
+vector_snapshot = VectorSnapshot()
@@ -1,32 +1,188 @@
-from typing import List, Dict, Any
+import os
+import json
+import asyncio
+import hashlib
+from typing import List, Dict, Any, Optional
 from app.configs.supabase import supabase_client
+from app.configs.embedding import EmbeddingConfig
+from app.services.redis_service import redis_service
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.vector_snapshot import vector_snapshot
+
+# RPCs that scan a quantized index first and rescore candidates at full precision
+QUANTIZED_MATCH_FUNCTIONS = {
+    "binary": "match_documents_binary",
+    "halfvec": "match_documents_halfvec",
+}
 
 class VectorStoreService:
     def __init__(self):
         self.client = supabase_client
+        self.quantization = EmbeddingConfig.quantization
+        self.rescore_multiplier = EmbeddingConfig.rescore_multiplier
+        # Retrieval results are cached per quantized query embedding and KB version
+        self.result_cache_enabled = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").strip().lower() == "true"
+        self.result_cache_ttl = int(os.getenv("RETRIEVAL_CACHE_TTL", 86400))
 
-    async def get_relevant_chunks(self, embedding: List[float], match_threshold: float = 0.5, match_count: int = 5) -> List[Dict[str, Any]]:
+    async def get_relevant_chunks(
+        self,
+        embedding: List[float],
+        match_threshold: float = 0.5,
+        match_count: int = 5,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
         """
         Calls the Supabase RPC function 'match_documents' to find relevant chunks.
+        If metadata filters are provided, calls 'match_documents_filtered' instead,
+        which narrows the candidate set before similarity ranking.
+        When EMBED_QUANTIZATION is "binary" or "halfvec", the quantized variant is
+        used and the top match_count * EMBED_RESCORE_MULTIPLIER candidates are
+        rescored at full precision.
+
+        Supported filter keys: document_ids, source_types, created_after.
+
+        With VECTOR_SNAPSHOT_ENABLED, searches that filter at most by
+        document_ids are ranked in-process against the memory-mapped vector
+        snapshot, and only the matching rows are read from Supabase.
+
+        Results (chunk ids, document_ids, scores and content) are cached in
+        Redis under the int8-quantized query embedding, the search arguments
+        and the KB version, so repeated queries skip the vector search and any
+        ingestion or deletion retires them.
         """
         if not self.client:
             print("Supabase client not initialized.")
             return []
 
+        cache_key = None
+        if self.result_cache_enabled:
+            cache_key = await self._result_cache_key(embedding, match_threshold, match_count, filters)
+            cached = await redis_service.get_cache(cache_key)
+            if cached:
+                print("Retrieval Cache Hit")
+                return json.loads(cached)
+
+        if vector_snapshot.enabled and set(filters or {}) <= {"document_ids"}:
+            chunks = await self._search_snapshot(embedding, match_threshold, match_count, filters)
+            if chunks is not None:
+                if cache_key:
+                    await redis_service.set_cache(cache_key, json.dumps(chunks, default=str), expire=self.result_cache_ttl)
+                return chunks
+
         try:
-            # RPC call to match_documents
-            response = self.client.rpc(
-                "match_documents",
-                {
-                    "query_embedding": embedding,
-                    "match_threshold": match_threshold,
-                    "match_count": match_count,
-                }
-            ).execute()
-            
-            return response.data if response.data else []
+            params = {
+                "query_embedding": embedding,
+                "match_threshold": match_threshold,
+                "match_count": match_count,
+            }
+
+            filter_params = self._build_filter_params(filters)
+            quantized_function = QUANTIZED_MATCH_FUNCTIONS.get(self.quantization)
+            if filter_params:
+                print(f"Applying retrieval filters: {filter_params}")
+
+            if quantized_function:
+                request = self.client.rpc(
+                    quantized_function,
+                    {
+                        **params,
+                        "rescore_count": match_count * self.rescore_multiplier,
+                        **filter_params,
+                    }
+                )
+            elif filter_params:
+                request = self.client.rpc(
+                    "match_documents_filtered",
+                    {**params, **filter_params}
+                )
+            else:
+                # RPC call to match_documents
+                request = self.client.rpc("match_documents", params)
+
+            # The Supabase client is synchronous; run it off the event loop so
+            # concurrent searches don't block each other
+            response = await asyncio.to_thread(request.execute)
+
+            chunks = response.data if response.data else []
+            if chunks:
+                print(f"Retrieval scores: {[round(chunk.get('similarity') or 0, 3) for chunk in chunks]}")
+            if cache_key:
+                await redis_service.set_cache(cache_key, json.dumps(chunks, default=str), expire=self.result_cache_ttl)
+            return chunks
         except Exception as e:
             print(f"Error searching vector store: {e}")
             return []
 
+    async def _search_snapshot(
+        self,
+        embedding: List[float],
+        match_threshold: float,
+        match_count: int,
+        filters: Optional[Dict[str, Any]]
+    ) -> Optional[List[Dict[str, Any]]]:
+        """Rank against the local snapshot; None if it isn't available (use the RPC)."""
+        try:
+            if not vector_snapshot.is_ready:
+                return None
+            matches = await asyncio.to_thread(
+                vector_snapshot.search,
+                embedding,
+                match_count,
+                match_threshold,
+                (filters or {}).get("document_ids")
+            )
+            if not matches:
+                return []
+
+            scores = dict(matches)
+            request = (
+                self.client.table("chunk_documents")
+                .select("id, document_id, content, metadata")
+                .in_("id", list(scores))
+            )
+            response = await asyncio.to_thread(request.execute)
+            # Rows deleted since the snapshot was written are simply missing here
+            chunks = [{**row, "similarity": scores[row["id"]]} for row in response.data or []]
+            chunks.sort(key=lambda chunk: chunk["similarity"], reverse=True)
+            print(f"Snapshot search: {len(chunks)} chunks, scores {[round(chunk['similarity'], 3) for chunk in chunks]}")
+            return chunks
+        except Exception as e:
+            print(f"Error searching vector snapshot, falling back to RPC: {e}")
+            return None
+
+    async def _result_cache_key(
+        self,
+        embedding: List[float],
+        match_threshold: float,
+        match_count: int,
+        filters: Optional[Dict[str, Any]]
+    ) -> str:
+        # int8 quantization absorbs float noise, so identical normalized queries share a key
+        quantized = bytes((max(-127, min(127, round(value * 127))) & 0xFF) for value in embedding)
+        search_args = json.dumps(
+            [match_threshold, match_count, self.quantization, filters or {}],
+            sort_keys=True,
+            default=str
+        )
+        digest = hashlib.sha256(quantized + search_args.encode("utf-8")).hexdigest()[:32]
+        kb_version = await knowledge_base_service.get_version()
+        return f"retrieval:{kb_version}:{digest}"
+
+    def _build_filter_params(self, filters: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Map request filters onto the match_documents_filtered RPC arguments.
+        Empty or missing filters are dropped so the RPC treats them as disabled.
+        """
+        if not filters:
+            return {}
+
+        params = {}
+        if filters.get("document_ids"):
+            params["filter_document_ids"] = list(filters["document_ids"])
+        if filters.get("source_types"):
+            params["filter_source_types"] = list(filters["source_types"])
+        if filters.get("created_after"):
+            params["filter_created_after"] = str(filters["created_after"])
+        return params
+
 vectorstore_service = VectorStoreService()
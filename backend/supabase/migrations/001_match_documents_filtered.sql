@@ -0,0 +1,66 @@
+-- Metadata-filtered similarity search over chunk_documents.
+--
+-- Filters are applied in the WHERE clause so the planner can narrow the
+-- candidate set (via the btree/GIN indexes below) before the vector distance
+-- is computed and ranked. All filter arguments are optional; passing NULL
+-- disables that filter.
+
+-- Existing chunks take their document's upload time, not the migration time,
+-- so created_after filters are right for old rows too
+alter table chunk_documents
+    add column if not exists created_at timestamptz;
+
+update chunk_documents c
+   set created_at = d.created_at
+  from documents d
+ where d.id = c.document_id
+   and c.created_at is null;
+
+update chunk_documents
+   set created_at = now()
+ where created_at is null;
+
+alter table chunk_documents
+    alter column created_at set default now(),
+    alter column created_at set not null;
+
+create index if not exists chunk_documents_document_id_idx
+    on chunk_documents (document_id);
+
+create index if not exists chunk_documents_source_type_idx
+    on chunk_documents ((metadata ->> 'source_type'));
+
+create index if not exists chunk_documents_created_at_idx
+    on chunk_documents (created_at);
+
+create or replace function match_documents_filtered(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count int,
+    filter_document_ids uuid[] default null,
+    filter_source_types text[] default null,
+    filter_created_after timestamptz default null
+)
+returns table (
+    id bigint,
+    document_id uuid,
+    content text,
+    metadata jsonb,
+    similarity float
+)
+language sql stable
+as $$
+    select
+        c.id,
+        c.document_id,
+        c.content,
+        c.metadata,
+        1 - (c.embedding <=> query_embedding) as similarity
+    from chunk_documents c
+    where (filter_document_ids is null or c.document_id = any (filter_document_ids))
+      and (filter_source_types is null or c.metadata ->> 'source_type' = any (filter_source_types))
+      and (filter_created_after is null or c.created_at >= filter_created_after)
+      and 1 - (c.embedding <=> query_embedding) > match_threshold
+    order by c.embedding <=> query_embedding
+    limit match_count;
+$$;
@@ -0,0 +1,99 @@
+-- Quantized first-pass search with full-precision rescoring.
+--
+-- The quantized copies live only in expression indexes, so no extra columns are
+-- stored: binary_quantize() keeps one bit per dimension (32x smaller than
+-- float32) and halfvec keeps two bytes per dimension. Each function scans the
+-- quantized index for `rescore_count` candidates, then reranks those with the
+-- exact cosine distance on the original embedding.
+--
+-- pgvector has no int8 vector type; halfvec is the indexable middle ground
+-- between binary and full precision.
+--
+-- Requires pgvector >= 0.7.0. Dimensions here assume the full 768-dim
+-- text-embedding-004 output; see 003_reduce_embedding_dimensions.sql.
+
+create index if not exists chunk_documents_embedding_binary_idx
+    on chunk_documents
+    using hnsw ((binary_quantize(embedding)::bit(768)) bit_hamming_ops);
+
+create index if not exists chunk_documents_embedding_halfvec_idx
+    on chunk_documents
+    using hnsw ((embedding::halfvec(768)) halfvec_cosine_ops);
+
+create or replace function match_documents_binary(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count int,
+    rescore_count int,
+    filter_document_ids uuid[] default null,
+    filter_source_types text[] default null,
+    filter_created_after timestamptz default null
+)
+returns table (
+    id bigint,
+    document_id uuid,
+    content text,
+    metadata jsonb,
+    similarity float
+)
+language sql stable
+as $$
+    with candidates as (
+        select c.id, c.document_id, c.content, c.metadata, c.embedding
+        from chunk_documents c
+        where (filter_document_ids is null or c.document_id = any (filter_document_ids))
+          and (filter_source_types is null or c.metadata ->> 'source_type' = any (filter_source_types))
+          and (filter_created_after is null or c.created_at >= filter_created_after)
+        order by binary_quantize(c.embedding)::bit(768) <~> binary_quantize(query_embedding)
+        limit rescore_count
+    )
+    select
+        candidates.id,
+        candidates.document_id,
+        candidates.content,
+        candidates.metadata,
+        1 - (candidates.embedding <=> query_embedding) as similarity
+    from candidates
+    where 1 - (candidates.embedding <=> query_embedding) > match_threshold
+    order by candidates.embedding <=> query_embedding
+    limit match_count;
+$$;
+
+create or replace function match_documents_halfvec(
+    query_embedding vector(768),
+    match_threshold float,
+    match_count int,
+    rescore_count int,
+    filter_document_ids uuid[] default null,
+    filter_source_types text[] default null,
+    filter_created_after timestamptz default null
+)
+returns table (
+    id bigint,
+    document_id uuid,
+    content text,
+    metadata jsonb,
+    similarity float
+)
+language sql stable
+as $$
+    with candidates as (
+        select c.id, c.document_id, c.content, c.metadata, c.embedding
+        from chunk_documents c
+        where (filter_document_ids is null or c.document_id = any (filter_document_ids))
+          and (filter_source_types is null or c.metadata ->> 'source_type' = any (filter_source_types))
+          and (filter_created_after is null or c.created_at >= filter_created_after)
+        order by c.embedding::halfvec(768) <=> query_embedding::halfvec(768)
+        limit rescore_count
+    )
+    select
+        candidates.id,
+        candidates.document_id,
+        candidates.content,
+        candidates.metadata,
+        1 - (candidates.embedding <=> query_embedding) as similarity
+    from candidates
+    where 1 - (candidates.embedding <=> query_embedding) > match_threshold
+    order by candidates.embedding <=> query_embedding
+    limit match_count;
+$$;
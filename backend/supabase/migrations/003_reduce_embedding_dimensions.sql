@@ -0,0 +1,157 @@
+-- Re-encode stored embeddings to a reduced dimensionality (768 -> 256).
+--
+-- text-embedding-004 embeddings can be shortened by keeping the leading
+-- dimensions and re-normalizing, which matches what the model returns when
+-- called with output_dimensionality. Existing rows are therefore re-encoded in
+-- place without calling the embedding API again.
+--
+-- Run this together with EMBED_OUTPUT_DIMENSIONALITY=256 in the backend
+-- environment so newly ingested chunks and chat queries use the same size.
+-- To pick a different size, replace every 256 below.
+
+drop index if exists chunk_documents_embedding_binary_idx;
+drop index if exists chunk_documents_embedding_halfvec_idx;
+
+drop function if exists match_documents(vector, float, int);
+drop function if exists match_documents_filtered(vector, float, int, uuid[], text[], timestamptz);
+drop function if exists match_documents_binary(vector, float, int, int, uuid[], text[], timestamptz);
+drop function if exists match_documents_halfvec(vector, float, int, int, uuid[], text[], timestamptz);
+
+alter table chunk_documents
+    alter column embedding type vector(256)
+    using l2_normalize(subvector(embedding, 1, 256))::vector(256);
+
+create index if not exists chunk_documents_embedding_binary_idx
+    on chunk_documents
+    using hnsw ((binary_quantize(embedding)::bit(256)) bit_hamming_ops);
+
+create index if not exists chunk_documents_embedding_halfvec_idx
+    on chunk_documents
+    using hnsw ((embedding::halfvec(256)) halfvec_cosine_ops);
+
+create or replace function match_documents_filtered(
+    query_embedding vector(256),
+    match_threshold float,
+    match_count int,
+    filter_document_ids uuid[] default null,
+    filter_source_types text[] default null,
+    filter_created_after timestamptz default null
+)
+returns table (
+    id bigint,
+    document_id uuid,
+    content text,
+    metadata jsonb,
+    similarity float
+)
+language sql stable
+as $$
+    select
+        c.id,
+        c.document_id,
+        c.content,
+        c.metadata,
+        1 - (c.embedding <=> query_embedding) as similarity
+    from chunk_documents c
+    where (filter_document_ids is null or c.document_id = any (filter_document_ids))
+      and (filter_source_types is null or c.metadata ->> 'source_type' = any (filter_source_types))
+      and (filter_created_after is null or c.created_at >= filter_created_after)
+      and 1 - (c.embedding <=> query_embedding) > match_threshold
+    order by c.embedding <=> query_embedding
+    limit match_count;
+$$;
+
+create or replace function match_documents(
+    query_embedding vector(256),
+    match_threshold float,
+    match_count int
+)
+returns table (
+    id bigint,
+    document_id uuid,
+    content text,
+    metadata jsonb,
+    similarity float
+)
+language sql stable
+as $$
+    select * from match_documents_filtered(query_embedding, match_threshold, match_count);
+$$;
+
+create or replace function match_documents_binary(
+    query_embedding vector(256),
+    match_threshold float,
+    match_count int,
+    rescore_count int,
+    filter_document_ids uuid[] default null,
+    filter_source_types text[] default null,
+    filter_created_after timestamptz default null
+)
+returns table (
+    id bigint,
+    document_id uuid,
+    content text,
+    metadata jsonb,
+    similarity float
+)
+language sql stable
+as $$
+    with candidates as (
+        select c.id, c.document_id, c.content, c.metadata, c.embedding
+        from chunk_documents c
+        where (filter_document_ids is null or c.document_id = any (filter_document_ids))
+          and (filter_source_types is null or c.metadata ->> 'source_type' = any (filter_source_types))
+          and (filter_created_after is null or c.created_at >= filter_created_after)
+        order by binary_quantize(c.embedding)::bit(256) <~> binary_quantize(query_embedding)
+        limit rescore_count
+    )
+    select
+        candidates.id,
+        candidates.document_id,
+        candidates.content,
+        candidates.metadata,
+        1 - (candidates.embedding <=> query_embedding) as similarity
+    from candidates
+    where 1 - (candidates.embedding <=> query_embedding) > match_threshold
+    order by candidates.embedding <=> query_embedding
+    limit match_count;
+$$;
+
+create or replace function match_documents_halfvec(
+    query_embedding vector(256),
+    match_threshold float,
+    match_count int,
+    rescore_count int,
+    filter_document_ids uuid[] default null,
+    filter_source_types text[] default null,
+    filter_created_after timestamptz default null
+)
+returns table (
+    id bigint,
+    document_id uuid,
+    content text,
+    metadata jsonb,
+    similarity float
+)
+language sql stable
+as $$
+    with candidates as (
+        select c.id, c.document_id, c.content, c.metadata, c.embedding
+        from chunk_documents c
+        where (filter_document_ids is null or c.document_id = any (filter_document_ids))
+          and (filter_source_types is null or c.metadata ->> 'source_type' = any (filter_source_types))
+          and (filter_created_after is null or c.created_at >= filter_created_after)
+        order by c.embedding::halfvec(256) <=> query_embedding::halfvec(256)
+        limit rescore_count
+    )
+    select
+        candidates.id,
+        candidates.document_id,
+        candidates.content,
+        candidates.metadata,
+        1 - (candidates.embedding <=> query_embedding) as similarity
+    from candidates
+    where 1 - (candidates.embedding <=> query_embedding) > match_threshold
+    order by candidates.embedding <=> query_embedding
+    limit match_count;
+$$;
@@ -0,0 +1,58 @@
+-- Bulk removal of a document's chunks and garbage collection of orphaned chunks.
+--
+-- Deleting a document in the knowledge-base UI removes its `documents` row but
+-- leaves its rows in chunk_documents, where they keep taking part in every
+-- match_documents search. These functions let the backend delete a document's
+-- chunks in one statement (using chunk_documents_document_id_idx from 001) and
+-- sweep chunks whose parent document no longer exists.
+
+-- Delete every chunk of a document, or only those with id <= max_chunk_id so a
+-- re-index can remove the previous generation after the new one is written.
+-- Returns the number of rows deleted.
+create or replace function delete_document_chunks(
+    target_document_id uuid,
+    max_chunk_id bigint default null
+)
+returns bigint
+language plpgsql
+as $$
+declare
+    deleted_count bigint;
+begin
+    delete from chunk_documents
+    where document_id = target_document_id
+      and (max_chunk_id is null or id <= max_chunk_id);
+    get diagnostics deleted_count = row_count;
+    return deleted_count;
+end;
+$$;
+
+-- Delete up to batch_size chunks whose document_id has no `documents` row
+-- (including chunks with a NULL document_id). Callers loop until a batch
+-- comes back smaller than batch_size, which keeps each transaction short.
+-- Returns one row per affected document_id with the number of chunks deleted.
+create or replace function gc_orphan_chunks(batch_size int default 5000)
+returns table (
+    document_id uuid,
+    deleted bigint
+)
+language sql
+as $$
+    with orphans as (
+        select c.id
+        from chunk_documents c
+        where not exists (
+            select 1 from documents d where d.id = c.document_id
+        )
+        limit batch_size
+    ),
+    removed as (
+        delete from chunk_documents c
+        using orphans o
+        where c.id = o.id
+        returning c.document_id
+    )
+    select removed.document_id, count(*) as deleted
+    from removed
+    group by removed.document_id;
+$$;
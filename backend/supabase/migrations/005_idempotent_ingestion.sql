@@ -0,0 +1,30 @@
+-- Idempotent, resumable ingestion.
+--
+-- Every chunk row records its position in the document (chunk_index) and an
+-- ingest_hash derived from the source file, its metadata and the
+-- chunking/embedding settings. The unique index lets ingestion upsert on
+-- (document_id, ingest_hash, chunk_index), so a retried or repeated write of
+-- the same content updates rows in place instead of duplicating them.
+-- Rows written before this migration have NULL keys and are never matched.
+
+alter table chunk_documents
+    add column if not exists chunk_index int,
+    add column if not exists ingest_hash text;
+
+create unique index if not exists chunk_documents_ingest_key_idx
+    on chunk_documents (document_id, ingest_hash, chunk_index);
+
+-- Delete a document's chunks from every other ingestion (used by re-index once
+-- the new generation is written). Returns the ids of the deleted rows.
+create or replace function delete_stale_document_chunks(
+    target_document_id uuid,
+    keep_ingest_hash text
+)
+returns table (id bigint)
+language sql
+as $$
+    delete from chunk_documents c
+    where c.document_id = target_document_id
+      and c.ingest_hash is distinct from keep_ingest_hash
+    returning c.id;
+$$;
@@ -0,0 +1,16 @@
+-- Size of the whole knowledge base in tokens, for the cache-augmented
+-- generation (CAG) size check. Summing the token_count stored in each chunk's
+-- metadata at ingestion (estimated from the content length for older chunks)
+-- lets the backend decide whether the corpus can fit in a context cache
+-- without first reading every chunk. The sum includes title prefixes and
+-- chunk overlaps, so it is an upper bound on the assembled corpus.
+create or replace function corpus_token_count()
+returns bigint
+language sql stable
+as $$
+    select coalesce(
+        sum(coalesce((metadata ->> 'token_count')::bigint, ceil(length(content) / 4.0)::bigint)),
+        0
+    )::bigint
+    from chunk_documents;
+$$;
@@ -0,0 +1,70 @@
+import math
+
+from langchain_core.documents import Document
+
+from app.services.chunking_service import StructureAwareChunker, pack_chunks
+
+
+class WordPieceCounter:
+    """Deterministic stand-in for the model tokenizer: long words cost more tokens."""
+
+    def count(self, text: str) -> int:
+        return sum(math.ceil(len(word) / 3) for word in text.split())
+
+
+def chunk(text: str, chunk_tokens: int = 40, overlap: int = 8, prefix: str = "[Guide] - "):
+    counter = WordPieceCounter()
+    chunker = StructureAwareChunker(chunk_tokens=chunk_tokens, chunk_overlap_tokens=overlap, token_counter=counter)
+    return counter, chunker.split_documents([Document(page_content=text, metadata={"page": 1})], prefix=prefix)
+
+
+def test_chunks_from_an_oversized_sentence_stay_within_budget():
+    # One sentence, short words first and long words later: a proportional
+    # words-per-window estimate overshoots on the long-word windows
+    words = ["a", "to", "be"] * 30 + ["internationalization", "responsibilities"] * 20
+    counter, chunks = chunk(" ".join(words))
+
+    assert len(chunks) > 1
+    for document in chunks:
+        assert document.metadata["token_count"] == counter.count(document.page_content)
+        assert document.metadata["token_count"] <= 40
+        assert document.page_content.startswith("[Guide] - ")
+        assert document.metadata["page"] == 1
+
+
+def test_every_word_is_kept_in_order():
+    words = [f"word{i}" for i in range(200)]
+    _, chunks = chunk(" ".join(words), overlap=0)
+
+    seen = []
+    for document in chunks:
+        seen.extend(document.page_content[len("[Guide] - "):].split())
+    assert seen == words
+
+
+def test_over_long_word_is_split_by_characters():
+    counter, chunks = chunk("x" * 300, chunk_tokens=40, prefix="")
+
+    assert "".join(document.page_content for document in chunks) == "x" * 300
+    assert all(document.metadata["token_count"] <= 40 for document in chunks)
+
+
+def test_headings_start_a_new_chunk():
+    _, chunks = chunk("Intro text here.\n\n# Pricing\n\nPlans start small.", chunk_tokens=200)
+
+    assert [document.page_content for document in chunks] == [
+        "[Guide] - Intro text here.",
+        "[Guide] - # Pricing\n\nPlans start small.",
+    ]
+
+
+def test_pack_chunks_uses_stored_token_counts():
+    chunks = [
+        {"content": "a", "metadata": {"token_count": 30}},
+        {"content": "b", "metadata": {"token_count": 30}},
+        {"content": "c", "metadata": {"token_count": 30}},
+    ]
+    packed, used = pack_chunks(chunks, 70)
+
+    assert [c["content"] for c in packed] == ["a", "b"]
+    assert used == 60
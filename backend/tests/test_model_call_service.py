@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from app.services.model_call_service import CircuitOpenError, ModelCallError, ModelCallService
+
+
+def open_circuit(service: ModelCallService, name: str):
+    breaker = service._breaker(name)
+    for _ in range(service.breaker_threshold):
+        breaker.record_failure()
+    # Cooldown elapsed: the next call is the half-open trial
+    breaker.opened_at -= service.breaker_cooldown
+    assert breaker.state == "half_open"
+    return breaker
+
+
+def test_cancelled_half_open_trial_releases_the_circuit():
+    service = ModelCallService()
+    breaker = open_circuit(service, "generation")
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(60)
+
+        trial = asyncio.create_task(service.call("generation", hang, retries=0))
+        await started.wait()
+
+        # Only one trial at a time while it is in flight
+        with pytest.raises(CircuitOpenError):
+            await service.call("generation", lambda: asyncio.sleep(0, result="late"), retries=0)
+
+        trial.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await trial
+
+        return await service.call("generation", lambda: asyncio.sleep(0, result="ok"), retries=0)
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == "closed"
+
+
+class InvalidArgument(Exception):
+    """Named like google.api_core's 400 error: not retryable."""
+
+
+class ServiceUnavailable(Exception):
+    """Named like google.api_core's 503 error: retryable."""
+
+
+def failing(error: Exception):
+    async def fail():
+        raise error
+    return fail
+
+
+def test_bad_requests_do_not_open_the_circuit():
+    service = ModelCallService()
+
+    async def scenario():
+        for _ in range(service.breaker_threshold + 1):
+            with pytest.raises(ModelCallError):
+                await service.call("generation", failing(InvalidArgument("bad prompt")), retries=0)
+
+    asyncio.run(scenario())
+    assert service._breaker("generation").state == "closed"
+    assert service.metrics()["generation"]["failures"] == service.breaker_threshold + 1
+
+
+def test_transient_errors_open_the_circuit():
+    service = ModelCallService()
+
+    async def scenario():
+        for _ in range(service.breaker_threshold):
+            with pytest.raises(ModelCallError):
+                await service.call("generation", failing(ServiceUnavailable("down")), retries=0)
+        with pytest.raises(CircuitOpenError):
+            await service.call("generation", lambda: asyncio.sleep(0, result="ok"))
+
+    asyncio.run(scenario())
+    assert service._breaker("generation").state == "open"
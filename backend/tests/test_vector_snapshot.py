@@ -0,0 +1,104 @@
+from app.services.vector_snapshot import VectorSnapshot
+
+
+class FakeQuery:
+    def __init__(self, rows):
+        self.rows = rows
+        self.bounds = (0, len(rows) - 1)
+
+    def select(self, *args):
+        return self
+
+    def order(self, *args):
+        return self
+
+    def range(self, start, end):
+        self.bounds = (start, end)
+        return self
+
+    def execute(self):
+        start, end = self.bounds
+        return type("Response", (), {"data": self.rows[start:end + 1]})()
+
+
+class FakeClient:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def table(self, name):
+        assert name == "chunk_documents"
+        return FakeQuery(self.rows)
+
+
+def make_snapshot(directory, rows=()):
+    snapshot = VectorSnapshot()
+    snapshot.enabled = True
+    snapshot.directory = directory
+    snapshot.client = FakeClient(list(rows))
+    return snapshot
+
+
+def exported(directory):
+    rows = [
+        {"id": 1, "document_id": "a", "embedding": [1.0, 0.0]},
+        {"id": 2, "document_id": "a", "embedding": [0.0, 1.0]},
+        {"id": 3, "document_id": "b", "embedding": [0.6, 0.8]},
+    ]
+    snapshot = make_snapshot(directory, rows)
+    snapshot.export()
+    return snapshot
+
+
+def search_ids(directory, document_ids=None):
+    # A fresh instance reads the manifest like another worker would
+    results = make_snapshot(directory).search([1.0, 0.0], match_count=10, match_threshold=-1.0, document_ids=document_ids)
+    return [chunk_id for chunk_id, _ in results]
+
+
+def test_export_makes_every_row_searchable(tmp_path):
+    exported(tmp_path)
+
+    assert search_ids(tmp_path) == [1, 3, 2]
+    assert search_ids(tmp_path, document_ids=["b"]) == [3]
+
+
+def test_tombstone_hides_earlier_rows_but_not_rows_ingested_after_it(tmp_path):
+    snapshot = exported(tmp_path)
+
+    snapshot.append_tombstone("a")
+    assert search_ids(tmp_path) == [3]
+
+    snapshot.append_rows([4], ["a"], [[1.0, 0.0]])
+    assert search_ids(tmp_path) == [4, 3]
+
+
+def test_chunk_tombstone_hides_only_the_listed_chunks(tmp_path):
+    snapshot = exported(tmp_path)
+
+    snapshot.append_tombstone("a", chunk_ids=[1])
+
+    assert search_ids(tmp_path) == [3, 2]
+
+
+def test_upserted_row_is_returned_once_with_its_newest_document(tmp_path):
+    snapshot = exported(tmp_path)
+
+    snapshot.append_rows([2], ["c"], [[1.0, 0.0]])
+    results = make_snapshot(tmp_path).search([1.0, 0.0], match_count=10, match_threshold=-1.0)
+
+    assert [chunk_id for chunk_id, _ in results].count(2) == 1
+    assert dict(results)[2] == 1.0
+    assert make_snapshot(tmp_path).document_ids_for([2]) == {2: "c"}
+
+
+def test_compaction_drops_tombstoned_rows(tmp_path):
+    snapshot = exported(tmp_path)
+    snapshot.max_deltas = 1
+
+    snapshot.append_tombstone("a", chunk_ids=[2])
+    snapshot.append_rows([5], ["b"], [[0.0, 1.0]])
+
+    status = make_snapshot(tmp_path).status()
+    assert status["deltas"] == 0
+    assert status["rows"] == 3
+    assert search_ids(tmp_path) == [1, 3, 5]
@@ -1,3 +1,4 @@
+from typing import Optional
 from pydantic_settings import BaseSettings  # use this instead of pydantic.BaseSettings
 
 class Settings(BaseSettings):
@@ -7,6 +8,31 @@ class Settings(BaseSettings):
     SMTP_USER: str
     SMTP_PASSWORD: str
     TO_EMAIL: str
+    SMTP_TIMEOUT: float = 30
+    SMTP_IDLE_TIMEOUT: float = 60  # close the shared connection after this long unused
+
+    # Notification outbox
+    OUTBOX_BATCH_SIZE: int = 20
+    OUTBOX_POLL_INTERVAL: float = 10  # seconds between checks for retries / other workers' submissions
+    OUTBOX_MAX_ATTEMPTS: int = 8
+    OUTBOX_BACKOFF_BASE: float = 30  # seconds, doubled per failed attempt
+    OUTBOX_BACKOFF_MAX: float = 3600
+    OUTBOX_LEASE_SECONDS: int = 120
+
+    # Submission write buffer and lead export
+    SUBMISSIONS_FLUSH_SIZE: int = 100
+    SUBMISSIONS_FLUSH_INTERVAL: float = 0.05  # max seconds a submission waits for its batch
+    SUBMISSIONS_EXPORT_BATCH_SIZE: int = 500
+    ADMIN_TOKEN: Optional[str] = None  # required (X-Admin-Token) to list/export submissions and read outbox stats
+
+    # Spam / duplicate filter (shared via Redis when REDIS_URL is set, else per process)
+    REDIS_URL: Optional[str] = None
+    CONTACT_IP_LIMIT: int = 5
+    CONTACT_IP_WINDOW: int = 600  # seconds
+    CONTACT_EMAIL_LIMIT: int = 3
+    CONTACT_EMAIL_WINDOW: int = 3600
+    CONTACT_DEDUP_WINDOW: int = 86400
+    TRUSTED_PROXY_COUNT: int = 0  # proxies in front of the API; X-Forwarded-For is ignored when 0
 
     class Config:
         env_file = ".env"  # automatically loads .env
@@ -1,11 +1,14 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Header, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel, EmailStr
 from fastapi.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
-from email.message import EmailMessage
-import aiosmtplib
 from datetime import datetime
+from typing import Literal, Optional
 from config import settings  # <-- load env variables
+from outbox import EmailOutbox
+from submissions import SubmissionStore
+from spam_filter import SubmissionFilter
 
 app = FastAPI(title="Contact Form API")
 
@@ -22,12 +25,35 @@ client = AsyncIOMotorClient(settings.MONGO_URL)
 db = client["contact_form_db"]
 collection = db["submissions"]
 
-# Email setup
-SMTP_HOST = settings.SMTP_HOST
-SMTP_PORT = settings.SMTP_PORT
-SMTP_USER = settings.SMTP_USER
-SMTP_PASSWORD = settings.SMTP_PASSWORD
-TO_EMAIL = settings.TO_EMAIL
+# Submissions are written in batches; email notifications are queued on them and sent in the background
+submissions = SubmissionStore(collection)
+outbox = EmailOutbox(collection)
+spam_filter = SubmissionFilter()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    await submissions.start()
+    await outbox.start()
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    await submissions.stop()
+    await outbox.stop()
+
+def client_ip(request: Request) -> Optional[str]:
+    # The hop appended by the outermost trusted proxy is the client; anything
+    # left of it is client-supplied and would let a sender pick its own IP
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if settings.TRUSTED_PROXY_COUNT > 0 and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+        if len(hops) >= settings.TRUSTED_PROXY_COUNT:
+            return hops[-settings.TRUSTED_PROXY_COUNT]
+    return request.client.host if request.client else None
+
+def require_admin(token: Optional[str]):
+    # Lead data is only readable when an admin token is configured and sent
+    if not settings.ADMIN_TOKEN or token != settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Forbidden")
 
 # Pydantic model
 class ContactForm(BaseModel):
@@ -36,40 +62,68 @@ class ContactForm(BaseModel):
     email: EmailStr
     project_details: str
 
-async def send_email(form: ContactForm):
-    message = EmailMessage()
-    message["From"] = SMTP_USER
-    message["To"] = TO_EMAIL
-    message["Subject"] = f"New Contact Form Submission from {form.first_name} {form.last_name}"
-    message.set_content(f"""
-New contact form submission:
-
-Name: {form.first_name} {form.last_name}
-Email: {form.email}
-
-Project Details:
-{form.project_details}
-""")
-    await aiosmtplib.send(
-        message,
-        hostname=SMTP_HOST,
-        port=SMTP_PORT,
-        start_tls=True,
-        username=SMTP_USER,
-        password=SMTP_PASSWORD,
-    )
-
 @app.post("/api/contact")
-async def receive_contact(form: ContactForm):
-    # Save to MongoDB
+async def receive_contact(form: ContactForm, request: Request):
+    # Reject floods and repeats before any database or mail work
+    content = f"{form.first_name} {form.last_name}\n{form.project_details}"
+    decision = await spam_filter.check(client_ip(request), form.email, content)
+    if decision.reason == "duplicate":
+        return JSONResponse(status_code=409, content={"message": "We have already received this message."})
+    if not decision.allowed:
+        return JSONResponse(
+            status_code=429,
+            content={"message": "Too many submissions. Please try again later."},
+            headers={"Retry-After": str(decision.retry_after)},
+        )
+
+    # Save to MongoDB with the notification queued; the response doesn't wait on SMTP
     submission = form.dict()
     submission["created_at"] = datetime.utcnow()
-    await collection.insert_one(submission)
-
-    # Send email notification
+    submission.update(outbox.pending_fields())
     try:
-        await send_email(form)
-    except Exception as e:
-        print("Failed to send email:", e)
+        await submissions.add(submission)
+    except Exception:
+        await spam_filter.release(decision)
+        raise
+    outbox.notify()
 
     return {"message": "Form submitted successfully!"}
+
+@app.get("/api/contact/submissions")
+async def list_submissions(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    email: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    x_admin_token: Optional[str] = Header(None),
+):
+    # Newest first; pass next_cursor back to get the following page
+    require_admin(x_admin_token)
+    try:
+        return await submissions.list(limit, cursor, email, since, until)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@app.get("/api/contact/submissions/export")
+async def export_submissions(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    email: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    x_admin_token: Optional[str] = Header(None),
+):
+    # Streams every matching submission straight from the Mongo cursor
+    require_admin(x_admin_token)
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        submissions.export(format, email, since, until),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=submissions.{format}"},
+    )
+
+@app.get("/api/contact/outbox")
+async def outbox_status(x_admin_token: Optional[str] = Header(None)):
+    # Submissions per delivery status (pending, sending, sent, failed)
+    require_admin(x_admin_token)
+    return await outbox.stats()
@@ -0,0 +1,236 @@
+import uuid
+import asyncio
+import random
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from typing import List, Optional
+
+import aiosmtplib
+from pymongo import ReturnDocument
+
+from config import settings
+
+# delivery_status values
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+def build_message(submission: dict) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = settings.SMTP_USER
+    message["To"] = settings.TO_EMAIL
+    message["Subject"] = f"New Contact Form Submission from {submission['first_name']} {submission['last_name']}"
+    message.set_content(f"""
+New contact form submission:
+
+Name: {submission['first_name']} {submission['last_name']}
+Email: {submission['email']}
+
+Project Details:
+{submission['project_details']}
+""")
+    return message
+
+
+class EmailOutbox:
+    """
+    Durable outbox for contact form notifications.
+
+    Submissions are stored with delivery_status "pending" and the request
+    returns right away. A background sender claims pending submissions in
+    batches, delivers them over one persistent authenticated SMTP connection
+    and retries failures with exponential backoff, giving up as "failed"
+    after OUTBOX_MAX_ATTEMPTS. Claims are leases (locked_until plus a
+    claim_token), so several API workers can each run a sender, and a
+    crashed sender's claims are retried once the lease runs out. The lease
+    is renewed before each message and every status update requires the
+    claim token, so a sender that lost its lease can't overwrite the row.
+    Attempts are counted when claimed, so a message that keeps crashing the
+    sender still ends up "failed".
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+        self._last_used = 0.0
+
+    async def start(self):
+        await self.collection.create_index([("delivery_status", 1), ("next_attempt_at", 1)])
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        await self._close()
+
+    def pending_fields(self) -> dict:
+        """Delivery fields for a new submission (queued for the sender)."""
+        return {
+            "delivery_status": PENDING,
+            "delivery_attempts": 0,
+            "next_attempt_at": datetime.utcnow(),
+        }
+
+    def notify(self):
+        """Wake the sender now instead of at the next poll."""
+        self._wake.set()
+
+    async def stats(self) -> dict:
+        counts = {PENDING: 0, SENDING: 0, SENT: 0, FAILED: 0}
+        async for row in self.collection.aggregate([
+            {"$match": {"delivery_status": {"$exists": True}}},
+            {"$group": {"_id": "$delivery_status", "count": {"$sum": 1}}},
+        ]):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+    async def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                batch = await self._claim()
+                if batch:
+                    await self._deliver(batch)
+                    continue  # more may be waiting
+                if self._smtp and asyncio.get_running_loop().time() - self._last_used > settings.SMTP_IDLE_TIMEOUT:
+                    await self._close()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("Outbox sender error:", e)
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=settings.OUTBOX_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self) -> List[dict]:
+        now = datetime.utcnow()
+        # Leases that ran out on the last allowed attempt: the sender died on this message
+        await self.collection.update_many(
+            {
+                "delivery_status": SENDING,
+                "locked_until": {"$lte": now},
+                "delivery_attempts": {"$gte": settings.OUTBOX_MAX_ATTEMPTS},
+            },
+            {
+                "$set": {"delivery_status": FAILED, "last_error": "Lease expired on the final attempt"},
+                "$unset": {"locked_until": "", "claim_token": ""},
+            },
+        )
+
+        batch = []
+        for _ in range(settings.OUTBOX_BATCH_SIZE):
+            submission = await self.collection.find_one_and_update(
+                {"$or": [
+                    {"delivery_status": PENDING, "next_attempt_at": {"$lte": now}},
+                    {"delivery_status": SENDING, "locked_until": {"$lte": now}},
+                ]},
+                {
+                    "$set": {
+                        "delivery_status": SENDING,
+                        "locked_until": now + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS),
+                        "claim_token": uuid.uuid4().hex,
+                    },
+                    "$inc": {"delivery_attempts": 1},
+                },
+                sort=[("next_attempt_at", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if not submission:
+                break
+            batch.append(submission)
+        return batch
+
+    async def _deliver(self, batch: List[dict]):
+        processed = 0
+        for submission in batch:
+            # Earlier sends may have used up the claim-time lease
+            if not await self._renew_lease(submission):
+                print(f"Outbox lease lost for {submission['_id']}, skipping")
+                continue
+            processed += 1
+            try:
+                await self._send(build_message(submission))
+            except Exception as e:
+                print("Failed to send email:", e)
+                await self._close()
+                await self._record_failure(submission, e)
+                continue
+            await self.collection.update_one(
+                self._owned(submission),
+                {
+                    "$set": {"delivery_status": SENT, "sent_at": datetime.utcnow()},
+                    "$unset": {"locked_until": "", "claim_token": "", "last_error": ""},
+                },
+            )
+        print(f"Outbox processed {processed} notifications")
+
+    async def _renew_lease(self, submission: dict) -> bool:
+        result = await self.collection.update_one(
+            self._owned(submission),
+            {"$set": {"locked_until": datetime.utcnow() + timedelta(seconds=settings.OUTBOX_LEASE_SECONDS)}},
+        )
+        return result.matched_count == 1
+
+    def _owned(self, submission: dict) -> dict:
+        """Filter matching the row only while this sender's claim is current."""
+        return {"_id": submission["_id"], "delivery_status": SENDING, "claim_token": submission["claim_token"]}
+
+    async def _record_failure(self, submission: dict, error: Exception):
+        # Already counted when the row was claimed
+        attempts = submission.get("delivery_attempts", 0)
+        update = {"delivery_attempts": attempts, "last_error": str(error)[:500]}
+        if attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+            update["delivery_status"] = FAILED
+        else:
+            delay = min(settings.OUTBOX_BACKOFF_MAX, settings.OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+            update["delivery_status"] = PENDING
+            update["next_attempt_at"] = datetime.utcnow() + timedelta(seconds=delay * random.uniform(0.5, 1.0))
+        await self.collection.update_one(
+            self._owned(submission),
+            {"$set": update, "$unset": {"locked_until": "", "claim_token": ""}},
+        )
+
+    async def _send(self, message: EmailMessage):
+        # A reused connection may have been dropped by the server; reconnect once
+        for attempt in range(2):
+            smtp = await self._connection()
+            try:
+                await smtp.send_message(message)
+                self._last_used = asyncio.get_running_loop().time()
+                return
+            except aiosmtplib.SMTPServerDisconnected:
+                self._smtp = None
+                if attempt:
+                    raise
+
+    async def _connection(self) -> aiosmtplib.SMTP:
+        if self._smtp and self._smtp.is_connected:
+            return self._smtp
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.SMTP_HOST,
+            port=settings.SMTP_PORT,
+            start_tls=True,
+            username=settings.SMTP_USER,
+            password=settings.SMTP_PASSWORD,
+            timeout=settings.SMTP_TIMEOUT,
+        )
+        await smtp.connect()  # STARTTLS and login happen here
+        self._smtp = smtp
+        return smtp
+
+    async def _close(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp and smtp.is_connected:
+            try:
+                await smtp.quit()
+            except Exception:
+                smtp.close()
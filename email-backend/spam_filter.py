@@ -0,0 +1,145 @@
+import re
+import time
+import uuid
+import hashlib
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, Optional, Tuple
+
+from config import settings
+
+# Sliding-window log: drop entries older than the window, then admit if under the limit.
+# Returns {allowed (0/1), seconds until the oldest entry leaves the window}.
+SLIDING_WINDOW_SCRIPT = """
+local now = tonumber(ARGV[1])
+local window = tonumber(ARGV[2])
+local limit = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - window)
+if redis.call('ZCARD', KEYS[1]) >= limit then
+    local oldest = redis.call('ZRANGE', KEYS[1], 0, 0, 'WITHSCORES')
+    return {0, tostring(tonumber(oldest[2]) + window - now)}
+end
+redis.call('ZADD', KEYS[1], now, ARGV[4])
+redis.call('EXPIRE', KEYS[1], math.ceil(window))
+return {1, '0'}
+"""
+
+
+@dataclass
+class FilterDecision:
+    allowed: bool
+    reason: Optional[str] = None  # "duplicate" or "rate_limited"
+    retry_after: int = 0
+    dedup_key: Optional[str] = None
+
+
+class MemoryStore:
+    """In-process fallback with the same semantics (per worker only)."""
+
+    def __init__(self):
+        self._windows: Dict[str, Deque[float]] = {}
+        self._claims: Dict[str, float] = {}
+
+    def hit(self, key: str, limit: int, window: float) -> Tuple[bool, float]:
+        now = time.time()
+        entries = self._windows.setdefault(key, deque())
+        while entries and entries[0] <= now - window:
+            entries.popleft()
+        if len(entries) >= limit:
+            return False, entries[0] + window - now
+        entries.append(now)
+        return True, 0.0
+
+    def claim(self, key: str, ttl: float) -> bool:
+        now = time.time()
+        if self._claims.get(key, 0) > now:
+            return False
+        self._claims[key] = now + ttl
+        return True
+
+    def release(self, key: str):
+        self._claims.pop(key, None)
+
+    def prune(self):
+        now = time.time()
+        self._claims = {key: expiry for key, expiry in self._claims.items() if expiry > now}
+        self._windows = {key: entries for key, entries in self._windows.items() if entries and entries[-1] > now - 86400}
+
+
+class SubmissionFilter:
+    """
+    Front-door abuse filter for /api/contact, applied before any Mongo or SMTP work.
+
+    - Sliding-window rate limits per client IP and per email address
+    - Duplicate rejection: the same (normalized) name, email and message
+      within CONTACT_DEDUP_WINDOW is refused
+
+    State lives in Redis (REDIS_URL) so every worker shares it. Without
+    REDIS_URL, or while Redis is unreachable, an in-process store is used.
+    """
+
+    def __init__(self):
+        self.memory = MemoryStore()
+        self._checks = 0
+        self.redis = None
+        if settings.REDIS_URL:
+            try:
+                import redis.asyncio as redis
+            except ImportError:
+                print("redis is required for the shared spam filter. Install it with: pip install redis")
+            else:
+                self.redis = redis.from_url(settings.REDIS_URL, decode_responses=True)
+                self._sliding_window = self.redis.register_script(SLIDING_WINDOW_SCRIPT)
+
+    async def check(self, client_ip: Optional[str], email: str, content: str) -> FilterDecision:
+        self._checks += 1
+        if self._checks % 1000 == 0:
+            self.memory.prune()
+
+        limits = [(f"contact:rate:email:{email.lower()}", settings.CONTACT_EMAIL_LIMIT, settings.CONTACT_EMAIL_WINDOW)]
+        if client_ip:
+            limits.insert(0, (f"contact:rate:ip:{client_ip}", settings.CONTACT_IP_LIMIT, settings.CONTACT_IP_WINDOW))
+        for key, limit, window in limits:
+            allowed, retry_after = await self._hit(key, limit, window)
+            if not allowed:
+                return FilterDecision(False, "rate_limited", max(1, int(retry_after + 0.999)))
+
+        # Claimed last, so a rate-limited attempt doesn't block a later identical one
+        dedup_key = f"contact:dedup:{self.content_hash(email, content)}"
+        if not await self._claim(dedup_key, settings.CONTACT_DEDUP_WINDOW):
+            return FilterDecision(False, "duplicate")
+        return FilterDecision(True, dedup_key=dedup_key)
+
+    async def release(self, decision: FilterDecision):
+        """Forget a submission's content hash (its write failed, so a retry isn't a duplicate)."""
+        if not decision.dedup_key:
+            return
+        self.memory.release(decision.dedup_key)
+        if self.redis:
+            try:
+                await self.redis.delete(decision.dedup_key)
+            except Exception as e:
+                print("Spam filter Redis error:", e)
+
+    def content_hash(self, email: str, content: str) -> str:
+        normalized = re.sub(r"\s+", " ", f"{email}\n{content}").strip().lower()
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    async def _hit(self, key: str, limit: int, window: float) -> Tuple[bool, float]:
+        if self.redis:
+            try:
+                allowed, retry_after = await self._sliding_window(
+                    keys=[key], args=[time.time(), window, limit, uuid.uuid4().hex]
+                )
+                return bool(int(allowed)), float(retry_after)
+            except Exception as e:
+                print("Spam filter Redis error, using in-memory state:", e)
+        return self.memory.hit(key, limit, window)
+
+    async def _claim(self, key: str, ttl: int) -> bool:
+        if self.redis:
+            try:
+                return bool(await self.redis.set(key, "1", nx=True, ex=ttl))
+            except Exception as e:
+                print("Spam filter Redis error, using in-memory state:", e)
+        return self.memory.claim(key, ttl)
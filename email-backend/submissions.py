@@ -0,0 +1,188 @@
+import io
+import csv
+import json
+import base64
+import asyncio
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from config import settings
+
+EXPORT_FIELDS = ["id", "created_at", "first_name", "last_name", "email", "project_details", "delivery_status"]
+
+
+def encode_cursor(submission: dict) -> str:
+    raw = json.dumps([submission["created_at"].isoformat(), str(submission["_id"])])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        created_at, submission_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), ObjectId(submission_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+
+
+def serialize(submission: dict) -> dict:
+    return {
+        "id": str(submission["_id"]),
+        "created_at": submission["created_at"].isoformat(),
+        "first_name": submission.get("first_name"),
+        "last_name": submission.get("last_name"),
+        "email": submission.get("email"),
+        "project_details": submission.get("project_details"),
+        "delivery_status": submission.get("delivery_status"),
+    }
+
+
+class SubmissionStore:
+    """
+    Buffered writes and indexed reads for contact_form_db.submissions.
+
+    add() queues a submission and waits until it is written; a flusher
+    writes the queue with one insert_many once SUBMISSIONS_FLUSH_SIZE
+    submissions are waiting or SUBMISSIONS_FLUSH_INTERVAL has passed since
+    the first one, so a burst costs a few bulk writes instead of one write
+    per form.
+
+    Listing and export read newest first on the (created_at, _id) index
+    with keyset cursors, so deep pages stay as cheap as the first one and
+    export streams rows without loading the result set.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._queue: List[Tuple[dict, asyncio.Future]] = []
+        self._queued = asyncio.Event()
+        self._full = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self):
+        await self.collection.create_index([("created_at", -1), ("_id", -1)])
+        await self.collection.create_index([("email", 1), ("created_at", -1)])
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Cancelling mid insert_many would drop that batch, so the flusher is
+        # woken up and exits after finishing the flush it is in
+        self._stopping = True
+        self._queued.set()
+        self._full.set()
+        if self._task:
+            await self._task
+        # Don't drop submissions still waiting in the buffer
+        while self._queue:
+            await self._flush()
+
+    async def add(self, submission: dict):
+        """Queue a submission; returns once it has been written (raises if the write failed)."""
+        future = asyncio.get_running_loop().create_future()
+        self._queue.append((submission, future))
+        self._queued.set()
+        if len(self._queue) >= settings.SUBMISSIONS_FLUSH_SIZE:
+            self._full.set()
+        await future
+
+    async def list(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        email: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> dict:
+        items = []
+        last = None
+        async for submission in self._find(cursor, email, since, until).limit(limit + 1):
+            if len(items) == limit:
+                # There is at least one more row: the last returned one is the cursor
+                return {"items": items, "next_cursor": encode_cursor(last)}
+            items.append(serialize(submission))
+            last = submission
+        return {"items": items, "next_cursor": None}
+
+    async def export(
+        self,
+        format: str = "ndjson",
+        email: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> AsyncIterator[str]:
+        """Yield every matching submission as NDJSON lines or CSV rows."""
+        cursor = self._find(None, email, since, until).batch_size(settings.SUBMISSIONS_EXPORT_BATCH_SIZE)
+        if format == "csv":
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+            writer.writeheader()
+            async for submission in cursor:
+                writer.writerow(serialize(submission))
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        else:
+            async for submission in cursor:
+                yield json.dumps(serialize(submission)) + "\n"
+
+    def _find(self, cursor, email, since, until):
+        query = {}
+        if email:
+            query["email"] = email
+        if since or until:
+            query["created_at"] = {}
+            if since:
+                query["created_at"]["$gte"] = since
+            if until:
+                query["created_at"]["$lt"] = until
+        if cursor:
+            created_at, submission_id = decode_cursor(cursor)
+            after_cursor = {"$or": [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": submission_id}},
+            ]}
+            query = {"$and": [query, after_cursor]} if query else after_cursor
+        return self.collection.find(query).sort([("created_at", -1), ("_id", -1)])
+
+    async def _run(self):
+        while not self._stopping:
+            await self._queued.wait()
+            # Give a burst a moment to fill the batch
+            try:
+                await asyncio.wait_for(self._full.wait(), timeout=settings.SUBMISSIONS_FLUSH_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self._flush()
+            except Exception as e:
+                print("Submission flush error:", e)
+
+    async def _flush(self):
+        batch = self._queue[:settings.SUBMISSIONS_FLUSH_SIZE]
+        del self._queue[:len(batch)]
+        if len(self._queue) < settings.SUBMISSIONS_FLUSH_SIZE:
+            self._full.clear()
+        if not self._queue:
+            self._queued.clear()
+        if not batch:
+            return
+
+        failed = {}
+        try:
+            await self.collection.insert_many([submission for submission, _ in batch], ordered=False)
+        except BulkWriteError as e:
+            failed = {error["index"]: e for error in e.details.get("writeErrors", [])}
+        except Exception as e:
+            failed = {index: e for index in range(len(batch))}
+
+        for index, (_, future) in enumerate(batch):
+            if future.done():
+                continue
+            if index in failed:
+                future.set_exception(failed[index])
+            else:
+                future.set_result(None)
+        print(f"Flushed {len(batch)} submissions ({len(failed)} failed)")
@@ -0,0 +1,12 @@
+import os
+import sys
+
+# config.Settings() reads these at import time; the tests never connect to them
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("SMTP_HOST", "localhost")
+os.environ.setdefault("SMTP_PORT", "587")
+os.environ.setdefault("SMTP_USER", "forms@example.com")
+os.environ.setdefault("SMTP_PASSWORD", "password")
+os.environ.setdefault("TO_EMAIL", "team@example.com")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
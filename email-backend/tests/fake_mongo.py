@@ -0,0 +1,128 @@
+import copy
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+MISSING = object()
+
+
+def matches(document: dict, query: dict) -> bool:
+    """The subset of the Mongo query language used by the outbox and submission store."""
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(document, clause) for clause in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(document, clause) for clause in condition):
+                return False
+        elif not matches_value(document.get(key, MISSING), condition):
+            return False
+    return True
+
+
+def matches_value(value, condition) -> bool:
+    if not isinstance(condition, dict):
+        return value == condition
+    for operator, operand in condition.items():
+        if operator == "$exists":
+            if (value is not MISSING) != operand:
+                return False
+        elif value is MISSING:
+            return False
+        elif operator == "$lt" and not value < operand:
+            return False
+        elif operator == "$lte" and not value <= operand:
+            return False
+        elif operator == "$gte" and not value >= operand:
+            return False
+    return True
+
+
+def sort_key(sort):
+    class Key:
+        def __init__(self, document):
+            self.document = document
+
+        def __lt__(self, other):
+            for field, direction in sort:
+                a, b = self.document.get(field), other.document.get(field)
+                if a != b:
+                    return (a < b) if direction == 1 else (a > b)
+            return False
+
+    return Key
+
+
+class FakeCursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, sort):
+        self.documents = sorted(self.documents, key=sort_key(sort))
+        return self
+
+    def limit(self, count):
+        self.documents = self.documents[:count]
+        return self
+
+    def batch_size(self, size):
+        return self
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for document in self.documents:
+            yield copy.deepcopy(document)
+
+
+class FakeCollection:
+    """In-memory stand-in for the few Motor collection methods the app calls."""
+
+    def __init__(self):
+        self.documents = []
+        self.insert_calls = 0
+
+    async def create_index(self, keys):
+        pass
+
+    async def insert_many(self, documents, ordered=True):
+        self.insert_calls += 1
+        for document in documents:
+            document.setdefault("_id", ObjectId())
+            self.documents.append(copy.deepcopy(document))
+
+    def find(self, query):
+        return FakeCursor([document for document in self.documents if matches(document, query)])
+
+    async def find_one_and_update(self, query, update, sort=None, return_document=ReturnDocument.BEFORE):
+        candidates = [document for document in self.documents if matches(document, query)]
+        if sort:
+            candidates.sort(key=sort_key(sort))
+        if not candidates:
+            return None
+        before = copy.deepcopy(candidates[0])
+        apply_update(candidates[0], update)
+        return copy.deepcopy(candidates[0]) if return_document == ReturnDocument.AFTER else before
+
+    async def update_one(self, query, update):
+        for document in self.documents:
+            if matches(document, query):
+                apply_update(document, update)
+                return SimpleNamespace(matched_count=1)
+        return SimpleNamespace(matched_count=0)
+
+    async def update_many(self, query, update):
+        matched = [document for document in self.documents if matches(document, query)]
+        for document in matched:
+            apply_update(document, update)
+        return SimpleNamespace(matched_count=len(matched))
+
+
+def apply_update(document: dict, update: dict):
+    document.update(update.get("$set", {}))
+    for field in update.get("$unset", {}):
+        document.pop(field, None)
+    for field, amount in update.get("$inc", {}).items():
+        document[field] = document.get(field, 0) + amount
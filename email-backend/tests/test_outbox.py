@@ -0,0 +1,135 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from config import settings
+from fake_mongo import FakeCollection
+from outbox import FAILED, PENDING, SENDING, SENT, EmailOutbox
+
+
+def make_outbox(collection, sent=None, error=None):
+    outbox = EmailOutbox(collection)
+
+    async def send(message):
+        if error:
+            raise error
+        sent.append(message["Subject"])
+
+    outbox._send = send
+    return outbox
+
+
+def queued(collection):
+    outbox = EmailOutbox(collection)
+    submission = {"first_name": "Ada", "last_name": "Lovelace", "email": "ada@example.com", "project_details": "Engines"}
+    submission.update(outbox.pending_fields())
+    collection.documents.append({"_id": 1, **submission})
+    return collection.documents[0]
+
+
+def expire_lease(row):
+    row["locked_until"] = datetime.utcnow() - timedelta(seconds=1)
+
+
+def test_delivery_marks_the_row_sent_and_releases_the_lease():
+    collection = FakeCollection()
+    row = queued(collection)
+    sent = []
+    outbox = make_outbox(collection, sent)
+
+    async def scenario():
+        await outbox._deliver(await outbox._claim())
+
+    asyncio.run(scenario())
+
+    assert sent == ["New Contact Form Submission from Ada Lovelace"]
+    assert row["delivery_status"] == SENT
+    assert row["delivery_attempts"] == 1
+    assert "claim_token" not in row and "locked_until" not in row
+
+
+def test_sender_that_lost_its_lease_neither_sends_nor_overwrites_the_row():
+    collection = FakeCollection()
+    row = queued(collection)
+    stale_sent, sent = [], []
+    stale = make_outbox(collection, stale_sent)
+    current = make_outbox(collection, sent)
+
+    async def scenario():
+        stale_batch = await stale._claim()
+        expire_lease(row)
+        current_batch = await current._claim()
+        await stale._deliver(stale_batch)
+        assert row["delivery_status"] == SENDING
+        assert row["claim_token"] == current_batch[0]["claim_token"]
+        await current._deliver(current_batch)
+
+    asyncio.run(scenario())
+
+    assert stale_sent == []
+    assert sent == ["New Contact Form Submission from Ada Lovelace"]
+    assert row["delivery_status"] == SENT
+    assert row["delivery_attempts"] == 2
+
+
+def test_stale_failure_does_not_reset_a_newer_claim():
+    collection = FakeCollection()
+    row = queued(collection)
+    stale = make_outbox(collection)
+    current = make_outbox(collection)
+
+    async def scenario():
+        stale_batch = await stale._claim()
+        expire_lease(row)
+        current_batch = await current._claim()
+        await stale._record_failure(stale_batch[0], RuntimeError("timeout"))
+        return current_batch
+
+    current_batch = asyncio.run(scenario())
+
+    assert row["delivery_status"] == SENDING
+    assert row["claim_token"] == current_batch[0]["claim_token"]
+    assert "last_error" not in row
+
+
+def test_failed_send_backs_off_then_gives_up_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 2)
+    collection = FakeCollection()
+    row = queued(collection)
+    outbox = make_outbox(collection, error=RuntimeError("550 rejected"))
+
+    async def scenario():
+        await outbox._deliver(await outbox._claim())
+        assert row["delivery_status"] == PENDING
+        assert row["delivery_attempts"] == 1
+        assert row["next_attempt_at"] > datetime.utcnow()
+        assert await outbox._claim() == []
+
+        row["next_attempt_at"] = datetime.utcnow()
+        await outbox._deliver(await outbox._claim())
+
+    asyncio.run(scenario())
+
+    assert row["delivery_status"] == FAILED
+    assert row["delivery_attempts"] == 2
+    assert row["last_error"] == "550 rejected"
+
+
+def test_claims_count_attempts_so_a_crashing_message_ends_up_failed(monkeypatch):
+    monkeypatch.setattr(settings, "OUTBOX_MAX_ATTEMPTS", 2)
+    collection = FakeCollection()
+    row = queued(collection)
+    outbox = make_outbox(collection)
+
+    async def scenario():
+        # The sender dies after each claim, so the lease simply runs out
+        for attempt in (1, 2):
+            batch = await outbox._claim()
+            assert len(batch) == 1 and row["delivery_attempts"] == attempt
+            expire_lease(row)
+        assert await outbox._claim() == []
+
+    asyncio.run(scenario())
+
+    assert row["delivery_status"] == FAILED
+    assert row["delivery_attempts"] == 2
+    assert "claim_token" not in row
@@ -0,0 +1,97 @@
+import asyncio
+
+import spam_filter
+from config import settings
+from spam_filter import MemoryStore, SubmissionFilter
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+def use_clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(spam_filter.time, "time", clock.time)
+    return clock
+
+
+def test_sliding_window_admits_again_as_old_hits_leave_it(monkeypatch):
+    clock = use_clock(monkeypatch)
+    store = MemoryStore()
+
+    assert store.hit("ip", limit=2, window=60) == (True, 0.0)
+    clock.now += 30
+    assert store.hit("ip", limit=2, window=60) == (True, 0.0)
+    clock.now += 10
+    # The first hit leaves the window 20s from now
+    assert store.hit("ip", limit=2, window=60) == (False, 20.0)
+    clock.now += 20
+    assert store.hit("ip", limit=2, window=60) == (True, 0.0)
+    assert store.hit("ip", limit=2, window=60)[0] is False
+
+
+def test_rate_limit_is_per_ip_and_reports_retry_after(monkeypatch):
+    use_clock(monkeypatch)
+    monkeypatch.setattr(settings, "REDIS_URL", None)
+    monkeypatch.setattr(settings, "CONTACT_IP_LIMIT", 2)
+    monkeypatch.setattr(settings, "CONTACT_IP_WINDOW", 600)
+    monkeypatch.setattr(settings, "CONTACT_EMAIL_LIMIT", 100)
+    spam = SubmissionFilter()
+
+    async def scenario():
+        decisions = [await spam.check("10.0.0.1", f"lead{index}@example.com", f"message {index}") for index in range(3)]
+        other_ip = await spam.check("10.0.0.2", "lead9@example.com", "message 9")
+        return decisions, other_ip
+
+    decisions, other_ip = asyncio.run(scenario())
+
+    assert [decision.allowed for decision in decisions] == [True, True, False]
+    assert decisions[2].reason == "rate_limited"
+    assert decisions[2].retry_after == 600
+    assert other_ip.allowed
+
+
+def test_duplicate_is_refused_until_released(monkeypatch):
+    use_clock(monkeypatch)
+    monkeypatch.setattr(settings, "REDIS_URL", None)
+    monkeypatch.setattr(settings, "CONTACT_IP_LIMIT", 100)
+    monkeypatch.setattr(settings, "CONTACT_EMAIL_LIMIT", 100)
+    spam = SubmissionFilter()
+
+    async def scenario():
+        first = await spam.check("10.0.0.1", "Ada@example.com", "Need a   website")
+        # Case and whitespace don't make a message new
+        repeat = await spam.check("10.0.0.1", "ada@example.com", "need a website")
+        # The write failed, so the retry must go through
+        await spam.release(first)
+        retry = await spam.check("10.0.0.1", "ada@example.com", "need a website")
+        return first, repeat, retry
+
+    first, repeat, retry = asyncio.run(scenario())
+
+    assert first.allowed
+    assert (repeat.allowed, repeat.reason) == (False, "duplicate")
+    assert retry.allowed and retry.dedup_key == first.dedup_key
+
+
+def test_rate_limited_attempt_does_not_claim_the_content(monkeypatch):
+    use_clock(monkeypatch)
+    monkeypatch.setattr(settings, "REDIS_URL", None)
+    monkeypatch.setattr(settings, "CONTACT_IP_LIMIT", 1)
+    monkeypatch.setattr(settings, "CONTACT_EMAIL_LIMIT", 100)
+    spam = SubmissionFilter()
+
+    async def scenario():
+        await spam.check("10.0.0.1", "ada@example.com", "first message")
+        limited = await spam.check("10.0.0.1", "grace@example.com", "second message")
+        elsewhere = await spam.check("10.0.0.2", "grace@example.com", "second message")
+        return limited, elsewhere
+
+    limited, elsewhere = asyncio.run(scenario())
+
+    assert limited.reason == "rate_limited"
+    assert elsewhere.allowed
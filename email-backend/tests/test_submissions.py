@@ -0,0 +1,116 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from config import settings
+from fake_mongo import FakeCollection
+from submissions import SubmissionStore, decode_cursor
+
+
+def submission(index: int, created_at: datetime) -> dict:
+    return {"_id": ObjectId(), "email": f"lead{index}@example.com", "first_name": f"Lead {index}", "created_at": created_at}
+
+
+def test_pages_follow_keyset_cursors_through_equal_timestamps():
+    collection = FakeCollection()
+    start = datetime(2026, 1, 1)
+    # Pairs of rows share a created_at, so the _id tie-break decides the order
+    collection.documents = [submission(index, start + timedelta(minutes=index // 2)) for index in range(7)]
+    store = SubmissionStore(collection)
+
+    async def scenario():
+        pages, cursor = [], None
+        while True:
+            page = await store.list(limit=3, cursor=cursor)
+            pages.append([item["first_name"] for item in page["items"]])
+            cursor = page["next_cursor"]
+            if not cursor:
+                return pages
+
+    pages = asyncio.run(scenario())
+
+    expected = sorted(collection.documents, key=lambda row: (row["created_at"], row["_id"]), reverse=True)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sum(pages, []) == [row["first_name"] for row in expected]
+
+
+def test_cursor_filters_compose_with_email():
+    collection = FakeCollection()
+    start = datetime(2026, 1, 1)
+    collection.documents = [submission(index % 2, start + timedelta(minutes=index)) for index in range(6)]
+    store = SubmissionStore(collection)
+
+    async def scenario():
+        first = await store.list(limit=2, email="lead1@example.com")
+        second = await store.list(limit=2, cursor=first["next_cursor"], email="lead1@example.com")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+
+    created = [item["created_at"] for item in first["items"] + second["items"]]
+    assert created == [(start + timedelta(minutes=minute)).isoformat() for minute in (5, 3, 1)]
+    assert second["next_cursor"] is None
+
+
+def test_invalid_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_burst_is_written_with_one_insert(monkeypatch):
+    monkeypatch.setattr(settings, "SUBMISSIONS_FLUSH_SIZE", 5)
+    monkeypatch.setattr(settings, "SUBMISSIONS_FLUSH_INTERVAL", 60)
+    collection = FakeCollection()
+    store = SubmissionStore(collection)
+
+    async def scenario():
+        await store.start()
+        await asyncio.wait_for(
+            asyncio.gather(*(store.add({"email": f"lead{index}@example.com"}) for index in range(5))),
+            timeout=5,
+        )
+        await store.stop()
+
+    asyncio.run(scenario())
+
+    assert collection.insert_calls == 1
+    assert len(collection.documents) == 5
+
+
+def test_stop_lets_the_in_flight_flush_finish_and_drains_the_queue(monkeypatch):
+    monkeypatch.setattr(settings, "SUBMISSIONS_FLUSH_SIZE", 2)
+    monkeypatch.setattr(settings, "SUBMISSIONS_FLUSH_INTERVAL", 0)
+    collection = FakeCollection()
+    store = SubmissionStore(collection)
+
+    async def scenario():
+        started, proceed = asyncio.Event(), asyncio.Event()
+        insert_many = collection.insert_many
+
+        async def slow_insert_many(documents, ordered=True):
+            started.set()
+            await proceed.wait()
+            await insert_many(documents, ordered=ordered)
+
+        collection.insert_many = slow_insert_many
+        await store.start()
+        first = [asyncio.create_task(store.add({"email": f"lead{index}@example.com"})) for index in range(2)]
+        await started.wait()
+        # Arrives while the first batch is being written
+        late = asyncio.create_task(store.add({"email": "late@example.com"}))
+        await asyncio.sleep(0)
+
+        stopping = asyncio.create_task(store.stop())
+        await asyncio.sleep(0.01)
+        assert not stopping.done()
+        proceed.set()
+        await asyncio.wait_for(stopping, timeout=5)
+        await asyncio.wait_for(asyncio.gather(*first, late), timeout=5)
+
+    asyncio.run(scenario())
+
+    assert sorted(row["email"] for row in collection.documents) == [
+        "late@example.com", "lead0@example.com", "lead1@example.com",
+    ]
@@ -21,11 +21,29 @@ const ChatBotIcon3D = dynamic(
 	}
 );
 
+const API_URL = process.env.NEXT_PUBLIC_CHATBOT_API_URL || "http://localhost:8000";
+// Speculative retrieval while typing: wait for a pause, and only for queries long enough to search
+const PREFETCH_DEBOUNCE_MS = 400;
+const PREFETCH_MIN_CHARS = 12;
+// Chat streams over a WebSocket session while the window is open (HTTP is the fallback)
+const WS_URL = API_URL.replace(/^http/, "ws");
+const CONNECTION_ERROR_MESSAGE =
+	"I apologize, but I'm having trouble connecting to the server right now. Please try again later.";
+
 interface Message {
+	id?: string;
 	role: "user" | "assistant";
 	content: string;
 }
 
+interface SocketFrame {
+	type: "ready" | "token" | "done" | "cancelled" | "error" | "notification" | "pong";
+	message_id?: string | null;
+	delta?: string;
+	message?: string;
+	error?: string;
+}
+
 export function ChatBot() {
 	const pathname = usePathname();
 	const [isOpen, setIsOpen] = useState(false);
@@ -46,6 +64,8 @@ export function ChatBot() {
 	const messagesEndRef = useRef<HTMLDivElement>(null);
 	const bubbleTimerRef = useRef<NodeJS.Timeout | null>(null);
 	const bubbleIntervalRef = useRef<NodeJS.Timeout | null>(null);
+	const lastPrefetchRef = useRef<string>("");
+	const socketRef = useRef<WebSocket | null>(null);
 
 	// Scroll detection
 	useEffect(() => {
@@ -116,6 +136,101 @@ export function ChatBot() {
 		}
 	}, [messages, isOpen]);
 
+	/* ─── WebSocket session while the chat window is open ───── */
+	useEffect(() => {
+		if (!isOpen || !conversationId || typeof WebSocket === "undefined") return;
+
+		const socket = new WebSocket(
+			`${WS_URL}/ws/chat/${encodeURIComponent(conversationId)}`
+		);
+		socketRef.current = socket;
+
+		const updateMessage = (id: string, update: (content: string) => string) => {
+			setMessages((prev) =>
+				prev.map((msg) =>
+					msg.id === id ? { ...msg, content: update(msg.content) } : msg
+				)
+			);
+		};
+
+		socket.onmessage = (event) => {
+			let frame: SocketFrame;
+			try {
+				frame = JSON.parse(event.data);
+			} catch {
+				return;
+			}
+			const id = frame.message_id;
+			switch (frame.type) {
+				case "token":
+					if (!id) break;
+					setIsLoading(false);
+					updateMessage(id, (content) => content + (frame.delta ?? ""));
+					break;
+				case "done":
+					// The final text replaces whatever was streamed
+					if (id) updateMessage(id, () => frame.message ?? "");
+					setIsLoading(false);
+					break;
+				case "cancelled":
+					// Superseded by a newer message: keep any partial answer, drop empty ones
+					if (id) setMessages((prev) => prev.filter((msg) => msg.id !== id || msg.content));
+					break;
+				case "error":
+					if (id) updateMessage(id, () => CONNECTION_ERROR_MESSAGE);
+					setIsLoading(false);
+					break;
+			}
+		};
+
+		socket.onclose = () => {
+			if (socketRef.current !== socket) return;
+			socketRef.current = null;
+			// Answers still waiting on this socket will never arrive
+			setMessages((prev) =>
+				prev.map((msg) =>
+					msg.id && !msg.content ? { ...msg, content: CONNECTION_ERROR_MESSAGE } : msg
+				)
+			);
+			setIsLoading(false);
+		};
+
+		return () => {
+			socketRef.current = null;
+			socket.close();
+		};
+	}, [isOpen, conversationId]);
+
+	/* ─── Prefetch retrieval for the partial query while typing ─ */
+	useEffect(() => {
+		const partialMessage = inputValue.trim();
+		if (
+			!conversationId ||
+			isLoading ||
+			partialMessage.length < PREFETCH_MIN_CHARS ||
+			partialMessage === lastPrefetchRef.current
+		) {
+			return;
+		}
+
+		const timer = setTimeout(() => {
+			lastPrefetchRef.current = partialMessage;
+			// Best effort: the answer is still correct if this never arrives
+			fetch(`${API_URL}/chat/prefetch`, {
+				method: "POST",
+				headers: {
+					"Content-Type": "application/json",
+				},
+				body: JSON.stringify({
+					conversation_id: conversationId,
+					partial_message: partialMessage,
+				}),
+			}).catch(() => {});
+		}, PREFETCH_DEBOUNCE_MS);
+
+		return () => clearTimeout(timer);
+	}, [inputValue, conversationId, isLoading]);
+
 	const handleSendMessage = async () => {
 		if (!inputValue.trim() || isLoading) return;
 
@@ -126,10 +241,26 @@ export function ChatBot() {
 		setMessages((prev) => [...prev, { role: "user", content: userMessage }]);
 		setIsLoading(true);
 
+		const socket = socketRef.current;
+		if (socket?.readyState === WebSocket.OPEN) {
+			// Streamed over the open session; sending again cancels an unfinished answer
+			const messageId = crypto.randomUUID();
+			setMessages((prev) => [
+				...prev,
+				{ id: messageId, role: "assistant", content: "" },
+			]);
+			socket.send(
+				JSON.stringify({
+					type: "message",
+					message_id: messageId,
+					message: userMessage,
+				})
+			);
+			return;
+		}
+
 		try {
-			const apiUrl =
-				process.env.NEXT_PUBLIC_CHATBOT_API_URL || "http://localhost:8000";
-			const response = await fetch(`${apiUrl}/chat`, {
+			const response = await fetch(`${API_URL}/chat`, {
 				method: "POST",
 				headers: {
 					"Content-Type": "application/json",
@@ -155,11 +286,7 @@ export function ChatBot() {
 			console.error("Error sending message:", error);
 			setMessages((prev) => [
 				...prev,
-				{
-					role: "assistant",
-					content:
-						"I apologize, but I'm having trouble connecting to the server right now. Please try again later.",
-				},
+				{ role: "assistant", content: CONNECTION_ERROR_MESSAGE },
 			]);
 		} finally {
 			setIsLoading(false);
@@ -197,7 +324,7 @@ export function ChatBot() {
 								Today
 							</div>
 
-							{messages.map((msg, index) => (
+							{messages.filter((msg) => msg.content).map((msg, index) => (
 								<div
 									key={index}
 									className={cn(